@@ -0,0 +1,40 @@
+import argparse
+
+from .startup import startup
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m bot", description="Telegram Stars bot")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="число процессов-обработчиков (1 — всё в одном процессе); по умолчанию WORKERS из .env",
+    )
+    parser.add_argument(
+        "--startup-profile", action="store_true",
+        help="напечатать время фаз старта и время до первого апдейта (однопроцессный режим)",
+    )
+    args = parser.parse_args()
+    startup.enabled = args.startup_profile
+
+    # Настройки, aiogram и модели импортируются только после разбора аргументов:
+    # `--help` отвечает сразу, а профиль видит каждую фазу отдельно.
+    with startup.phase("settings (.env)"):
+        from .config import get_settings
+        settings = get_settings()
+    workers = args.workers if args.workers is not None else settings.WORKERS
+
+    if workers <= 1:
+        with startup.phase("import aiogram"):
+            import aiogram.types  # noqa: F401 — самая тяжёлая часть: pydantic-модели всех типов Bot API
+        with startup.phase("import sqlalchemy + models"):
+            from . import models  # noqa: F401
+        with startup.phase("import handlers + services"):
+            from .main import main as run_single
+        run_single()
+    else:
+        from .supervisor import run_supervisor
+        run_supervisor(workers)
+
+
+if __name__ == "__main__":
+    main()
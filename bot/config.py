@@ -12,6 +12,27 @@ class Settings(BaseSettings):
 
     # ----- Телеграм -----
     BOT_TOKEN: str = Field(..., description="Токен бота от BotFather")
+    # Свой сервер Bot API (telegram-bot-api или заглушка нагрузочного теста); пусто — api.telegram.org
+    TELEGRAM_API_URL: Optional[str] = None
+
+    # Приём апдейтов: long polling или встроенный вебхук-сервер
+    BOT_MODE: Literal["polling", "webhook"] = "polling"
+    WEBHOOK_BASE_URL: Optional[str] = None   # публичный https://host, куда Telegram шлёт апдейты
+    WEBHOOK_PATH: str = "/tg/webhook"
+    WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    # Параллельная обработка апдейтов (порядок внутри одного чата сохраняется)
+    UPDATE_WORKERS: int = 16
+    UPDATE_QUEUE_SIZE: int = 10_000
+    # Исходящие сообщения: общий лимит бота и лимит на чат (сообщений в секунду, запас на всплеск)
+    SEND_GLOBAL_RATE: float = 30.0
+    SEND_CHAT_RATE: float = 1.0
+    SEND_CHAT_BURST: float = 3.0
+    # Несколько процессов (python -m bot --workers N): апдейты шардируются по chat_id,
+    # фоновые задачи держит процесс-лидер, пока продлевает аренду
+    WORKERS: int = 1
+    LEADER_LEASE_TTL_SEC: int = 15
 
     # ----- TON -----
     TON_WALLET_ADDRESS: str = Field(..., description="Адрес кошелька для получения TON")
@@ -19,34 +40,109 @@ class Settings(BaseSettings):
     TON_API_KEY: Optional[str] = None
     # Опционально: если нужен кастомный base url к API
     TON_API_BASE_URL: Optional[str] = None
+    # Клиент TON API: лимит запросов по тарифу ключа (пусто — по умолчанию для тарифа),
+    # запасной провайдер (второй из toncenter/tonapi), предохранитель и хеджирование
+    TON_API_RPS: Optional[float] = None
+    TON_API_FAILOVER: bool = True
+    TON_API_FALLBACK_KEY: Optional[str] = None
+    TON_API_FALLBACK_RPS: Optional[float] = None
+    TON_API_TIMEOUT_SEC: float = 10.0
+    TON_API_MAX_CONNECTIONS: int = 20
+    TON_API_KEEPALIVE_SEC: float = 30.0
+    TON_API_BREAKER_FAILURES: int = 5
+    TON_API_BREAKER_RESET_SEC: float = 30.0
+    TON_API_HEDGE: bool = False
+    TON_API_HEDGE_MIN_MS: int = 200
 
     # ----- Источник цены Fragment -----
     # mock  — использовать PRICE_MOCK_TON_PER_STAR
-    # auto  — (зарезервировано под авто-получение)
+    # auto  — FRAGMENT_PRICE_HTTP_URL, если задан, иначе напрямую с fragment.com
     # http  — забирать цену из FRAGMENT_PRICE_HTTP_URL
     FRAGMENT_PRICE_MODE: Literal["mock", "auto", "http"] = "mock"
     # Сделаем строкой и допускаем пустое значение — чтобы не падало,
     # когда режим не "http". При режиме http проверим ниже.
     FRAGMENT_PRICE_HTTP_URL: Optional[str] = None
     FRAGMENT_PRICE_HTTP_AUTH_HEADER: Optional[str] = None
+    FRAGMENT_BASE_URL: str = "https://fragment.com"
     PRICE_MOCK_TON_PER_STAR: float = 0.006451
+    # Кеш цены: свежая — PRICE_CACHE_TTL_SEC, дальше отдаём старую и обновляем в фоне;
+    # старше PRICE_MAX_STALE_SEC (источник долго недоступен) — откат на mock-цену.
+    PRICE_CACHE_TTL_SEC: int = 60
+    PRICE_MAX_STALE_SEC: int = 3600
 
     # ----- Параметры заказа/оплаты -----
     DEFAULT_LANG: Literal["ru", "en"] = "ru"
+    # Внутренняя наценка в базисных пунктах (500 = 5%)
+    FEE_BPS: int = 500
     ORDER_TTL_SEC: int = 600
     PAYMENT_POLL_INTERVAL_SEC: int = 5
     PAYMENT_TIMEOUT_SEC: int = 900
+    # «Проверить оплату»: кеш результата и минимальный интервал между нажатиями одного пользователя
+    CHECK_CACHE_TTL_SEC: float = 3.0
+    CHECK_THROTTLE_SEC: float = 2.0
+    # Как часто проверять сроки заказов (EXPIRED / TIMEOUT)
+    EXPIRY_TICK_SEC: float = 1.0
+    # poll   — опрашивать провайдера раз в PAYMENT_POLL_INTERVAL_SEC
+    # stream — подписка на события кошелька (SSE) с догрузкой пропусков по lt
+    PAYMENT_WATCH_MODE: Literal["poll", "stream"] = "poll"
+    PAYMENT_STREAM_RECONNECT_MAX_SEC: int = 30
 
     # Как открывать оплату: встроенный @wallet, системный TON-кошелёк или авто
     WALLET_LINK_MODE: Literal["telegram", "ton", "auto"] = "telegram"
 
     # ----- База данных -----
     DATABASE_URL: str = "sqlite+aiosqlite:///./stars.db"
-
-    # ----- Playwright / Fragment auth (на будущее) -----
+    # Профиль движка: auto — по схеме DATABASE_URL (sqlite+aiosqlite / postgresql+asyncpg)
+    DB_PROFILE: Literal["auto", "sqlite", "postgres", "default"] = "auto"
+    # SQLite: WAL + отдельный пул читателей
+    SQLITE_SYNCHRONOUS: Literal["OFF", "NORMAL", "FULL"] = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE_MB: int = 256
+    SQLITE_READERS: int = 4
+    # PostgreSQL (asyncpg): пул и кеши подготовленных выражений
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_RECYCLE_SEC: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
+
+    # Архив: завершённые заказы (GIFT_SENT/CANCELED/EXPIRED) старше N дней вместе с платежами
+    # переносятся в orders_archive/payments_archive пачками раз в ARCHIVE_INTERVAL_SEC
+    ARCHIVE_ENABLED: bool = True
+    ARCHIVE_AFTER_DAYS: float = 30
+    ARCHIVE_BATCH_SIZE: int = 500
+    ARCHIVE_INTERVAL_SEC: int = 3600
+
+    # Групповой коммит создания заказов и пользователей: раз в N мс или по M штук
+    WRITE_BEHIND_MAX_DELAY_MS: int = 5
+    WRITE_BEHIND_MAX_BATCH: int = 200
+
+    # ----- FSM (состояния диалога) -----
+    # db — таблицы fsm_states/fsm_data с LRU-кешем; memory — MemoryStorage aiogram
+    FSM_STORAGE: Literal["db", "memory"] = "db"
+    FSM_CACHE_SIZE: int = 10_000
+    FSM_FLUSH_INTERVAL_MS: int = 200
+
+    # ----- Playwright / Fragment auth -----
     FRAGMENT_AUTH_COOKIES_PATH: str = "fragment_cookies.json"
     PLAYWRIGHT_HEADLESS: bool = True
     PLAYWRIGHT_SLOWMO_MS: int = 0
+    # Доставка звёзд (PAID → GIFT_SENT) через пул тёплых контекстов браузера
+    FULFILLMENT_ENABLED: bool = False
+    FULFILLMENT_CONCURRENCY: int = 2            # контекстов браузера = одновременных покупок
+    FULFILLMENT_JOB_TIMEOUT_SEC: int = 120
+    FULFILLMENT_MAX_ATTEMPTS: int = 5
+    FULFILLMENT_RETRY_BASE_SEC: int = 30        # пауза перед повтором, удваивается
+    FULFILLMENT_CONTEXT_RECYCLE_JOBS: int = 50  # пересоздать контекст после N покупок
+
+    # ----- Метрики -----
+    # /metrics в формате Prometheus (воркеры python -m bot --workers N — на METRICS_PORT + номер)
+    METRICS_ENABLED: bool = False
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9108
+    # GET /debug/profile?seconds=N — сэмплирующий профайлер цикла событий
+    METRICS_PROFILER: bool = False
 
     # ----- Админ (опционально) -----
     ADMIN_USER_ID: Optional[int] = None
@@ -72,7 +168,51 @@ class Settings(BaseSettings):
             )
         return self
 
+    @model_validator(mode="after")
+    def _check_webhook(self):
+        """В режиме webhook нужен публичный URL и секрет для заголовка X-Telegram-Bot-Api-Secret-Token."""
+        if self.BOT_MODE == "webhook" and not (self.WEBHOOK_BASE_URL and self.WEBHOOK_SECRET):
+            raise ValueError(
+                "WEBHOOK_BASE_URL and WEBHOOK_SECRET must be set when BOT_MODE=webhook"
+            )
+        return self
+
+
+class _LazySettings:
+    """
+    Прокси к Settings: .env и окружение читаются при первом обращении к атрибуту, а не при
+    импорте модуля. Так `python -m bot --help` и модули, которые лишь импортируют settings,
+    ничего не парсят и не падают на незаданном BOT_TOKEN.
+    """
+
+    __slots__ = ("_value",)
+
+    def __init__(self) -> None:
+        object.__setattr__(self, "_value", None)
+
+    def _load(self) -> Settings:
+        value = object.__getattribute__(self, "_value")
+        if value is None:
+            value = Settings()
+            object.__setattr__(self, "_value", value)
+        return value
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._load(), name, value)
+
+    def __repr__(self) -> str:
+        loaded = object.__getattribute__(self, "_value") is not None
+        return f"<settings {'loaded' if loaded else 'not loaded'}>"
+
+
+def get_settings() -> Settings:
+    """Сами настройки (не прокси); первый вызов читает .env."""
+    return settings._load()
+
 
-# Единый экземпляр настроек
-settings = Settings()
+# Единый экземпляр настроек (создаётся лениво)
+settings: Settings = _LazySettings()  # type: ignore[assignment]
 
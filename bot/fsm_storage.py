@@ -0,0 +1,167 @@
+# bot/fsm_storage.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select
+
+from .config import settings
+from .models import FsmData, FsmState
+from .storage import read_session, session_scope, upsert
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+FLUSH_BATCH = 500
+
+
+def _key_str(key: StorageKey) -> str:
+    return ":".join((
+        str(key.bot_id),
+        str(key.chat_id),
+        str(key.user_id),
+        str(key.thread_id or ""),
+        key.business_connection_id or "",
+        key.destiny,
+    ))
+
+
+def _state_str(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class _Entry:
+    __slots__ = ("state", "data")
+
+    def __init__(self, state: Optional[str], data: dict[str, Any]) -> None:
+        self.state = state
+        self.data = data
+
+
+class DBStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в таблицах fsm_states / fsm_data (через SessionLocal) с LRU-кешем в памяти.
+
+    - чтения обслуживаются из LRU; в БД идём только на промахе;
+    - смена состояния пишется в БД сразу (write-through) — переживает рестарт;
+    - данные копятся в памяти и сбрасываются пачкой раз в flush_interval:
+      несколько правок одного ключа превращаются в одну запись.
+
+    При нескольких процессах апдейты чата шардируются в один процесс, так что кеш не расходится.
+    """
+
+    def __init__(self, *, cache_size: int = 10_000, flush_interval: float = 0.2) -> None:
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: dict[str, dict[str, Any]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    # ---------- cache ----------
+    def _remember(self, k: str, entry: _Entry) -> _Entry:
+        self._cache[k] = entry
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)  # грязные данные живут в _dirty до сброса
+        return entry
+
+    async def _entry(self, k: str) -> _Entry:
+        entry = self._cache.get(k)
+        if entry is not None:
+            self._cache.move_to_end(k)
+            return entry
+        async with read_session() as session:
+            state_row = await session.get(FsmState, k)
+            data_row = await session.get(FsmData, k)
+        data = self._dirty.get(k, _MISSING)
+        if data is _MISSING:
+            data = json.loads(data_row.data) if data_row is not None else {}
+        return self._remember(k, _Entry(state_row.state if state_row else None, dict(data)))
+
+    # ---------- BaseStorage ----------
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key_str(key)
+        value = _state_str(state)
+        entry = await self._entry(k)
+        if entry.state == value:
+            return
+        async with session_scope() as session:
+            await upsert(
+                session, FsmState,
+                [{"key": k, "state": value, "updated_at": datetime.utcnow()}],
+                ["key"], ["state", "updated_at"],
+            )
+        entry.state = value
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(_key_str(key))).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = _key_str(key)
+        entry = await self._entry(k)
+        entry.data = dict(data)
+        self._dirty[k] = entry.data
+        self._ensure_flusher()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._entry(_key_str(key))).data)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    # ---------- write-behind ----------
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("fsm storage: flush failed, will retry")
+
+    async def flush(self) -> int:
+        """Сбросить накопленные данные в БД пачками; вернуть число записанных ключей."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            pending, self._dirty = self._dirty, {}
+            now = datetime.utcnow()
+            rows = [
+                {"key": k, "data": json.dumps(v, ensure_ascii=False, default=str), "updated_at": now}
+                for k, v in pending.items()
+            ]
+            try:
+                async with session_scope() as session:
+                    for i in range(0, len(rows), FLUSH_BATCH):
+                        await upsert(session, FsmData, rows[i:i + FLUSH_BATCH], ["key"], ["data", "updated_at"])
+            except Exception:
+                # Вернуть несохранённое, не затирая более свежие правки
+                for k, v in pending.items():
+                    self._dirty.setdefault(k, v)
+                raise
+            return len(rows)
+
+
+def build_fsm_storage() -> BaseStorage:
+    if settings.FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return DBStorage(
+        cache_size=settings.FSM_CACHE_SIZE,
+        flush_interval=settings.FSM_FLUSH_INTERVAL_MS / 1000,
+    )
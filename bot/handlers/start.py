@@ -1,116 +1,82 @@
 # bot/handlers/start.py
 from __future__ import annotations
 
-from decimal import Decimal, ROUND_DOWN, InvalidOperation
-from urllib.parse import quote_plus
-
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import (
-    Message, CallbackQuery,
-    InlineKeyboardMarkup, InlineKeyboardButton,
-)
-
-from ..config import settings
+from aiogram.types import Message, CallbackQuery
+
+from ..i18n import MAX_STARS, MIN_STARS, pick_lang, t
+from ..keyboards import payment_keyboard
+from ..middlewares import CallbackThrottleMiddleware, HandlerMetricsMiddleware
+from ..models import OrderStatus
+from ..services.money import Quote, format_ton
+from ..services.order_keys import normalize_order_key
+from ..services.orders import create_order
+from ..services.payment_check import CheckResult, get_payment_checker
+from ..services.pricing import quote
 
 start_router = Router()
-
-MIN_STARS = 50
-MAX_STARS = 1_000_000
-FEE_MULT = Decimal("1.05")
-NANO = Decimal("1000000000")  # 1 TON = 1e9 nano
+start_router.message.middleware(HandlerMetricsMiddleware())
+start_router.callback_query.middleware(HandlerMetricsMiddleware())
+# «Проверить оплату» жмут часто — свой роутер с троттлингом на пользователя
+check_router = Router()
+check_router.callback_query.middleware(CallbackThrottleMiddleware())  # интервал — CHECK_THROTTLE_SEC
+start_router.include_router(check_router)
 
 
 # ---------- helpers ----------
-def _D(x) -> Decimal:
-    return x if isinstance(x, Decimal) else Decimal(str(x))
-
-def _format_ton(tons: Decimal) -> str:
-    """Красиво форматируем TON без экспоненты, до 9 знаков"""
-    t = _D(tons).quantize(Decimal("0.000000001"), rounding=ROUND_DOWN)
-    s = f"{t.normalize()}"
-    return "0" if "E" in s else s
-
-def _to_nano(tons: Decimal) -> int:
-    return int((_D(tons) * NANO).quantize(Decimal("1"), rounding=ROUND_DOWN))
-
-def compute_total(qty: int) -> tuple[Decimal, Decimal]:
-    """(цена_за_звезду, сумма_с_наценкой)"""
-    per_star = _D(settings.PRICE_MOCK_TON_PER_STAR)
-    subtotal = per_star * _D(qty)
-    total = (subtotal * FEE_MULT).quantize(Decimal("0.000000001"), rounding=ROUND_DOWN)
-    return per_star, total
-
-
-# ---------- links ----------
-def build_ton_uri(address: str, tons: Decimal, comment: str) -> str:
-    """Внешние TON-кошельки (Tonkeeper / MyTonWallet): подставляют все поля надёжно."""
-    nano = _to_nano(tons)
-    return f"ton://transfer/{address}?amount={nano}&text={quote_plus(comment)}"
-
-def build_wallet_open_uri() -> str:
-    """Открыть чат/мини-приложение Telegram Wallet (без попытки автоперевода)."""
-    # Обе ссылки рабочие; оставим https-вариант, он открывает @wallet даже из бота.
-    return "https://t.me/wallet?attach=wallet"
-
-
-# ---------- keyboards ----------
-def payment_keyboard(qty: int, total_ton: Decimal, address: str, memo: str) -> InlineKeyboardMarkup:
-    tg_link  = build_wallet_open_uri()
-    ton_link = build_ton_uri(address, total_ton, memo)
-
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="💎 Открыть Telegram Wallet", url=tg_link)],
-        [InlineKeyboardButton(text="🪙 Оплатить TON-кошельком",  url=ton_link)],
-        [
-            InlineKeyboardButton(text="✅ Проверить оплату",     callback_data=f"check:{qty}"),
-            InlineKeyboardButton(text="✏️ Изменить количество",  callback_data="change_qty"),
-        ],
-    ])
+def compute_total(qty: int) -> Quote:
+    """Расчёт заказа в целых нанотонах (цена за звезду, итог с наценкой)."""
+    return quote(qty)
 
 
 # ---------- handlers ----------
 @start_router.message(Command("start"))
 async def cmd_start(msg: Message):
-    await msg.answer(
-        "Привет! Я помогу купить ⭐ Stars.\n\n"
-        f"Напишите нужное количество звёзд (от {MIN_STARS} до {MAX_STARS})."
-    )
+    await msg.answer(t(pick_lang(msg.from_user.language_code), "start"))
 
 @start_router.message(F.text.regexp(r"^\d+$"))
 async def take_qty(msg: Message):
+    lang = pick_lang(msg.from_user.language_code)
     qty = int(msg.text)
     if not (MIN_STARS <= qty <= MAX_STARS):
-        await msg.answer(f"Введите число от {MIN_STARS} до {MAX_STARS}.")
+        await msg.answer(t(lang, "qty_range"))
         return
 
-    try:
-        _, total = compute_total(qty)
-    except (InvalidOperation, ValueError):
-        await msg.answer("Не удалось посчитать цену. Попробуйте другое число.")
-        return
+    q = compute_total(qty)
 
-    addr = settings.TON_WALLET_ADDRESS
-    memo = f"Stars x{qty}"
+    # Уникальный ключ заказа — он же комментарий к переводу, по нему матчим оплату.
+    order = await create_order(msg.from_user.id, msg.from_user.username, q, lang=lang)
+    memo = order.order_key
 
-    text = (
-        "Выберите способ для оплаты — форма перевода откроется с заполненными полями.\n\n"
-        f"• Количество: <b>{qty}</b> ⭐\n"
-        f"• К оплате: <b>{_format_ton(total)}</b> TON\n"
-        "• <b>Кошелёк получателя</b> <i>(нажмите для копирования)</i>:\n"
-        f"<u><code>{addr}</code></u>"
-    )
-    await msg.answer(text, reply_markup=payment_keyboard(qty, total, addr, memo))
+    text = t(lang, "pay", qty=qty, total=format_ton(q.total_nano))
+    await msg.answer(text, reply_markup=payment_keyboard(lang, q.total_nano, memo))
 
 @start_router.callback_query(F.data == "change_qty")
 async def change_qty(cb: CallbackQuery):
     await cb.message.edit_reply_markup(reply_markup=None)
-    await cb.message.answer(
-        f"Ок, введите новое количество звёзд (от {MIN_STARS} до {MAX_STARS})."
-    )
+    await cb.message.answer(t(pick_lang(cb.from_user.language_code), "qty_again"))
     await cb.answer()
 
-@start_router.callback_query(F.data.startswith("check:"))
-async def check_payment(cb: CallbackQuery):
-    # Пока mock; реальную проверку подключим через toncenter/tonapi позже.
-    await cb.answer("Пока включён mock-режим проверки платежа.", show_alert=True)
+def check_text(lang: str, result: CheckResult | None) -> str:
+    if result is None:
+        return t(lang, "check_not_found")
+    if result.is_paid:
+        return t(lang, "check_paid")
+    if result.status == OrderStatus.EXPIRED:
+        return t(lang, "check_expired")
+    if result.status != OrderStatus.WAITING_PAYMENT:
+        return t(lang, "check_closed")
+    if result.paid_nano:
+        return t(lang, "check_partial", paid=format_ton(result.paid_nano), total=format_ton(result.amount_nano))
+    return t(lang, "check_waiting")
+
+@check_router.callback_query(F.data.startswith("check:"))
+async def check_payment(cb: CallbackQuery) -> str:
+    lang = pick_lang(cb.from_user.language_code)
+    key = normalize_order_key(cb.data.split(":", 1)[1])
+    result = await get_payment_checker().check(key) if key else None
+    text = check_text(lang, result)
+    await cb.answer(text, show_alert=True)
+    # Текст запоминает CallbackThrottleMiddleware для повторных нажатий
+    return text
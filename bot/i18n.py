@@ -0,0 +1,133 @@
+"""
+Каталог текстов бота (ru/en).
+
+Шаблоны компилируются один раз, при первом обращении (адрес кошелька берётся из настроек,
+а импорт модуля их не читает): константы (лимиты, адрес) подставляются сразу, тексты без
+параметров становятся готовыми строками, остальные — связанными методами str.format.
+В обработчиках остаётся только t(lang, key, ...).
+"""
+from functools import cache
+from typing import Callable, Optional, Union
+
+from .config import settings
+
+MIN_STARS = 50
+MAX_STARS = 1_000_000
+
+LANGS = ("ru", "en")
+
+_CATALOG: dict[str, dict[str, str]] = {
+    "ru": {
+        "start": (
+            "Привет! Я помогу купить ⭐ Stars.\n\n"
+            "Напишите нужное количество звёзд (от {min_stars} до {max_stars})."
+        ),
+        "qty_range": "Введите число от {min_stars} до {max_stars}.",
+        "qty_again": "Ок, введите новое количество звёзд (от {min_stars} до {max_stars}).",
+        "pay": (
+            "Выберите способ для оплаты — форма перевода откроется с заполненными полями.\n\n"
+            "• Количество: <b>{{qty}}</b> ⭐\n"
+            "• К оплате: <b>{{total}}</b> TON\n"
+            "• <b>Кошелёк получателя</b> <i>(нажмите для копирования)</i>:\n"
+            "<u><code>{address}</code></u>"
+        ),
+        "check_not_found": "Заказ не найден.",
+        "check_paid": "✅ Оплата получена! Звёзды скоро придут.",
+        "check_expired": "⌛ Заказ истёк. Отправьте количество звёзд, чтобы создать новый.",
+        "check_closed": "Заказ закрыт.",
+        "check_partial": "Получено {{paid}} из {{total}} TON. Доплатите остаток с тем же комментарием.",
+        "check_waiting": "Оплата пока не найдена. Обычно перевод доходит за 1–2 минуты.",
+        "check_busy": "⏳ Проверяю…",
+        "order_expired": (
+            "⌛ Заказ <code>{{key}}</code> истёк: оплата не поступила вовремя.\n"
+            "Отправьте количество звёзд, чтобы создать новый заказ."
+        ),
+        "payment_received": "✅ Оплата заказа <code>{{key}}</code> получена! Отправляем {{qty}} ⭐.",
+        "gift_sent": "🎁 Готово! {{qty}} ⭐ отправлены.",
+        # клавиатуры
+        "btn_buy": "Купить звёзды ⭐",
+        "ph_qty": "Напишите количество или нажмите кнопку",
+        "btn_pay": "Оплатить",
+        "btn_pay_wallet": "Оплатить в Telegram Wallet",
+        "btn_edit": "Изменить количество",
+        "btn_cancel": "Отмена",
+        "btn_tg_wallet": "💎 Открыть Telegram Wallet",
+        "btn_ton_wallet": "🪙 Оплатить TON-кошельком",
+        "btn_check": "✅ Проверить оплату",
+        "btn_change_qty": "✏️ Изменить количество",
+    },
+    "en": {
+        "start": (
+            "Hi! I'll help you buy ⭐ Stars.\n\n"
+            "Send the number of stars you need (from {min_stars} to {max_stars})."
+        ),
+        "qty_range": "Enter a number from {min_stars} to {max_stars}.",
+        "qty_again": "OK, send a new number of stars (from {min_stars} to {max_stars}).",
+        "pay": (
+            "Choose how to pay — the transfer form will open with all fields filled in.\n\n"
+            "• Amount: <b>{{qty}}</b> ⭐\n"
+            "• To pay: <b>{{total}}</b> TON\n"
+            "• <b>Recipient wallet</b> <i>(tap to copy)</i>:\n"
+            "<u><code>{address}</code></u>"
+        ),
+        "check_not_found": "Order not found.",
+        "check_paid": "✅ Payment received! Your stars are on the way.",
+        "check_expired": "⌛ The order has expired. Send the number of stars to create a new one.",
+        "check_closed": "The order is closed.",
+        "check_partial": "Received {{paid}} of {{total}} TON. Send the rest with the same comment.",
+        "check_waiting": "No payment yet. A transfer usually arrives within 1–2 minutes.",
+        "check_busy": "⏳ Checking…",
+        "order_expired": (
+            "⌛ Order <code>{{key}}</code> has expired: no payment arrived in time.\n"
+            "Send the number of stars to create a new order."
+        ),
+        "payment_received": "✅ Payment for order <code>{{key}}</code> received! Sending {{qty}} ⭐.",
+        "gift_sent": "🎁 Done! {{qty}} ⭐ have been sent.",
+        "btn_buy": "Buy stars ⭐",
+        "ph_qty": "Type an amount or tap the button",
+        "btn_pay": "Pay",
+        "btn_pay_wallet": "Pay in Telegram Wallet",
+        "btn_edit": "Change amount",
+        "btn_cancel": "Cancel",
+        "btn_tg_wallet": "💎 Open Telegram Wallet",
+        "btn_ton_wallet": "🪙 Pay with a TON wallet",
+        "btn_check": "✅ Check payment",
+        "btn_change_qty": "✏️ Change amount",
+    },
+}
+
+Compiled = Union[str, Callable[..., str]]
+
+
+def _compile(templates: dict[str, str]) -> dict[str, Compiled]:
+    consts = {
+        "min_stars": MIN_STARS,
+        "max_stars": MAX_STARS,
+        "address": settings.TON_WALLET_ADDRESS,
+    }
+    out: dict[str, Compiled] = {}
+    for key, tpl in templates.items():
+        # Первый проход — константы процесса; {{x}} превращаются в {x} для второго.
+        text = tpl.format(**consts)
+        out[key] = text.format if tpl.count("{{") else text
+    return out
+
+
+@cache
+def _compiled() -> dict[str, dict[str, Compiled]]:
+    return {lang: _compile(t) for lang, t in _CATALOG.items()}
+
+
+def pick_lang(language_code: Optional[str]) -> str:
+    """Язык пользователя из Telegram (en-US → en); неизвестный — DEFAULT_LANG."""
+    if language_code:
+        lang = language_code[:2].lower()
+        if lang in _CATALOG:
+            return lang
+    return settings.DEFAULT_LANG
+
+
+def t(lang: str, key: str, /, **params) -> str:
+    compiled = _compiled()
+    entry = compiled.get(lang, compiled[settings.DEFAULT_LANG])[key]
+    return entry if isinstance(entry, str) else entry(**params)
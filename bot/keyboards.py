@@ -1,29 +1,82 @@
+from functools import cache
+from typing import Optional
+from urllib.parse import quote_plus
+
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton
 )
 
-def main_menu() -> ReplyKeyboardMarkup:
+from .config import settings
+from .i18n import t
+
+# Открыть чат/мини-приложение Telegram Wallet (без попытки автоперевода).
+# Обе ссылки рабочие; оставим https-вариант, он открывает @wallet даже из бота.
+WALLET_OPEN_URI = "https://t.me/wallet?attach=wallet"
+
+
+def build_ton_uri(address: str, amount_nano: int, comment: str) -> str:
+    """Внешние TON-кошельки (Tonkeeper / MyTonWallet): подставляют все поля надёжно."""
+    return f"ton://transfer/{address}?amount={amount_nano}&text={quote_plus(comment)}"
+
+
+# ---------- статические клавиатуры: по экземпляру на язык ----------
+# Модели aiogram неизменяемые (frozen), так что один объект безопасно отдавать всем.
+# Строятся при первом запросе: импорт модуля не трогает ни каталог текстов, ни настройки.
+@cache
+def _main_menu(lang: str) -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         resize_keyboard=True,
-        keyboard=[[KeyboardButton(text="Купить звёзды ⭐")]],
-        input_field_placeholder="Напишите количество или нажмите кнопку"
+        keyboard=[[KeyboardButton(text=t(lang, "btn_buy"))]],
+        input_field_placeholder=t(lang, "ph_qty"),
     )
 
-def confirm_kb() -> InlineKeyboardMarkup:
+@cache
+def _confirm_kb(lang: str) -> InlineKeyboardMarkup:
     # Показываем после ввода количества (без deeplink — он появится на шаге оплаты)
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Оплатить", callback_data="pay")],
+        [InlineKeyboardButton(text=t(lang, "btn_pay"), callback_data="pay")],
         [
-            InlineKeyboardButton(text="Изменить количество", callback_data="edit"),
-            InlineKeyboardButton(text="Отмена", callback_data="cancel")
+            InlineKeyboardButton(text=t(lang, "btn_edit"), callback_data="edit"),
+            InlineKeyboardButton(text=t(lang, "btn_cancel"), callback_data="cancel")
         ]
     ])
 
-def pay_kb(deeplink_url: str) -> InlineKeyboardMarkup:
+def main_menu(lang: Optional[str] = None) -> ReplyKeyboardMarkup:
+    return _main_menu(lang or settings.DEFAULT_LANG)
+
+def confirm_kb(lang: Optional[str] = None) -> InlineKeyboardMarkup:
+    return _confirm_kb(lang or settings.DEFAULT_LANG)
+
+
+# ---------- клавиатуры заказа: собираются на каждый заказ ----------
+# Ссылка и callback уникальны для заказа (order_key), кешировать целиком нечего;
+# общие для всех заказов кнопки берём из кеша по языку.
+@cache
+def _wallet_button(lang: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text=t(lang, "btn_tg_wallet"), url=WALLET_OPEN_URI)
+
+@cache
+def _change_qty_button(lang: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text=t(lang, "btn_change_qty"), callback_data="change_qty")
+
+def pay_kb(deeplink_url: str, lang: Optional[str] = None) -> InlineKeyboardMarkup:
     # Клавиатура с прямой оплатой в Telegram Wallet
+    lang = lang or settings.DEFAULT_LANG
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Оплатить в Telegram Wallet", url=deeplink_url)],
-        [InlineKeyboardButton(text="Проверить оплату", callback_data="check_payment")],
-        [InlineKeyboardButton(text="Отмена", callback_data="cancel")]
+        [InlineKeyboardButton(text=t(lang, "btn_pay_wallet"), url=deeplink_url)],
+        [InlineKeyboardButton(text=t(lang, "btn_check"), callback_data="check_payment")],
+        [InlineKeyboardButton(text=t(lang, "btn_cancel"), callback_data="cancel")]
+    ])
+
+def payment_keyboard(lang: str, total_nano: int, memo: str) -> InlineKeyboardMarkup:
+    """Клавиатура оплаты заказа: ссылка на перевод с суммой и order_key в комментарии."""
+    ton_link = build_ton_uri(settings.TON_WALLET_ADDRESS, total_nano, memo)
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [_wallet_button(lang)],
+        [InlineKeyboardButton(text=t(lang, "btn_ton_wallet"), url=ton_link)],
+        [
+            InlineKeyboardButton(text=t(lang, "btn_check"), callback_data=f"check:{memo}"),
+            _change_qty_button(lang),
+        ],
     ])
@@ -1,13 +1,33 @@
 ﻿import sys
 import asyncio
+import logging
+from typing import Awaitable, Callable
 
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from sqlalchemy.engine import make_url
 
 from .config import settings
-from .storage import init_db
+from .fsm_storage import build_fsm_storage
+from .metrics import QUEUE_DEPTH, start_metrics_server
+from .middlewares import BotApiMetricsMiddleware, FirstUpdateMiddleware
+from .startup import startup
+from .storage import dispose_engines, init_db, read_session
 from .handlers.start import start_router
+from .services.expiry import build_expiry
+from .services.matching import payment_index
+from .services.notify import build_notifier
+from .services.send_scheduler import Priority, install_send_scheduler
+from .services.price_oracle import get_price_oracle
+from .services.write_behind import get_write_behind
+
+# Наблюдатель, доставка, архив, вебхук (httpx, aiohttp.web, клиенты TON API) импортируются
+# там, где запускаются, — уже после того, как бот начал принимать апдейты.
+
+log = logging.getLogger(__name__)
 
 
 def _mask(s: str | None, keep: int = 6) -> str:
@@ -16,36 +36,209 @@ def _mask(s: str | None, keep: int = 6) -> str:
     return (s[:keep] + "...") if len(s) > keep else "(set)"
 
 
-async def _run() -> None:
+def print_diagnostics() -> None:
     # Диагностика окружения
     print("✅ Конфиг загружен. Проверка окружения:")
     print(" - Python:", sys.version.split()[0])
     print(" - BOT_TOKEN:", _mask(settings.BOT_TOKEN))
-    print(" - DB:", settings.DATABASE_URL)
+    print(" - DB:", make_url(settings.DATABASE_URL).render_as_string(hide_password=True))
     print(" - FRAGMENT_PRICE_MODE:", settings.FRAGMENT_PRICE_MODE)
 
-    # Инициализация БД
-    print("⏳ Инициализирую БД…")
-    await init_db()
-    print("✅ DB init OK (таблицы созданы/актуальны).")
 
-    # Инициализация бота и диспетчера
+def build_bot(shards: int = 1) -> Bot:
+    session = None
+    if settings.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
     bot = Bot(
         token=settings.BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode="HTML"),
     )
-    dp = Dispatcher()
+    # Все исходящие сообщения идут через общий планировщик лимитов Telegram
+    scheduler = install_send_scheduler(bot, shards)
+    QUEUE_DEPTH.track(lambda: scheduler.depth, "send_scheduler")
+    # После планировщика — меряем сам запрос к Bot API, без ожидания лимитов
+    bot.session.middleware(BotApiMetricsMiddleware())
+    return bot
 
+
+def build_dispatcher() -> Dispatcher:
+    dp = Dispatcher(storage=build_fsm_storage())
+    if startup.enabled:
+        dp.update.outer_middleware(FirstUpdateMiddleware(startup))
     # Подключаем роутеры
     dp.include_router(start_router)
+    return dp
+
+
+async def prepare_runtime(index: bool = True) -> None:
+    """
+    Состояние процесса в памяти: индекс открытых заказов и прогретый кеш цены.
+    index=False — процессу индекс не нужен (воркер, который может не стать лидером):
+    наблюдатель загрузит его сам при первом тике.
+    """
+    # Прогрев кеша цены, чтобы первые сообщения не шли по mock-цене; запрос к источнику
+    # идёт параллельно с чтением индекса, а не после него.
+    price = asyncio.ensure_future(get_price_oracle().get())
+
+    # Индекс открытых заказов для матчинга оплат
+    if index:
+        async with read_session() as session:
+            n = await payment_index.rebuild(session)
+        print(f"✅ Индекс оплат построен: {n} открытых заказов.")
+
+    print(" - Цена за звезду:", await price, "TON")
+    QUEUE_DEPTH.track(lambda: get_write_behind().depth, "write_behind")
+
+
+async def start_metrics(port_offset: int = 0):
+    """/metrics этого процесса (воркеры — на METRICS_PORT + номер); None — метрики выключены."""
+    if not settings.METRICS_ENABLED:
+        return None
+    port = settings.METRICS_PORT + port_offset
+    runner = await start_metrics_server(settings.METRICS_HOST, port, profiling=settings.METRICS_PROFILER)
+    print(f"✅ Метрики: http://{settings.METRICS_HOST}:{port}/metrics")
+    return runner
+
+
+async def supervise(
+    name: str,
+    job: Callable[[], Awaitable[None]],
+    *,
+    delay_min: float = 1.0,
+    delay_max: float = 60.0,
+) -> None:
+    """
+    Держит фоновую задачу живой: упала — пишем в лог и запускаем заново с растущей паузой
+    (проработала дольше delay_max — пауза снова с delay_min). Штатное завершение — выходим.
+    """
+    loop = asyncio.get_running_loop()
+    delay = delay_min
+    while True:
+        started = loop.time()
+        try:
+            await job()
+            return
+        except Exception:
+            if loop.time() - started > delay_max:
+                delay = delay_min
+            log.exception("background job %s failed; restart in %.0fs", name, delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, delay_max)
+
+
+async def run_background_jobs(bot: Bot) -> None:
+    """
+    Фоновые задачи, которые должны работать ровно в одном процессе
+    (при нескольких воркерах их запускает только лидер).
+    """
+    notifier = build_notifier(bot)
+    # «оплата получена» и «звёзды отправлены» — вперёд массовых рассылок
+    urgent = build_notifier(bot, Priority.HIGH)
+    expiry = build_expiry(notifier)
+    QUEUE_DEPTH.track(lambda: notifier.depth, "notify")
+    QUEUE_DEPTH.track(lambda: urgent.depth, "notify_urgent")
+    QUEUE_DEPTH.track(lambda: len(expiry), "expiry")
+    # Каждая задача перезапускается сама: падение одной (скажем, не стартовал Chromium
+    # у доставки) не должно оставлять лидера без остальных.
+    jobs = [
+        supervise("expiry", expiry.run),
+        supervise("payment watcher", lambda: _run_payment_watcher(urgent)),
+    ]
+    if settings.FULFILLMENT_ENABLED:
+        from .services.fulfillment import run_fulfillment
+        jobs.append(supervise("fulfillment", lambda: run_fulfillment(urgent)))
+    if settings.ARCHIVE_ENABLED:
+        from .services.archive import build_archiver
+        jobs.append(supervise("archive", build_archiver().run))
+    try:
+        await asyncio.gather(*jobs)
+    finally:
+        # Без наблюдателя индекс никто не чистит — в этом процессе он больше не ведётся.
+        payment_index.unload()
+        await notifier.close()
+        await urgent.close()
+
+
+async def _run_payment_watcher(notifier) -> None:
+    from .services.ton_client import build_ton_client
+    from .services.ton_stream import build_stream
+    from .services.watcher import build_watcher
+
+    # Наблюдатель за оплатами (общий курсор)
+    provider = build_ton_client()
+    if provider is None:
+        return
+    watcher = build_watcher(provider, notifier)
+    try:
+        if settings.PAYMENT_WATCH_MODE == "stream":
+            print(f"✅ Наблюдатель оплат запущен ({provider.name}, поток событий).")
+            await build_stream(provider, watcher).run()
+        else:
+            print(f"✅ Наблюдатель оплат запущен ({provider.name}, каждые {settings.PAYMENT_POLL_INTERVAL_SEC} с).")
+            await watcher.run()
+    finally:
+        await provider.aclose()
+
+
+async def _set_commands(bot: Bot) -> None:
+    # Команда /start; не нужна для приёма апдейтов — ставится в фоне.
+    try:
+        await bot.set_my_commands([BotCommand(command="start", description="Начать")])
+    except Exception as e:
+        print("⚠️ set_my_commands:", e)
+
+
+async def _run() -> None:
+    print_diagnostics()
+
+    # Инициализация БД
+    print("⏳ Инициализирую БД…")
+    with startup.phase("init_db"):
+        changed = await init_db()
+    print("✅ DB init OK (таблицы созданы/актуальны)." if changed else "✅ DB init OK (схема не менялась).")
+
+    # Инициализация бота и диспетчера
+    with startup.phase("build bot + dispatcher"):
+        bot = build_bot()
+        dp = build_dispatcher()
 
-    # Команда /start и сброс вебхука
-    await bot.set_my_commands([BotCommand(command="start", description="Начать")])
-    await bot.delete_webhook(drop_pending_updates=True)
+    # Индекс и цена — параллельно со сбросом вебхука: оба упираются в сеть/диск, не в CPU.
+    polling = settings.BOT_MODE != "webhook"
+    with startup.phase("prepare_runtime" + (" + deleteWebhook" if polling else "")):
+        if polling:
+            await asyncio.gather(prepare_runtime(), bot.delete_webhook(drop_pending_updates=True))
+        else:
+            await prepare_runtime()
+    metrics_runner = await start_metrics()
 
-    # Запуск long polling
-    print("🚀 Запускаю бота… Нажмите Ctrl+C для остановки.")
-    await dp.start_polling(bot)
+    commands_task = asyncio.create_task(_set_commands(bot))
+    jobs_task = asyncio.create_task(run_background_jobs(bot))
+    try:
+        if not polling:
+            from .webhook import run_webhook
+            if startup.enabled:
+                print(startup.report())
+            await run_webhook(dp, bot)
+        else:
+            # Вебхук уже сброшен — запуск long polling
+            print("🚀 Запускаю бота… Нажмите Ctrl+C для остановки.")
+            if startup.enabled:
+                print(startup.report())
+            await dp.start_polling(bot)
+    finally:
+        commands_task.cancel()
+        jobs_task.cancel()
+        await asyncio.gather(commands_task, jobs_task, return_exceptions=True)
+        # Сессию Bot API закрываем последней, когда слать уже некому: вебхук её не закрывает,
+        # а после start_polling фоновые задачи при остановке могли открыть её заново.
+        await bot.session.close()
+        await dp.storage.close()
+        await get_write_behind().close()
+        await get_price_oracle().aclose()
+        await dispose_engines()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 def main() -> None:
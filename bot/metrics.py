@@ -0,0 +1,309 @@
+"""
+Метрики процесса в текстовом формате Prometheus — без внешних зависимостей — и
+HTTP-эндпоинт /metrics. Там же сэмплирующий профайлер, который включается на лету:
+GET /debug/profile?seconds=10 возвращает свёрнутые стеки (формат flamegraph.pl / speedscope).
+
+Сбор дешёвый (счётчик в словаре, bisect по корзинам гистограммы) и идёт всегда;
+сервер поднимается только при METRICS_ENABLED.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import collections
+import math
+import os
+import sys
+import threading
+from typing import Callable, Iterable, Optional
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, values: Labels, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: dict[Labels, float] = collections.defaultdict(float)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] += amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterable[str]:
+        for labels, v in sorted(self._values.items()):
+            yield f"{self.name}{self._labels(labels)} {_fmt(v)}"
+
+
+class Gauge(_Metric):
+    """Значение задаётся set() или считается при отдаче метрик функцией из track()."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: dict[Labels, float] = {}
+        self._funcs: dict[Labels, Callable[[], float]] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def track(self, fn: Callable[[], float], *labels: str) -> None:
+        self._funcs[labels] = fn
+
+    def untrack(self, *labels: str) -> None:
+        self._funcs.pop(labels, None)
+
+    def value(self, *labels: str) -> float:
+        fn = self._funcs.get(labels)
+        return fn() if fn is not None else self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterable[str]:
+        for labels in sorted(set(self._values) | set(self._funcs)):
+            try:
+                v = self.value(*labels)
+            except Exception:
+                continue
+            yield f"{self.name}{self._labels(labels)} {_fmt(v)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels → [счётчики по корзинам (+Inf последней), сумма]
+        self._series: dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in sorted(self._series.items()):
+            acc = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                acc += n
+                le = 'le="%s"' % _fmt(bound)
+                yield f"{self.name}_bucket{self._labels(labels, le)} {acc}"
+            yield f"{self.name}_sum{self._labels(labels)} {_fmt(total)}"
+            yield f"{self.name}_count{self._labels(labels)} {acc}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+# ---------- метрики приложения ----------
+HANDLER_SECONDS = registry.register(Histogram(
+    "bot_handler_seconds", "Update handling latency per handler", ["handler"]))
+HANDLER_ERRORS = registry.register(Counter(
+    "bot_handler_errors_total", "Unhandled exceptions per handler", ["handler"]))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    "bot_db_query_seconds", "SQL statement execution time", ["engine", "statement"]))
+DB_ERRORS = registry.register(Counter(
+    "bot_db_errors_total", "Failed SQL statements", ["engine"]))
+DB_COMMITS = registry.register(Counter(
+    "bot_db_commits_total", "Committed DB transactions", ["engine"]))
+BOT_API_SECONDS = registry.register(Histogram(
+    "bot_api_request_seconds", "Telegram Bot API call latency (after send scheduling)", ["method"]))
+BOT_API_ERRORS = registry.register(Counter(
+    "bot_api_errors_total", "Failed Telegram Bot API calls", ["method", "error"]))
+TON_API_SECONDS = registry.register(Histogram(
+    "ton_api_request_seconds", "TON API provider call latency", ["provider"]))
+TON_API_ERRORS = registry.register(Counter(
+    "ton_api_errors_total", "Failed TON API provider calls", ["provider"]))
+TON_API_HEDGED = registry.register(Counter(
+    "ton_api_hedged_total", "TON API requests duplicated to the fallback provider"))
+TON_API_FAILOVERS = registry.register(Counter(
+    "ton_api_failovers_total", "TON API requests retried on the fallback provider"))
+PAYMENTS_UNSETTLED = registry.register(Counter(
+    "bot_payments_unsettled_total", "Incoming transfers recorded for manual handling/refund", ["reason"]))
+QUEUE_DEPTH = registry.register(Gauge(
+    "bot_queue_depth", "Items waiting in background worker queues", ["queue"]))
+PROCESS_RSS = registry.register(Gauge(
+    "process_resident_memory_bytes", "Resident memory size of this process"))
+
+
+def _rss_bytes() -> float:
+    """Текущий RSS из /proc (Linux); где /proc нет — пиковый RSS из getrusage."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # macOS — байты, Linux — КиБ
+
+
+PROCESS_RSS.track(_rss_bytes)
+
+
+# ---------- сэмплирующий профайлер ----------
+class SamplingProfiler:
+    """
+    Фоновый поток раз в interval снимает стек потока цикла событий (sys._current_frames)
+    и считает одинаковые стеки. Работающий код не трогает — накладные расходы только
+    на время записи, поэтому его можно включать на проде на несколько секунд.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64) -> None:
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks: collections.Counter[str] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._target = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, thread_id: Optional[int] = None) -> None:
+        if self.running:
+            return
+        self._target = thread_id or threading.get_ident()
+        self._stacks.clear()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            parts = []
+            while frame is not None and len(parts) < self.max_depth:
+                code = frame.f_code
+                parts.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            self._stacks[";".join(reversed(parts))] += 1
+            self.samples += 1
+
+    def stop(self) -> str:
+        """Остановить и вернуть свёрнутые стеки: «a;b;c N» по строке, частые сверху."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return "".join(f"{stack} {n}\n" for stack, n in self._stacks.most_common())
+
+
+profiler = SamplingProfiler()
+
+
+# ---------- HTTP ----------
+def _query_float(query, name: str, default: float, *, low: float, high: float) -> float:
+    """Параметр запроса в [low, high]; мусор, nan/inf и значения вне диапазона — ValueError."""
+    raw = query.get(name)
+    if raw is None:
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ValueError(f"{name}: not a number") from None
+    if not math.isfinite(value) or not low <= value <= high:
+        raise ValueError(f"{name}: must be within {low:g}..{high:g}")
+    return value
+
+
+def build_metrics_app(*, profiling: bool = False):
+    from aiohttp import web
+
+    async def metrics(_request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def profile(request: web.Request) -> web.Response:
+        if not profiling:
+            raise web.HTTPNotFound()
+        if profiler.running:
+            return web.Response(status=409, text="profiler is already running\n")
+        try:
+            seconds = _query_float(request.query, "seconds", 10.0, low=0.1, high=120.0)
+            interval_ms = _query_float(request.query, "interval_ms", 5.0, low=1.0, high=1000.0)
+        except ValueError as e:
+            return web.Response(status=400, text=f"{e}\n")
+        profiler.interval = interval_ms / 1000
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            out = profiler.stop()
+        return web.Response(text=out, content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/debug/profile", profile)
+    return app
+
+
+async def start_metrics_server(host: str, port: int, *, profiling: bool = False):
+    """Поднять /metrics на host:port; вернуть AppRunner (остановка — runner.cleanup())."""
+    from aiohttp import web
+
+    runner = web.AppRunner(build_metrics_app(profiling=profiling), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
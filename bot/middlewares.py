@@ -0,0 +1,134 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, TelegramObject
+
+from .config import settings
+from .i18n import pick_lang, t
+from .metrics import BOT_API_ERRORS, BOT_API_SECONDS, HANDLER_ERRORS, HANDLER_SECONDS
+from .startup import StartupProfile
+
+
+class CallbackThrottleMiddleware(BaseMiddleware):
+    """
+    Пер-пользовательский троттлинг кнопки: повторное нажатие чаще, чем раз в interval
+    секунд, не доходит до обработчика — отвечаем тем же текстом, что и в прошлый раз
+    (обработчик возвращает текст ответа), одним дешёвым answerCallbackQuery.
+    Пока первый ответ не готов — текст busy_key из каталога на языке пользователя.
+    interval=None — CHECK_THROTTLE_SEC из настроек (читается при первом нажатии, не при импорте).
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        *,
+        busy_key: str = "check_busy",
+        capacity: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._interval = interval
+        self.busy_key = busy_key
+        self.capacity = capacity
+        self.clock = clock
+        # (user_id, data) → (время нажатия, текст последнего ответа)
+        self._last: OrderedDict[tuple[int, str], tuple[float, Optional[str]]] = OrderedDict()
+
+    @property
+    def interval(self) -> float:
+        if self._interval is None:
+            self._interval = settings.CHECK_THROTTLE_SEC
+        return self._interval
+
+    def _remember(self, key: tuple[int, str], at: float, text: Optional[str]) -> None:
+        self._last[key] = (at, text)
+        self._last.move_to_end(key)
+        if len(self._last) > self.capacity:
+            self._last.popitem(last=False)
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        key = (event.from_user.id, event.data or "")
+        now = self.clock()
+        prev = self._last.get(key)
+        if prev is not None and now - prev[0] < self.interval:
+            await event.answer(prev[1] or t(pick_lang(event.from_user.language_code), self.busy_key))
+            return None
+
+        self._remember(key, now, None)
+        result = await handler(event, data)
+        if isinstance(result, str):
+            self._remember(key, now, result)
+        return result
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время обработки апдейта по обработчикам (bot_handler_seconds{handler=...}).
+    Вешается внутренним middleware на роутер — и действует на все вложенные роутеры;
+    имя обработчика берётся из data["handler"], который aiogram кладёт после фильтров.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        obj = data.get("handler")
+        name = getattr(getattr(obj, "callback", None), "__name__", None) or type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Задержка и ошибки вызовов Bot API по методам. Ставится после SendScheduler,
+    поэтому меряет сам HTTP-запрос, а не ожидание в очереди лимитов.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Any:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            BOT_API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, name)
+
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.update при --startup-profile: печатает время до первого апдейта."""
+
+    def __init__(self, profile: StartupProfile) -> None:
+        self.profile = profile
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self.profile.update_received():
+            print(f"⏱ Первый апдейт через {self.profile.first_update * 1000:.1f} ms после старта процесса")
+        return await handler(event, data)
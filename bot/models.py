@@ -5,7 +5,7 @@ from decimal import Decimal
 from enum import StrEnum
 from typing import Optional
 
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Index, Numeric, Text
+from sqlalchemy import BigInteger, String, Integer, DateTime, ForeignKey, Index, LargeBinary, Numeric, Text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -28,8 +28,9 @@ class PaymentStatus(StrEnum):
     PENDING = "PENDING"
     CONFIRMED = "CONFIRMED"
     PARTIAL = "PARTIAL"
-    TIMEOUT = "TIMEOUT"
+    TIMEOUT = "TIMEOUT"        # пришло после окончательного срока заказа — к возврату
     REFUNDED = "REFUNDED"
+    EXCESS = "EXCESS"          # лишний перевод по уже оплаченному/закрытому заказу — к возврату
 
 
 class User(Base):
@@ -88,13 +89,135 @@ class Payment(Base):
     # Хеш транзакции (ton tx hash / lt+hash)
     tx_hash: Mapped[Optional[str]] = mapped_column(String(128), nullable=True, unique=True)
 
-    # Сырые данные провайдера (TonAPI/TonCenter)
-    raw: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Сырые данные провайдера (TonAPI/TonCenter): JSON, сжатый zlib (services/archive.pack_raw)
+    raw: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class UnmatchedPayment(Base):
+    """Входящий перевод, который не удалось отнести ни к одному заказу: нет/чужой комментарий, неизвестный ключ."""
+    __tablename__ = "unmatched_payments"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    amount_ton: Mapped[Decimal] = mapped_column(Numeric(20, 9))
+    comment: Mapped[str] = mapped_column(String(128))
+    sender: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    tx_hash: Mapped[str] = mapped_column(String(128), unique=True)
+    raw: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
+class SyncCursor(Base):
+    """Курсор синхронизации с внешним источником (например, lt последней обработанной транзакции кошелька)."""
+    __tablename__ = "sync_cursors"
+
+    name: Mapped[str] = mapped_column(String(128), primary_key=True)
+    lt: Mapped[int] = mapped_column(BigInteger, default=0)
+    tx_hash: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Lease(Base):
+    """Аренда роли (лидерство среди процессов): кто держит и до какого момента."""
+    __tablename__ = "leases"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(128))
+    expires_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+class FsmState(Base):
+    """Состояние FSM aiogram по ключу (бот/чат/пользователь/...)."""
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class FsmData(Base):
+    """Данные FSM aiogram (JSON) по тому же ключу."""
+    __tablename__ = "fsm_data"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    data: Mapped[str] = mapped_column(Text, default="{}")
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class JobStatus(StrEnum):
+    PENDING = "PENDING"      # ждёт воркера (или повтора после next_run_at)
+    RUNNING = "RUNNING"      # взята воркером до locked_until
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+class FulfillmentJob(Base):
+    """Задание на доставку звёзд по оплаченному заказу (durable-очередь; одно на заказ)."""
+    __tablename__ = "fulfillment_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id", ondelete="CASCADE"), unique=True)
+    status: Mapped[str] = mapped_column(String(16), default=JobStatus.PENDING)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_run_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # Покупка уже отправлена во Fragment (повтор сначала ищет её в истории, а не покупает заново)
+    submitted_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    fragment_ref: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# ---------- Архив: завершённые заказы старше ARCHIVE_AFTER_DAYS (services/archive.py) ----------
+class OrderArchive(Base):
+    """Копия завершённого заказа (GIFT_SENT / CANCELED / EXPIRED), вынесенная из горячей таблицы."""
+    __tablename__ = "orders_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # тот же id, что был в orders
+    order_key: Mapped[str] = mapped_column(String(64), unique=True)
+    user_id: Mapped[int] = mapped_column(Integer, index=True)
+    username: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    quantity: Mapped[int] = mapped_column(Integer)
+    price_fragment_ton: Mapped[Optional[Decimal]] = mapped_column(Numeric(20, 9), nullable=True)
+    price_out_ton: Mapped[Optional[Decimal]] = mapped_column(Numeric(20, 9), nullable=True)
+    status: Mapped[str] = mapped_column(String(32))
+    fragment_ref: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class PaymentArchive(Base):
+    """Платёж архивного заказа; raw — сжатый JSON провайдера."""
+    __tablename__ = "payments_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    order_id: Mapped[int] = mapped_column(Integer, index=True)
+    status: Mapped[str] = mapped_column(String(16))
+    amount_ton: Mapped[Decimal] = mapped_column(Numeric(20, 9))
+    comment: Mapped[str] = mapped_column(String(128))
+    tx_hash: Mapped[Optional[str]] = mapped_column(String(128), nullable=True, unique=True)
+    raw: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+class SchemaVersion(Base):
+    """Отпечаток схемы, с которой последний раз запускался init_db (одна строка, id=1)."""
+    __tablename__ = "schema_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64))
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 # Полезные индексы
 Index("ix_orders_status_created", Order.status, Order.created_at)
 Index("ix_payments_status_created", Payment.status, Payment.created_at)
+Index("ix_fulfillment_jobs_status_next", FulfillmentJob.status, FulfillmentJob.next_run_at)
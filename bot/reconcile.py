@@ -0,0 +1,196 @@
+"""
+Сверка истории кошелька после простоя бота или провайдера:
+
+    python -m bot.reconcile --since 2024-05-01T10:00   # UTC
+    python -m bot.reconcile --since 6h                 # или 90m / 2d назад
+    python -m bot.reconcile                            # продолжить прерванный запуск
+
+Транзакции идут страницами по возрастанию lt (async-генератор iter_incoming) и
+сверяются пачками: на пачку — несколько запросов к БД, а не по запросу на транзакцию,
+в памяти не больше одной пачки. Курсор reconcile:<адрес> двигается в той же транзакции,
+что и платежи. Повторный проход ничего не дублирует: записанные tx_hash пропускаются,
+а UNIQUE(tx_hash) страхует от гонки с работающим наблюдателем. Переводы без заказа
+попадают в unmatched_payments, лишние и опоздавшие — в payments как EXCESS/TIMEOUT.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from .config import settings
+from .models import SyncCursor
+from .services.matching import plan_closed
+from .services.ton_api import IncomingTx, TonProvider, iter_incoming
+from .services.watcher import record_transfers, seen_tx_hashes
+from .storage import dispose_engines, init_db, session_scope, upsert
+
+log = logging.getLogger(__name__)
+
+_RELATIVE = re.compile(r"^(\d+)([mhd])$")
+_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_since(value: str, now: Optional[datetime] = None) -> datetime:
+    """«6h» / «2d» / «90m» назад или ISO-дата; результат — наивный UTC, как в БД."""
+    m = _RELATIVE.match(value.strip())
+    if m:
+        now = now or datetime.utcnow()
+        return now - timedelta(**{_UNITS[m.group(2)]: int(m.group(1))})
+    dt = datetime.fromisoformat(value.strip())
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _utime(dt: datetime) -> int:
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+@dataclass(slots=True)
+class ReconcileStats:
+    scanned: int = 0
+    recorded: int = 0
+    paid: int = 0
+    batches: int = 0
+
+
+class Reconciler:
+    """
+    Догоняет платежи по истории кошелька. В отличие от PaymentWatcher, сверяет и с заказами,
+    которые успели истечь за время простоя: перевод, пришедший до окончательного срока
+    (created_at + PAYMENT_TIMEOUT_SEC), засчитывается, и такой заказ становится PAID.
+
+    Индекс открытых заказов работающего бота об этом не знает — «Проверить оплату» и
+    доставка всё равно читают статус из БД.
+    """
+
+    def __init__(
+        self,
+        provider: TonProvider,
+        address: str,
+        *,
+        payment_timeout: float,
+        batch_size: int = 500,
+        page_limit: int = 100,
+    ) -> None:
+        self.provider = provider
+        self.address = address
+        self.payment_timeout = timedelta(seconds=payment_timeout)
+        self.batch_size = batch_size
+        self.page_limit = page_limit
+        self.cursor_name = f"reconcile:{address}"
+
+    async def start_lt(self, since: Optional[datetime]) -> Optional[int]:
+        """lt, после которого начинаем: от --since или с сохранённого курсора (None — курсора нет)."""
+        if since is not None:
+            return await self.provider.lt_at(self.address, _utime(since))
+        async with session_scope() as session:
+            cursor = await session.get(SyncCursor, self.cursor_name)
+            return cursor.lt if cursor is not None else None
+
+    async def _batches(self, after_lt: int) -> AsyncIterator[tuple[list[IncomingTx], int]]:
+        """Страницы истории, склеенные в пачки по batch_size транзакций: (пачка, lt конца пачки)."""
+        batch: list[IncomingTx] = []
+        last_lt = after_lt
+        async for page in iter_incoming(self.provider, self.address, after_lt, self.page_limit):
+            batch.extend(page.txs)
+            last_lt = page.last_lt
+            if len(batch) >= self.batch_size:
+                yield batch, last_lt
+                batch = []
+        if batch or last_lt > after_lt:
+            yield batch, last_lt
+
+    async def _apply(self, txs: list[IncomingTx], last_lt: int) -> tuple[int, int]:
+        """Одна пачка — одна транзакция БД. Возвращает (записано платежей, оплачено заказов)."""
+        recorded = paid = 0
+        async with session_scope() as session:
+            seen = await seen_tx_hashes(session, [tx.tx_hash for tx in txs])
+            fresh = [tx for tx in txs if tx.tx_hash not in seen]
+            if fresh:
+                settlements, unmatched = await plan_closed(session, fresh, payment_timeout=self.payment_timeout)
+                paid = len(await record_transfers(session, settlements, unmatched))
+                recorded = len(settlements)
+            await upsert(
+                session, SyncCursor,
+                [{"name": self.cursor_name, "lt": last_lt, "tx_hash": txs[-1].tx_hash if txs else None,
+                  "updated_at": datetime.utcnow()}],
+                index_elements=["name"],
+                update_columns=["lt", "tx_hash", "updated_at"],
+            )
+        return recorded, paid
+
+    async def run(self, after_lt: int) -> ReconcileStats:
+        stats = ReconcileStats()
+        async for txs, last_lt in self._batches(after_lt):
+            try:
+                recorded, paid = await self._apply(txs, last_lt)
+            except IntegrityError:
+                # Наблюдатель успел записать ту же транзакцию — повтор её просто пропустит.
+                recorded, paid = await self._apply(txs, last_lt)
+            stats.scanned += len(txs)
+            stats.recorded += recorded
+            stats.paid += paid
+            stats.batches += 1
+            log.info("reconcile: up to lt %d, %d payment(s) recorded so far", last_lt, stats.recorded)
+        return stats
+
+
+async def _run(args: argparse.Namespace) -> int:
+    from .services.ton_client import build_ton_client
+
+    since = parse_since(args.since) if args.since else None
+    await init_db()
+    provider = build_ton_client()
+    if provider is None:
+        print("❌ TON_API_PROVIDER=none — сверять не с чем.")
+        return 2
+    try:
+        reconciler = Reconciler(
+            provider,
+            settings.TON_WALLET_ADDRESS,
+            payment_timeout=settings.PAYMENT_TIMEOUT_SEC,
+            batch_size=args.batch,
+            page_limit=args.page,
+        )
+        after_lt = await reconciler.start_lt(since)
+        if after_lt is None:
+            print("❌ Сохранённого курсора нет — укажите --since.")
+            return 2
+        print(f"⏳ Сверка {settings.TON_WALLET_ADDRESS} после lt {after_lt} ({provider.name})…")
+        stats = await reconciler.run(after_lt)
+        print(
+            f"✅ Сверка завершена: транзакций {stats.scanned}, записано платежей {stats.recorded}, "
+            f"оплачено заказов {stats.paid}."
+        )
+        return 0
+    finally:
+        await provider.aclose()
+        await dispose_engines()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m bot.reconcile", description="Сверка входящих платежей по истории кошелька"
+    )
+    parser.add_argument(
+        "--since",
+        help="откуда начать: ISO-дата в UTC (2024-05-01T10:00) или 90m / 6h / 2d назад; "
+             "без флага — продолжить с сохранённого курсора",
+    )
+    parser.add_argument("--batch", type=int, default=500, help="транзакций на одну транзакцию БД")
+    parser.add_argument("--page", type=int, default=100, help="размер страницы запроса к провайдеру")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
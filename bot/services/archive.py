@@ -0,0 +1,125 @@
+# bot/services/archive.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Optional, Union
+
+from sqlalchemy import delete, insert, literal, select
+
+from ..config import settings
+from ..models import FulfillmentJob, Order, OrderArchive, OrderStatus, Payment, PaymentArchive
+from ..storage import session_scope
+
+log = logging.getLogger(__name__)
+
+# Заказы в этих статусах больше не меняются — их можно выносить из горячих таблиц.
+TERMINAL = (OrderStatus.GIFT_SENT, OrderStatus.CANCELED, OrderStatus.EXPIRED)
+
+
+# ---------- сырые ответы провайдера ----------
+def pack_raw(raw: Optional[dict[str, Any]]) -> Optional[bytes]:
+    """JSON провайдера → компактный zlib-блоб (ответы toncenter/tonapi сжимаются в 3–5 раз)."""
+    if not raw:
+        return None
+    return zlib.compress(json.dumps(raw, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def unpack_raw(blob: Union[bytes, str, None]) -> Optional[dict[str, Any]]:
+    """Обратное к pack_raw; понимает и старые строки, где raw лежал несжатым текстом."""
+    if not blob:
+        return None
+    if isinstance(blob, bytes):
+        try:
+            blob = zlib.decompress(blob)
+        except zlib.error:
+            pass
+        blob = blob.decode("utf-8")
+    return json.loads(blob)
+
+
+class Archiver:
+    """
+    Выносит завершённые заказы старше retention_days вместе с платежами в orders_archive /
+    payments_archive и удаляет их из горячих таблиц. Так orders/payments и индексы
+    ix_orders_status_created / ix_payments_status_created содержат в основном открытые
+    заказы и остаются в кеше, сколько бы заказов ни накопилось за всё время.
+
+    Пачка из batch_size заказов — одна транзакция: копия и удаление атомарны,
+    прерванный проход просто продолжится со следующего запуска.
+    """
+
+    def __init__(self, *, retention_days: float, batch_size: int = 500, interval: float = 3600.0) -> None:
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.interval = interval
+
+    async def archive_batch(self, now: Optional[datetime] = None) -> int:
+        """Перенести одну пачку. Возвращает число перенесённых заказов (0 — переносить нечего)."""
+        now = now or datetime.utcnow()
+        async with session_scope() as session:
+            ids = list((await session.scalars(
+                select(Order.id)
+                .where(Order.status.in_(TERMINAL), Order.created_at < now - self.retention)
+                .limit(self.batch_size)
+            )).all())
+            if not ids:
+                return 0
+            await session.execute(
+                insert(OrderArchive).from_select(
+                    [
+                        "id", "order_key", "user_id", "username", "quantity", "price_fragment_ton",
+                        "price_out_ton", "status", "fragment_ref", "created_at", "updated_at", "archived_at",
+                    ],
+                    select(
+                        Order.id, Order.order_key, Order.user_id, Order.username, Order.quantity,
+                        Order.price_fragment_ton, Order.price_out_ton, Order.status,
+                        FulfillmentJob.fragment_ref, Order.created_at, Order.updated_at, literal(now),
+                    )
+                    .outerjoin(FulfillmentJob, FulfillmentJob.order_id == Order.id)
+                    .where(Order.id.in_(ids)),
+                )
+            )
+            await session.execute(
+                insert(PaymentArchive).from_select(
+                    ["id", "order_id", "status", "amount_ton", "comment", "tx_hash", "raw", "created_at", "updated_at"],
+                    select(
+                        Payment.id, Payment.order_id, Payment.status, Payment.amount_ton, Payment.comment,
+                        Payment.tx_hash, Payment.raw, Payment.created_at, Payment.updated_at,
+                    ).where(Payment.order_id.in_(ids)),
+                )
+            )
+            await session.execute(delete(Payment).where(Payment.order_id.in_(ids)))
+            await session.execute(delete(FulfillmentJob).where(FulfillmentJob.order_id.in_(ids)))
+            await session.execute(delete(Order).where(Order.id.in_(ids)))
+        return len(ids)
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        total = 0
+        while True:
+            n = await self.archive_batch(now)
+            total += n
+            if n < self.batch_size:
+                return total
+            await asyncio.sleep(0)  # между пачками отдаём цикл и писателя БД остальным
+
+    async def run(self) -> None:
+        while True:
+            try:
+                n = await self.run_once()
+                if n:
+                    log.info("archive: moved %d order(s) to archive", n)
+            except Exception:
+                log.exception("archive: pass failed")
+            await asyncio.sleep(self.interval)
+
+
+def build_archiver() -> Archiver:
+    return Archiver(
+        retention_days=settings.ARCHIVE_AFTER_DAYS,
+        batch_size=settings.ARCHIVE_BATCH_SIZE,
+        interval=settings.ARCHIVE_INTERVAL_SEC,
+    )
@@ -0,0 +1,169 @@
+# bot/services/expiry.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Protocol
+
+from sqlalchemy import exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..i18n import t
+from ..models import Order, OrderStatus, Payment, PaymentStatus, User
+from ..storage import session_scope
+from .matching import PaymentIndex, payment_index
+
+log = logging.getLogger(__name__)
+
+
+class NotifySink(Protocol):
+    def submit(self, chat_id: int, text: str) -> bool: ...
+
+
+class ExpiryScheduler:
+    """
+    Сроки открытых заказов в куче (deadline, order_id): тик достаёт только то, что наступило,
+    и закрывает всё одним UPDATE — стоимость пропорциональна числу истекающих заказов,
+    а не размеру таблицы orders.
+
+    Два срока:
+      - ORDER_TTL_SEC от создания — заказ без единой оплаты переходит в EXPIRED;
+      - PAYMENT_TIMEOUT_SEC — для заказа с частичной оплатой ждём доплату дольше,
+        потом заказ EXPIRED, а его платежи PENDING/PARTIAL — TIMEOUT.
+
+    Оплаченные заказы из кучи не вынимаем: UPDATE с условием на WAITING_PAYMENT их
+    просто не тронет (ленивое удаление). Заказы из других процессов подтягиваются
+    по ix_orders_status_created с водяной отметкой, как в PaymentIndex.sync_recent.
+    """
+
+    def __init__(
+        self,
+        *,
+        order_ttl: float,
+        payment_timeout: float,
+        notifier: Optional[NotifySink] = None,
+        index: PaymentIndex = payment_index,
+        interval: float = 1.0,
+        overlap: float = 30.0,
+    ) -> None:
+        self.order_ttl = timedelta(seconds=order_ttl)
+        self.payment_timeout = timedelta(seconds=max(payment_timeout, order_ttl))
+        self.notifier = notifier
+        self.index = index
+        self.interval = interval
+        self.overlap = timedelta(seconds=overlap)
+        # (deadline, order_id, final): final=False — срок без оплат, True — окончательный
+        self._heap: list[tuple[datetime, int, bool]] = []
+        self._known: set[int] = set()
+        self._synced_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, order_id: int, created_at: datetime) -> None:
+        if order_id in self._known:
+            return
+        self._known.add(order_id)
+        heapq.heappush(self._heap, (created_at + self.order_ttl, order_id, False))
+
+    def next_deadline(self) -> Optional[datetime]:
+        return self._heap[0][0] if self._heap else None
+
+    # ---------- загрузка сроков ----------
+    async def sync(self, session: AsyncSession) -> int:
+        """Подтянуть открытые заказы: при первом вызове все, дальше только созданные с прошлой синхронизации."""
+        q = select(Order.id, Order.created_at).where(Order.status == OrderStatus.WAITING_PAYMENT)
+        if self._synced_at is not None:
+            q = q.where(Order.created_at >= self._synced_at - self.overlap)
+        self._synced_at = datetime.utcnow()
+        before = len(self._known)
+        for order_id, created_at in await session.execute(q):
+            self.schedule(order_id, created_at)
+        return len(self._known) - before
+
+    def _pop_due(self, now: datetime) -> tuple[list[int], list[int]]:
+        soft: list[int] = []
+        final: list[int] = []
+        while self._heap and self._heap[0][0] <= now:
+            _, order_id, is_final = heapq.heappop(self._heap)
+            (final if is_final else soft).append(order_id)
+        return soft, final
+
+    # ---------- тик ----------
+    async def tick(self, now: Optional[datetime] = None) -> int:
+        """Закрыть наступившие заказы. Возвращает число переведённых в EXPIRED."""
+        now = now or datetime.utcnow()
+        async with session_scope() as session:
+            await self.sync(session)
+            soft, final = self._pop_due(now)
+            if not soft and not final:
+                return 0
+
+            has_payment = exists().where(Payment.order_id == Order.id)
+            due = Order.id.in_(final)
+            if soft:
+                due = due | (Order.id.in_(soft) & ~has_payment)
+            expired = list((await session.scalars(
+                update(Order)
+                .where(Order.status == OrderStatus.WAITING_PAYMENT, due)
+                .values(status=OrderStatus.EXPIRED)
+                .returning(Order.id)
+            )).all())
+
+            # Частично оплаченные заказы ждут доплату до окончательного срока.
+            waiting = set(soft) - set(expired)
+            if waiting:
+                rows = await session.execute(
+                    select(Order.id, Order.created_at)
+                    .where(Order.id.in_(waiting), Order.status == OrderStatus.WAITING_PAYMENT)
+                )
+                for order_id, created_at in rows:
+                    heapq.heappush(self._heap, (created_at + self.payment_timeout, order_id, True))
+                    waiting.discard(order_id)
+            self._known.difference_update(waiting)
+            self._known.difference_update(final)
+            if not expired:
+                return 0
+
+            await session.execute(
+                update(Payment)
+                .where(
+                    Payment.order_id.in_(expired),
+                    Payment.status.in_([PaymentStatus.PENDING, PaymentStatus.PARTIAL]),
+                )
+                .values(status=PaymentStatus.TIMEOUT)
+            )
+            recipients = (await session.execute(
+                select(Order.order_key, User.tg_user_id, User.language)
+                .join(User, User.id == Order.user_id)
+                .where(Order.id.in_(expired))
+            )).all()
+
+        self._known.difference_update(expired)
+        for key, tg_user_id, lang in recipients:
+            self.index.discard(key)
+            if self.notifier is not None:
+                self.notifier.submit(tg_user_id, t(lang, "order_expired", key=key))
+        return len(expired)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                n = await self.tick()
+                if n:
+                    log.info("expiry: %d order(s) expired", n)
+            except Exception:
+                log.exception("expiry: tick failed")
+            await asyncio.sleep(self.interval)
+
+
+def build_expiry(notifier: Optional[NotifySink] = None) -> ExpiryScheduler:
+    return ExpiryScheduler(
+        order_ttl=settings.ORDER_TTL_SEC,
+        payment_timeout=settings.PAYMENT_TIMEOUT_SEC,
+        notifier=notifier,
+        interval=settings.EXPIRY_TICK_SEC,
+    )
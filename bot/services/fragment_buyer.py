@@ -0,0 +1,220 @@
+# bot/services/fragment_buyer.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
+from playwright.async_api import Error as PlaywrightError
+
+from ..config import settings
+from .fulfillment import FulfillmentError, GiftRequest, OnSubmit, PermanentFulfillmentError
+
+log = logging.getLogger(__name__)
+
+
+def load_cookies(path: str) -> list[dict]:
+    """Cookies из FRAGMENT_AUTH_COOKIES_PATH: список cookies или storage_state ({"cookies": [...]})."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("cookies", []) if isinstance(data, dict) else list(data)
+
+
+@dataclass(eq=False)
+class _Slot:
+    context: BrowserContext
+    page: Page
+    jobs: int = field(default=0)
+    stale: bool = field(default=False)  # пересоздать при следующей выдаче
+
+
+class BrowserPool:
+    """
+    Один живой Chromium и size заранее авторизованных контекстов (cookies Fragment),
+    у каждого — открытая и прогретая страница. Контекст пересоздаётся после recycle_after
+    заданий или после ошибки: так не копятся утечки памяти и «залипшие» состояния страницы.
+    Пересоздание ленивое — при следующей выдаче слота, а не в finally задания: отменённое
+    по таймауту задание завершается сразу и не оставляет в пуле наполовину закрытый контекст.
+    """
+
+    def __init__(
+        self,
+        *,
+        size: int,
+        base_url: str,
+        cookies: list[dict],
+        recycle_after: int = 50,
+        headless: bool = True,
+        slow_mo: float = 0,
+    ) -> None:
+        self.size = size
+        self.base_url = base_url.rstrip("/")
+        self.cookies = cookies
+        self.recycle_after = recycle_after
+        self.headless = headless
+        self.slow_mo = slow_mo
+        self._pw: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        self._idle: asyncio.Queue[_Slot] = asyncio.Queue()
+        self.created = 0
+
+    async def start(self) -> None:
+        self._pw = await async_playwright().start()
+        self._browser = await self._pw.chromium.launch(headless=self.headless, slow_mo=self.slow_mo)
+        slots = await asyncio.gather(*(self._new_slot() for _ in range(self.size)))
+        for slot in slots:
+            self._idle.put_nowait(slot)
+
+    async def _new_slot(self) -> _Slot:
+        context = await self._browser.new_context()
+        try:
+            if self.cookies:
+                await context.add_cookies(self.cookies)
+            page = await context.new_page()
+            # Прогрев: DNS/TLS/кеш статики и проверка, что сессия жива — до первого заказа.
+            await page.goto(self.base_url, wait_until="domcontentloaded")
+        except BaseException:
+            await context.close()
+            raise
+        self.created += 1
+        return _Slot(context, page)
+
+    async def _recycle(self, slot: _Slot) -> _Slot:
+        try:
+            await slot.context.close()
+        except PlaywrightError:
+            pass
+        return await self._new_slot()
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        slot = await self._idle.get()
+        if slot.stale:
+            try:
+                slot = await self._recycle(slot)
+            except BaseException:
+                # Слот остаётся помеченным: пересоздадим при следующей выдаче.
+                log.warning("browser pool: failed to recycle context", exc_info=True)
+                self._idle.put_nowait(slot)
+                raise
+        try:
+            yield slot.page
+        except BaseException:
+            slot.stale = True
+            raise
+        finally:
+            slot.jobs += 1
+            if slot.jobs >= self.recycle_after:
+                slot.stale = True
+            # Слот возвращается сразу, без await: отмена задания не может его потерять.
+            self._idle.put_nowait(slot)
+
+    async def aclose(self) -> None:
+        while not self._idle.empty():
+            slot = self._idle.get_nowait()
+            try:
+                await slot.context.close()
+            except PlaywrightError:
+                pass
+        if self._browser is not None:
+            await self._browser.close()
+        if self._pw is not None:
+            await self._pw.stop()
+
+
+class FragmentBuyer:
+    """
+    Сценарий покупки звёзд на странице Fragment: получатель → количество → купить → подтвердить.
+    Селекторы собраны здесь, чтобы правка вёрстки Fragment трогала одно место.
+    """
+
+    BUY_PATH = "/stars/buy"
+    HISTORY_PATH = "/my/history"
+    RECIPIENT = "input[name=recipient]"
+    QUANTITY = "input[name=quantity]"
+    BUY_BUTTON = "button.js-buy-stars"
+    CONFIRM_BUTTON = "button.js-confirm"
+    RESULT = ".js-purchase-result"
+    ERROR = ".js-purchase-error"
+    HISTORY_ITEM = ".js-history-item"
+
+    def __init__(self, base_url: str, *, step_timeout: float = 30.0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.step_timeout_ms = step_timeout * 1000
+
+    async def lookup(self, page: Page, req: GiftRequest) -> Optional[str]:
+        """
+        Покупка для этого получателя и количества уже есть в истории — вернуть её ref.
+        Берём самую свежую, которая не засчитана другому заказу (req.taken_refs).
+        """
+        await page.goto(self.base_url + self.HISTORY_PATH, wait_until="domcontentloaded")
+        items = page.locator(
+            f'{self.HISTORY_ITEM}[data-recipient="{req.recipient}"][data-quantity="{req.quantity}"]'
+        )
+        refs = await items.evaluate_all("els => els.map(e => e.dataset.ref)")
+        for ref in reversed(refs):
+            if ref and ref not in req.taken_refs:
+                return ref
+        return None
+
+    async def buy(self, page: Page, req: GiftRequest, on_submit: OnSubmit) -> str:
+        await page.goto(self.base_url + self.BUY_PATH, wait_until="domcontentloaded")
+        await page.fill(self.RECIPIENT, req.recipient, timeout=self.step_timeout_ms)
+        await page.fill(self.QUANTITY, str(req.quantity), timeout=self.step_timeout_ms)
+        await page.click(self.BUY_BUTTON, timeout=self.step_timeout_ms)
+        confirm = page.locator(self.CONFIRM_BUTTON)
+        await confirm.wait_for(timeout=self.step_timeout_ms)
+        await on_submit()
+        await confirm.click(timeout=self.step_timeout_ms)
+
+        done = page.locator(f"{self.RESULT}, {self.ERROR}")
+        await done.first.wait_for(timeout=self.step_timeout_ms)
+        error = page.locator(self.ERROR)
+        if await error.count():
+            raise PermanentFulfillmentError((await error.first.inner_text()).strip())
+        ref = await page.locator(self.RESULT).first.get_attribute("data-ref")
+        if not ref:
+            raise FulfillmentError("no purchase reference on result page")
+        return ref
+
+
+class PlaywrightDeliverer:
+    """Deliverer для FulfillmentQueue: тёплая страница из пула + сценарий FragmentBuyer."""
+
+    def __init__(self, pool: BrowserPool, buyer: FragmentBuyer) -> None:
+        self.pool = pool
+        self.buyer = buyer
+
+    async def deliver(self, req: GiftRequest, *, submitted: bool, on_submit: OnSubmit) -> str:
+        try:
+            async with self.pool.page() as page:
+                if submitted:
+                    ref = await self.buyer.lookup(page, req)
+                    if ref:
+                        return ref
+                return await self.buyer.buy(page, req, on_submit)
+        except PlaywrightError as e:
+            raise FulfillmentError(str(e)) from e
+
+    async def aclose(self) -> None:
+        await self.pool.aclose()
+
+
+async def build_deliverer() -> PlaywrightDeliverer:
+    pool = BrowserPool(
+        size=settings.FULFILLMENT_CONCURRENCY,
+        base_url=settings.FRAGMENT_BASE_URL,
+        cookies=load_cookies(settings.FRAGMENT_AUTH_COOKIES_PATH),
+        recycle_after=settings.FULFILLMENT_CONTEXT_RECYCLE_JOBS,
+        headless=settings.PLAYWRIGHT_HEADLESS,
+        slow_mo=settings.PLAYWRIGHT_SLOWMO_MS,
+    )
+    await pool.start()
+    return PlaywrightDeliverer(pool, FragmentBuyer(settings.FRAGMENT_BASE_URL))
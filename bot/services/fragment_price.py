@@ -0,0 +1,181 @@
+# bot/services/fragment_price.py
+from __future__ import annotations
+
+import json
+import logging
+import re
+from decimal import Decimal
+from typing import Any, Optional, Union
+
+import httpx
+
+from .price_oracle import PriceSourceError, parse_price
+
+log = logging.getLogger(__name__)
+
+FRAGMENT_BASE_URL = "https://fragment.com"
+STARS_PAGE = "/stars/buy"
+
+_BUILD_ID_RE = re.compile(r'"buildId"\s*:\s*"([a-zA-Z0-9\-_]+)"')
+_NEXT_DATA_RE = re.compile(
+    r'<script id="__NEXT_DATA__" type="application/json">([\s\S]*?)</script>', re.IGNORECASE
+)
+_PRICE_KEY_HINTS = ("price", "rate", "cost")
+
+JsonPath = tuple[Union[str, int], ...]
+
+_BROWSER_HEADERS = {
+    "user-agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+    ),
+    "accept-language": "en-US,en;q=0.9,ru;q=0.8",
+}
+
+
+def find_price_path(obj: Any, path: JsonPath = ()) -> Optional[JsonPath]:
+    """
+    Обход JSON в глубину: первый числовой ключ с "price"/"rate"/"cost" в правдоподобном
+    диапазоне (0 < v < 1 TON за звезду). Возвращает путь до него.
+    """
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return None
+    for k, v in items:
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            key = str(k).lower()
+            if any(h in key for h in _PRICE_KEY_HINTS) and 0 < v < 1:
+                return path + (k,)
+        elif isinstance(v, (dict, list)):
+            found = find_price_path(v, path + (k,))
+            if found is not None:
+                return found
+    return None
+
+
+def get_by_path(obj: Any, path: JsonPath) -> Any:
+    for part in path:
+        obj = obj[part]
+    return obj
+
+
+class FragmentPriceSource:
+    """
+    Цена звезды напрямую с fragment.com (бывший web/api/price.js).
+
+    Раньше каждый запрос тянул HTML страницы ради buildId, затем JSON Next.js и обходил его целиком.
+    Здесь:
+    - buildId кешируется; HTML перечитывается, только если data-роут ответил 404 (новый деплой);
+    - путь до поля цены запоминается после первого обхода;
+    - запрос к data-роуту условный (If-None-Match / If-Modified-Since) — на 304 отдаём прошлую цену;
+    - один keep-alive клиент httpx на всё время жизни.
+    """
+
+    def __init__(
+        self,
+        base_url: str = FRAGMENT_BASE_URL,
+        *,
+        timeout: float = 10.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=_BROWSER_HEADERS,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2, keepalive_expiry=120),
+            transport=transport,
+        )
+        self.build_id: Optional[str] = None
+        self.price_path: Optional[JsonPath] = None
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._last_price: Optional[Decimal] = None
+
+    # ---------- HTML ----------
+    async def _scrape_html(self) -> Optional[Decimal]:
+        """Перечитать страницу: обновить buildId; если его нет — попробовать inline __NEXT_DATA__."""
+        try:
+            rsp = await self._client.get(
+                STARS_PAGE, headers={"accept": "text/html", "cache-control": "no-cache"}
+            )
+        except httpx.HTTPError as e:
+            raise PriceSourceError(f"fragment html: {e!r}") from e
+        if rsp.status_code != 200:
+            raise PriceSourceError(f"fragment html: status {rsp.status_code}")
+
+        html = rsp.text
+        m = _BUILD_ID_RE.search(html)
+        self.build_id = m.group(1) if m else None
+        self._etag = self._last_modified = None
+        if self.build_id:
+            return None
+
+        inline = _NEXT_DATA_RE.search(html)
+        if inline:
+            try:
+                return self._extract(json.loads(inline.group(1)))
+            except ValueError:
+                pass
+        raise PriceSourceError("fragment html: neither buildId nor __NEXT_DATA__ price found")
+
+    # ---------- JSON ----------
+    def _extract(self, data: Any) -> Decimal:
+        if self.price_path is not None:
+            try:
+                return parse_price(get_by_path(data, self.price_path))
+            except (KeyError, IndexError, TypeError, PriceSourceError):
+                self.price_path = None  # структура поменялась — ищем заново
+        path = find_price_path(data)
+        if path is None:
+            raise PriceSourceError("fragment json: price field not found")
+        self.price_path = path
+        return parse_price(get_by_path(data, path))
+
+    async def _fetch_data(self) -> httpx.Response:
+        headers = {"accept": "application/json", "referer": f"{FRAGMENT_BASE_URL}{STARS_PAGE}"}
+        if self._etag:
+            headers["if-none-match"] = self._etag
+        if self._last_modified:
+            headers["if-modified-since"] = self._last_modified
+        try:
+            return await self._client.get(f"/_next/data/{self.build_id}{STARS_PAGE}.json", headers=headers)
+        except httpx.HTTPError as e:
+            raise PriceSourceError(f"fragment json: {e!r}") from e
+
+    async def __call__(self) -> Decimal:
+        if self.build_id is None:
+            price = await self._scrape_html()
+            if price is not None:
+                self._last_price = price
+                return price
+
+        rsp = await self._fetch_data()
+        if rsp.status_code == 404:
+            # buildId протух после деплоя Fragment — один раз перечитываем HTML
+            log.info("fragment price: buildId %s is gone, re-scraping", self.build_id)
+            price = await self._scrape_html()
+            if price is not None:
+                self._last_price = price
+                return price
+            rsp = await self._fetch_data()
+
+        if rsp.status_code == 304 and self._last_price is not None:
+            return self._last_price
+        if rsp.status_code != 200:
+            raise PriceSourceError(f"fragment json: status {rsp.status_code}")
+
+        try:
+            data = rsp.json()
+        except ValueError as e:
+            raise PriceSourceError("fragment json: invalid body") from e
+        price = self._extract(data)
+        self._etag = rsp.headers.get("etag")
+        self._last_modified = rsp.headers.get("last-modified")
+        self._last_price = price
+        return price
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
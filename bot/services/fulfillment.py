@@ -0,0 +1,308 @@
+# bot/services/fulfillment.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Protocol
+
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..i18n import t
+from ..metrics import QUEUE_DEPTH
+from ..models import FulfillmentJob, JobStatus, Order, OrderStatus, User
+from ..storage import session_scope
+
+log = logging.getLogger(__name__)
+
+
+class FulfillmentError(RuntimeError):
+    """Доставка не удалась, но повтор может помочь (таймаут, сбой страницы, сеть)."""
+
+
+class PermanentFulfillmentError(FulfillmentError):
+    """Повторять бессмысленно (нет получателя, Fragment отказал по существу)."""
+
+
+@dataclass(frozen=True, slots=True)
+class GiftRequest:
+    order_id: int
+    order_key: str
+    recipient: str      # username получателя без @
+    quantity: int
+    # ref покупок, уже засчитанных другим заказам: повтор не должен принять их за свою
+    taken_refs: frozenset[str] = frozenset()
+
+
+OnSubmit = Callable[[], Awaitable[None]]
+
+
+class Deliverer(Protocol):
+    async def deliver(self, req: GiftRequest, *, submitted: bool, on_submit: OnSubmit) -> str:
+        """
+        Отправить звёзды и вернуть ссылку/ид операции во Fragment.
+        submitted=True — прошлая попытка уже нажала «купить»: сначала ищем покупку в истории
+        (кроме req.taken_refs — это покупки других заказов).
+        on_submit() вызывается прямо перед необратимым шагом.
+        """
+        ...
+
+
+@dataclass(frozen=True, slots=True)
+class _Claimed:
+    job_id: int
+    submitted: bool
+    req: GiftRequest
+    tg_user_id: int
+    lang: str
+
+
+async def enqueue_paid(session: AsyncSession, order_ids: list[int]) -> None:
+    """Поставить оплаченные заказы в очередь доставки (в транзакции вызывающего; дубли игнорируются)."""
+    if not order_ids:
+        return
+    known = set((await session.scalars(
+        select(FulfillmentJob.order_id).where(FulfillmentJob.order_id.in_(order_ids))
+    )).all())
+    new = [{"order_id": oid} for oid in order_ids if oid not in known]
+    if new:
+        await session.execute(insert(FulfillmentJob), new)
+
+
+class FulfillmentQueue:
+    """
+    Durable-очередь доставки PAID → GIFT_SENT поверх таблицы fulfillment_jobs.
+
+    - не больше concurrency заданий одновременно, у каждого — свой таймаут;
+    - взятое задание арендуется до locked_until: упавший процесс не теряет его навсегда;
+    - ошибка → повтор с экспоненциальной паузой, после max_attempts — FAILED и заказ в ERROR;
+    - идемпотентность: перед необратимым шагом фиксируем submitted_at, и повтор такого
+      задания сначала ищет покупку во Fragment, а не покупает второй раз.
+    """
+
+    def __init__(
+        self,
+        deliverer: Deliverer,
+        *,
+        concurrency: int = 2,
+        job_timeout: float = 120.0,
+        max_attempts: int = 5,
+        retry_base: float = 30.0,
+        poll_interval: float = 2.0,
+        notifier=None,
+    ) -> None:
+        self.deliverer = deliverer
+        self.concurrency = concurrency
+        self.job_timeout = job_timeout
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.notifier = notifier
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    # ---------- очередь в БД ----------
+    async def recover(self) -> int:
+        """Старт: оплаченные заказы без задания — в очередь (например, оплачены до включения доставки)."""
+        async with session_scope() as session:
+            ids = list((await session.scalars(
+                select(Order.id)
+                .outerjoin(FulfillmentJob, FulfillmentJob.order_id == Order.id)
+                .where(Order.status == OrderStatus.PAID, FulfillmentJob.id.is_(None))
+            )).all())
+            await enqueue_paid(session, ids)
+        return len(ids)
+
+    async def claim(self, limit: int) -> list[_Claimed]:
+        now = datetime.utcnow()
+        ready = or_(
+            and_(FulfillmentJob.status == JobStatus.PENDING, FulfillmentJob.next_run_at <= now),
+            # аренда истекла — воркер, взявший задание, умер
+            and_(FulfillmentJob.status == JobStatus.RUNNING, FulfillmentJob.locked_until < now),
+        )
+        async with session_scope() as session:
+            ids = list((await session.scalars(
+                select(FulfillmentJob.id).where(ready).order_by(FulfillmentJob.next_run_at).limit(limit)
+            )).all())
+            if not ids:
+                return []
+            await session.execute(
+                update(FulfillmentJob)
+                .where(FulfillmentJob.id.in_(ids), ready)
+                .values(
+                    status=JobStatus.RUNNING,
+                    locked_until=now + timedelta(seconds=self.job_timeout * 2),
+                )
+            )
+            rows = await session.execute(
+                select(
+                    FulfillmentJob.id, FulfillmentJob.submitted_at,
+                    Order.id, Order.order_key, Order.username, Order.quantity,
+                    User.username, User.tg_user_id, User.language,
+                )
+                .join(Order, Order.id == FulfillmentJob.order_id)
+                .join(User, User.id == Order.user_id)
+                .where(FulfillmentJob.id.in_(ids), FulfillmentJob.status == JobStatus.RUNNING)
+            )
+            rows = rows.all()
+            # Повтор после «купить» ищет покупку в истории Fragment по получателю и количеству —
+            # у повторного покупателя там же лежат его прошлые заказы. Их ref исключаем.
+            taken: dict[int, set[str]] = {}
+            retry_qty = {qty for _, submitted_at, _, _, _, qty, *_ in rows if submitted_at is not None}
+            if retry_qty:
+                for qty, ref in await session.execute(
+                    select(Order.quantity, FulfillmentJob.fragment_ref)
+                    .join(Order, Order.id == FulfillmentJob.order_id)
+                    .where(FulfillmentJob.fragment_ref.is_not(None), Order.quantity.in_(retry_qty))
+                ):
+                    taken.setdefault(qty, set()).add(ref)
+            return [
+                _Claimed(
+                    job_id=job_id,
+                    submitted=submitted_at is not None,
+                    req=GiftRequest(
+                        order_id, key, (recipient or own or "").lstrip("@"), qty,
+                        frozenset(taken.get(qty, ())) if submitted_at is not None else frozenset(),
+                    ),
+                    tg_user_id=tg_user_id,
+                    lang=lang,
+                )
+                for job_id, submitted_at, order_id, key, recipient, qty, own, tg_user_id, lang in rows
+            ]
+
+    async def _mark_submitted(self, job_id: int) -> None:
+        async with session_scope() as session:
+            await session.execute(
+                update(FulfillmentJob).where(FulfillmentJob.id == job_id).values(submitted_at=datetime.utcnow())
+            )
+
+    async def _finish(self, job: _Claimed, ref: str) -> None:
+        async with session_scope() as session:
+            await session.execute(
+                update(FulfillmentJob)
+                .where(FulfillmentJob.id == job.job_id)
+                .values(status=JobStatus.DONE, fragment_ref=ref, locked_until=None, last_error=None)
+            )
+            await session.execute(
+                update(Order)
+                .where(Order.id == job.req.order_id, Order.status == OrderStatus.PAID)
+                .values(status=OrderStatus.GIFT_SENT)
+            )
+        if self.notifier is not None:
+            self.notifier.submit(job.tg_user_id, t(job.lang, "gift_sent", qty=job.req.quantity))
+
+    async def _fail(self, job: _Claimed, error: BaseException) -> None:
+        permanent = isinstance(error, PermanentFulfillmentError)
+        async with session_scope() as session:
+            attempts = await session.scalar(
+                select(FulfillmentJob.attempts).where(FulfillmentJob.id == job.job_id)
+            ) + 1
+            final = permanent or attempts >= self.max_attempts
+            delay = self.retry_base * 2 ** (attempts - 1)
+            await session.execute(
+                update(FulfillmentJob)
+                .where(FulfillmentJob.id == job.job_id)
+                .values(
+                    status=JobStatus.FAILED if final else JobStatus.PENDING,
+                    attempts=attempts,
+                    next_run_at=datetime.utcnow() + timedelta(seconds=delay),
+                    locked_until=None,
+                    last_error=repr(error)[:1000],
+                )
+            )
+            if final:
+                await session.execute(
+                    update(Order)
+                    .where(Order.id == job.req.order_id, Order.status == OrderStatus.PAID)
+                    .values(status=OrderStatus.ERROR)
+                )
+        if final:
+            log.error("fulfillment: order %s failed for good: %r", job.req.order_key, error)
+        else:
+            log.warning("fulfillment: order %s attempt %d failed: %r", job.req.order_key, attempts, error)
+
+    # ---------- выполнение ----------
+    async def _run_job(self, job: _Claimed) -> None:
+        try:
+            if not job.req.recipient:
+                raise PermanentFulfillmentError("no recipient username")
+            ref = await asyncio.wait_for(
+                self.deliverer.deliver(
+                    job.req,
+                    submitted=job.submitted,
+                    on_submit=lambda: self._mark_submitted(job.job_id),
+                ),
+                self.job_timeout,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = FulfillmentError(f"timed out after {self.job_timeout}s")
+            await self._fail(job, e)
+        else:
+            await self._finish(job, ref)
+        finally:
+            self._slots.release()
+
+    async def run_once(self) -> int:
+        """Взять столько заданий, сколько свободных слотов, и запустить их. Возвращает число запущенных."""
+        free = 0
+        while not self._slots.locked() and free < self.concurrency:
+            await self._slots.acquire()
+            free += 1
+        jobs = await self.claim(free) if free else []
+        for _ in range(free - len(jobs)):
+            self._slots.release()
+        for job in jobs:
+            task = asyncio.create_task(self._run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return len(jobs)
+
+    async def drain(self) -> None:
+        """Дождаться запущенных заданий (тесты, остановка)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def run(self) -> None:
+        await self.recover()
+        try:
+            while True:
+                try:
+                    await self.run_once()
+                except Exception:
+                    log.exception("fulfillment: claim failed")
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def run_fulfillment(notifier=None) -> None:
+    """Фоновая задача лидера: тёплый пул браузеров + очередь доставки."""
+    from .fragment_buyer import build_deliverer  # playwright — необязательная зависимость
+
+    deliverer = await build_deliverer()
+    try:
+        queue = FulfillmentQueue(
+            deliverer,
+            concurrency=settings.FULFILLMENT_CONCURRENCY,
+            job_timeout=settings.FULFILLMENT_JOB_TIMEOUT_SEC,
+            max_attempts=settings.FULFILLMENT_MAX_ATTEMPTS,
+            retry_base=settings.FULFILLMENT_RETRY_BASE_SEC,
+            notifier=notifier,
+        )
+        QUEUE_DEPTH.track(lambda: queue.running, "fulfillment_running")
+        print(f"✅ Доставка звёзд запущена ({settings.FULFILLMENT_CONCURRENCY} контекст(ов) браузера).")
+        await queue.run()
+    finally:
+        await deliverer.aclose()
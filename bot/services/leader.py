@@ -0,0 +1,94 @@
+# bot/services/leader.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from ..models import Lease
+from ..storage import session_scope
+
+log = logging.getLogger(__name__)
+
+
+def default_holder_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderLease:
+    """
+    Выбор лидера через строку в таблице leases: роль держит тот, кто успевает продлевать
+    аренду раньше, чем она истечёт. Если лидер умер, через ttl роль подхватит другой процесс.
+    """
+
+    def __init__(self, name: str, *, ttl: float, holder: Optional[str] = None) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or default_holder_id()
+
+    async def try_acquire(self) -> bool:
+        """Захватить или продлить аренду. True — мы лидер до now + ttl."""
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.ttl)
+        try:
+            async with session_scope() as session:
+                res = await session.execute(
+                    update(Lease)
+                    .where(
+                        Lease.name == self.name,
+                        or_(Lease.holder == self.holder, Lease.expires_at < now),
+                    )
+                    .values(holder=self.holder, expires_at=expires)
+                )
+                if res.rowcount:
+                    return True
+                if await session.get(Lease, self.name) is not None:
+                    return False
+                session.add(Lease(name=self.name, holder=self.holder, expires_at=expires))
+        except IntegrityError:
+            return False  # строку одновременно создал другой процесс
+        return True
+
+    async def release(self) -> None:
+        async with session_scope() as session:
+            await session.execute(
+                update(Lease)
+                .where(Lease.name == self.name, Lease.holder == self.holder)
+                .values(expires_at=datetime.utcnow())
+            )
+
+    async def run_while_leader(self, job: Callable[[], Awaitable[None]]) -> None:
+        """
+        Крутит job() только пока мы держим аренду: потеряли — отменяем, вернули — запускаем заново.
+        """
+        task: Optional[asyncio.Task] = None
+        try:
+            while True:
+                try:
+                    # Отмена приходит сюда, а не посреди транзакции аренды: отменённый
+                    # запрос к SQLite может её проглотить, и цикл уже не остановится.
+                    leader = await asyncio.shield(self.try_acquire())
+                except Exception:
+                    log.exception("lease %s: renew failed", self.name)
+                    leader = False
+                if leader and task is None:
+                    log.info("lease %s: acquired by %s", self.name, self.holder)
+                    task = asyncio.create_task(job())
+                elif not leader and task is not None:
+                    log.warning("lease %s: lost by %s", self.name, self.holder)
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    task = None
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await self.release()
@@ -0,0 +1,293 @@
+# bot/services/matching.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Order, OrderStatus, Payment, PaymentStatus
+from .money import decimal_to_nano
+from .order_keys import normalize_order_key
+
+if TYPE_CHECKING:  # ton_api тянет httpx — при импорте бота он не нужен
+    from .ton_api import IncomingTx
+
+
+# Платежи, которые идут в оплату заказа; EXCESS и TIMEOUT — деньги к возврату, не в счёт.
+COUNTED_STATUSES = (PaymentStatus.PARTIAL, PaymentStatus.CONFIRMED)
+
+
+@dataclass(slots=True)
+class OpenOrder:
+    """Открытый заказ в памяти: сколько ждём и сколько уже пришло (в нанотонах)."""
+    order_id: int
+    order_key: str
+    amount_nano: int
+    paid_nano: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class Settlement:
+    """Решение по одной входящей транзакции."""
+    tx: IncomingTx
+    order_id: int
+    order_key: str
+    status: PaymentStatus      # PARTIAL / CONFIRMED; EXCESS и TIMEOUT — деньги к возврату
+    paid_nano: int             # накопленная сумма по заказу с учётом этой транзакции
+    overpaid_nano: int = 0
+
+    @property
+    def completes_order(self) -> bool:
+        return self.status == PaymentStatus.CONFIRMED
+
+
+class PaymentIndex:
+    """
+    Хеш-индекс открытых заказов: комментарий (order_key) → заказ, плюс сумма → заказы
+    для переводов без комментария. Матч транзакции — O(1), без SQL по открытым заказам.
+
+    Индекс строится из БД при старте (rebuild) и дальше обновляется вызывающим кодом:
+    add() при создании заказа, apply() после коммита платежей, discard() при закрытии.
+    Ведёт его только процесс с наблюдателем оплат (loaded — индекс загружен); заказы
+    других процессов наблюдатель подтягивает через sync_recent.
+    """
+
+    def __init__(self, settled_capacity: int = 10_000) -> None:
+        self._by_key: dict[str, OpenOrder] = {}
+        self._by_amount: dict[int, set[str]] = {}
+        self._synced_at: Optional[datetime] = None
+        # Недавно оплаченные заказы этого процесса — ответ на «Проверить оплату» без SQL
+        self._settled: OrderedDict[str, None] = OrderedDict()
+        self.settled_capacity = settled_capacity
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def __contains__(self, order_key: str) -> bool:
+        return order_key in self._by_key
+
+    def get(self, order_key: str) -> Optional[OpenOrder]:
+        return self._by_key.get(order_key)
+
+    def is_settled(self, order_key: str) -> bool:
+        return order_key in self._settled
+
+    def _mark_settled(self, order_key: str) -> None:
+        self._settled[order_key] = None
+        self._settled.move_to_end(order_key)
+        if len(self._settled) > self.settled_capacity:
+            self._settled.popitem(last=False)
+
+    @property
+    def loaded(self) -> bool:
+        return self._synced_at is not None
+
+    def add(self, order: OpenOrder) -> None:
+        self.discard(order.order_key)
+        self._by_key[order.order_key] = order
+        self._by_amount.setdefault(order.amount_nano, set()).add(order.order_key)
+
+    def discard(self, order_key: str) -> Optional[OpenOrder]:
+        order = self._by_key.pop(order_key, None)
+        if order is not None:
+            keys = self._by_amount.get(order.amount_nano)
+            if keys is not None:
+                keys.discard(order_key)
+                if not keys:
+                    del self._by_amount[order.amount_nano]
+        return order
+
+    def clear(self) -> None:
+        self._by_key.clear()
+        self._by_amount.clear()
+
+    def unload(self) -> None:
+        """Процесс больше не ведёт индекс (потерял лидерство) — не держим заказы в памяти."""
+        self._synced_at = None
+        self.clear()
+
+    def _lookup(self, tx: IncomingTx) -> Optional[OpenOrder]:
+        key = normalize_order_key(tx.comment) if tx.comment else None
+        if key is not None:
+            return self._by_key.get(key)
+        if tx.comment:
+            return None  # чужой комментарий — не угадываем по сумме
+        # Без комментария: только если сумма однозначно указывает на один заказ.
+        keys = self._by_amount.get(tx.amount_nano)
+        if keys is not None and len(keys) == 1:
+            return self._by_key[next(iter(keys))]
+        return None
+
+    def plan(self, txs: Iterable[IncomingTx]) -> list[Settlement]:
+        """
+        Сопоставить пачку транзакций с открытыми заказами, НЕ меняя индекс
+        (изменения применяются через apply() только после успешного коммита).
+        """
+        paid: dict[str, int] = {}
+        closed: set[str] = set()
+        out: list[Settlement] = []
+        for tx in txs:
+            order = self._lookup(tx)
+            if order is None:
+                continue
+            if order.order_key in closed:
+                # Повторный перевод по заказу, закрытому раньше в этой же пачке.
+                out.append(Settlement(
+                    tx=tx,
+                    order_id=order.order_id,
+                    order_key=order.order_key,
+                    status=PaymentStatus.EXCESS,
+                    paid_nano=paid[order.order_key],
+                    overpaid_nano=tx.amount_nano,
+                ))
+                continue
+            total = paid.get(order.order_key, order.paid_nano) + tx.amount_nano
+            paid[order.order_key] = total
+            full = total >= order.amount_nano
+            if full:
+                closed.add(order.order_key)
+            out.append(Settlement(
+                tx=tx,
+                order_id=order.order_id,
+                order_key=order.order_key,
+                status=PaymentStatus.CONFIRMED if full else PaymentStatus.PARTIAL,
+                paid_nano=total,
+                overpaid_nano=max(0, total - order.amount_nano),
+            ))
+        return out
+
+    def apply(self, settlements: Iterable[Settlement]) -> None:
+        for st in settlements:
+            if st.status not in COUNTED_STATUSES:
+                continue
+            if st.completes_order:
+                self.discard(st.order_key)
+                self._mark_settled(st.order_key)
+            else:
+                order = self._by_key.get(st.order_key)
+                if order is not None:
+                    order.paid_nano = st.paid_nano
+
+    @staticmethod
+    def _open_orders_query(since: Optional[datetime] = None):
+        paid_sq = (
+            select(Payment.order_id, func.sum(Payment.amount_ton).label("paid"))
+            .where(Payment.status.in_(COUNTED_STATUSES))
+            .group_by(Payment.order_id)
+            .subquery()
+        )
+        q = (
+            select(Order.id, Order.order_key, Order.price_out_ton, paid_sq.c.paid)
+            .outerjoin(paid_sq, paid_sq.c.order_id == Order.id)
+            .where(Order.status == OrderStatus.WAITING_PAYMENT)
+        )
+        if since is not None:
+            q = q.where(Order.created_at >= since)
+        return q
+
+    @staticmethod
+    def _row_to_open(row) -> OpenOrder:
+        order_id, key, price, paid = row
+        return OpenOrder(
+            order_id=order_id,
+            order_key=key,
+            amount_nano=decimal_to_nano(price),
+            paid_nano=decimal_to_nano(paid),
+        )
+
+    async def rebuild(self, session: AsyncSession) -> int:
+        """Заполнить индекс из БД: все WAITING_PAYMENT и суммы уже пришедших частичных оплат."""
+        self._synced_at = datetime.utcnow()
+        rows = await session.execute(self._open_orders_query())
+        self.clear()
+        for row in rows:
+            self.add(self._row_to_open(row))
+        return len(self)
+
+    async def sync_recent(self, session: AsyncSession, overlap: float = 30.0) -> int:
+        """
+        Догрузить заказы, созданные с прошлой синхронизации (в т.ч. другими процессами).
+        Идёт по ix_orders_status_created и трогает только свежие строки; уже известные
+        заказы не перезаписываются (в них может быть накопленная частичная оплата).
+        """
+        if self._synced_at is None:
+            return await self.rebuild(session)
+        since = self._synced_at - timedelta(seconds=overlap)
+        self._synced_at = datetime.utcnow()
+        added = 0
+        for row in await session.execute(self._open_orders_query(since)):
+            if row[1] not in self._by_key:
+                self.add(self._row_to_open(row))
+                added += 1
+        return added
+
+
+async def plan_closed(
+    session: AsyncSession,
+    txs: Iterable[IncomingTx],
+    *,
+    payment_timeout: timedelta,
+) -> tuple[list[Settlement], list[IncomingTx]]:
+    """
+    Разобрать по БД переводы, которых нет среди открытых заказов индекса.
+    Возвращает (решения, неразобранные переводы).
+
+    - WAITING_PAYMENT и EXPIRED, если перевод пришёл до created_at + payment_timeout, —
+      обычный матч (PARTIAL/CONFIRMED): опоздавший покупатель всё равно получает заказ;
+    - EXPIRED после окончательного срока — TIMEOUT, прочие закрытые заказы — EXCESS:
+      деньги записываются за заказом и подлежат возврату;
+    - без ключа в комментарии или с неизвестным ключом — неразобранные.
+    """
+    txs = list(txs)
+    keyed = [(tx, key) for tx in txs if tx.comment and (key := normalize_order_key(tx.comment))]
+    if not keyed:
+        return [], txs
+
+    paid_sum = (
+        select(func.sum(Payment.amount_ton))
+        .where(Payment.order_id == Order.id, Payment.status.in_(COUNTED_STATUSES))
+        .scalar_subquery()
+    )
+    rows = await session.execute(
+        select(Order.id, Order.order_key, Order.price_out_ton, paid_sum, Order.status, Order.created_at)
+        .where(Order.order_key.in_({key for _, key in keyed}))
+    )
+    index = PaymentIndex()
+    deadlines: dict[str, Optional[datetime]] = {}
+    closed: dict[str, tuple[int, int, OrderStatus]] = {}
+    for order_id, key, price, paid_ton, status, created_at in rows:
+        if status in (OrderStatus.WAITING_PAYMENT, OrderStatus.EXPIRED):
+            index.add(OpenOrder(order_id, key, decimal_to_nano(price), decimal_to_nano(paid_ton)))
+            # Истёкший заказ принимает только переводы, пришедшие в срок.
+            deadlines[key] = created_at + payment_timeout if status == OrderStatus.EXPIRED else None
+        closed[key] = (order_id, decimal_to_nano(paid_ton), status)
+
+    in_time: list[IncomingTx] = []
+    late: list[Settlement] = []
+    known: set[str] = set()
+    for tx, key in keyed:
+        paid_at = datetime.fromtimestamp(tx.utime, timezone.utc).replace(tzinfo=None)
+        if key in deadlines and (deadlines[key] is None or paid_at <= deadlines[key]):
+            in_time.append(tx)
+            known.add(tx.tx_hash)
+        elif key in closed:
+            order_id, paid_nano, status = closed[key]
+            late.append(Settlement(
+                tx=tx,
+                order_id=order_id,
+                order_key=key,
+                status=PaymentStatus.TIMEOUT if status == OrderStatus.EXPIRED else PaymentStatus.EXCESS,
+                paid_nano=paid_nano,
+                overpaid_nano=tx.amount_nano,
+            ))
+            known.add(tx.tx_hash)
+    # Неразобранные — в порядке цепочки, как пришли.
+    return index.plan(in_time) + late, [tx for tx in txs if tx.tx_hash not in known]
+
+
+# Единый индекс процесса
+payment_index = PaymentIndex()
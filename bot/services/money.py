@@ -0,0 +1,105 @@
+# bot/services/money.py
+"""
+Деньги в целых нанотонах (1 TON = 10**9 нанотонов).
+
+Одно правило округления на весь проект: сумма к оплате считается целочисленно
+и округляется ВНИЗ до нанотона ровно один раз — в quote(). Ссылки, текст сообщения,
+колонки Order.price_*_ton и матчинг платежей берут одно и то же число total_nano,
+поэтому сумма в ссылке всегда совпадает с той, которую ждёт PaymentIndex.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import lru_cache
+from typing import Union
+
+NANO = 10**9              # нанотонов в 1 TON
+PICO_PER_NANO = 1_000     # цена за звезду хранится точнее — в 1e-12 TON
+BPS = 10_000              # базисные пункты для наценки
+
+Number = Union[int, str, Decimal, float]
+
+
+# ---------- разбор и форматирование ----------
+def parse_ton(text: str) -> int:
+    """'1.5' / '1,5' / '2' → нанотоны; знаки после 9-го отбрасываются. ValueError на мусор."""
+    s = text.strip().replace(",", ".")
+    neg = s.startswith("-")
+    if neg or s.startswith("+"):
+        s = s[1:]
+    whole, _, frac = s.partition(".")
+    if not (whole or frac) or (whole and not whole.isdigit()) or (frac and not frac.isdigit()):
+        raise ValueError(f"bad TON amount: {text!r}")
+    nano = int(whole or 0) * NANO + int((frac[:9] or "0").ljust(9, "0"))
+    return -nano if neg else nano
+
+
+def to_nano(value: Number) -> int:
+    """Любое представление суммы в TON → нанотоны (вниз до нанотона)."""
+    if isinstance(value, int):
+        return value * NANO
+    if isinstance(value, float):
+        value = Decimal(repr(value))  # repr — кратчайшая запись float; Decimal уберёт экспоненту
+    if isinstance(value, Decimal):
+        value = format(value, "f")
+    return parse_ton(value)
+
+
+def format_ton(nano: int) -> str:
+    """Нанотоны → '1.5' без экспоненты и хвостовых нулей."""
+    sign = "-" if nano < 0 else ""
+    whole, frac = divmod(abs(nano), NANO)
+    if not frac:
+        return f"{sign}{whole}"
+    return f"{sign}{whole}.{frac:09d}".rstrip("0")
+
+
+def nano_to_decimal(nano: int) -> Decimal:
+    """Для колонок Numeric(20, 9): точное значение, без float."""
+    return Decimal(nano).scaleb(-9)
+
+
+def decimal_to_nano(value: Decimal | None) -> int:
+    """Из колонок Numeric(20, 9) обратно в нанотоны (NULL → 0)."""
+    return 0 if value is None else to_nano(value)
+
+
+@lru_cache(maxsize=64)
+def price_to_pico(price_ton: Decimal) -> int:
+    """Цена за звезду (TON) → целые 1e-12 TON. Меняется раз в PRICE_CACHE_TTL_SEC — кешируем."""
+    s = format(price_ton, "f")
+    whole, _, frac = s.partition(".")
+    return int(whole or 0) * NANO * PICO_PER_NANO + int((frac[:12] or "0").ljust(12, "0"))
+
+
+# ---------- расчёт суммы ----------
+@dataclass(frozen=True, slots=True)
+class Quote:
+    """Расчёт заказа: всё в целых числах, total_nano — ровно та сумма, что уйдёт в ссылку."""
+    quantity: int
+    price_pico: int        # цена одной звезды, 1e-12 TON
+    fee_bps: int
+    base_nano: int         # без наценки
+    total_nano: int        # к оплате
+
+    @property
+    def price_nano(self) -> int:
+        return self.price_pico // PICO_PER_NANO
+
+
+@lru_cache(maxsize=65_536)
+def quote(quantity: int, price_pico: int, fee_bps: int) -> Quote:
+    """
+    Единственное место округления: qty × цена × (1 + наценка), вниз до нанотона.
+    Мемоизировано по (количество, цена, наценка): пока цена не сменилась,
+    повторные запросы тех же количеств берутся из таблицы.
+    """
+    gross = quantity * price_pico
+    return Quote(
+        quantity=quantity,
+        price_pico=price_pico,
+        fee_bps=fee_bps,
+        base_nano=gross // PICO_PER_NANO,
+        total_nano=gross * (BPS + fee_bps) // (BPS * PICO_PER_NANO),
+    )
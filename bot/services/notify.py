@@ -0,0 +1,84 @@
+# bot/services/notify.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from .send_scheduler import Priority, send_priority
+
+log = logging.getLogger(__name__)
+
+
+class Notifier:
+    """
+    Фоновые уведомления пользователям (не ответы на апдейты).
+
+    Сообщения копятся в ограниченной очереди и отправляются не более чем concurrency
+    штук одновременно; темп и повторы на 429 обеспечивает SendScheduler бота,
+    а приоритет (по умолчанию LOW) не даёт массовой рассылке отнять квоту у ответов в чатах.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        priority: Priority = Priority.LOW,
+        concurrency: int = 32,
+        max_queue: int = 10_000,
+    ) -> None:
+        self.bot = bot
+        self.priority = priority
+        self.concurrency = concurrency
+        self._queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue(maxsize=max_queue)
+        self._tasks: list[asyncio.Task] = []
+        self.sent = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, chat_id: int, text: str) -> bool:
+        """Поставить сообщение в очередь; False — очередь переполнена, сообщение отброшено."""
+        try:
+            self._queue.put_nowait((chat_id, text))
+        except asyncio.QueueFull:
+            log.warning("notifier: queue full, dropping message to %s", chat_id)
+            return False
+        self._tasks = [t for t in self._tasks if not t.done()]
+        if len(self._tasks) < min(self.concurrency, self._queue.qsize()):
+            self._tasks.append(asyncio.create_task(self._run()))
+        return True
+
+    async def _send(self, chat_id: int, text: str) -> None:
+        try:
+            with send_priority(self.priority):
+                await self.bot.send_message(chat_id, text)
+            self.sent += 1
+        except TelegramForbiddenError:
+            pass  # пользователь заблокировал бота
+        except Exception:
+            log.exception("notifier: send to %s failed", chat_id)
+
+    async def _run(self) -> None:
+        while not self._queue.empty():
+            chat_id, text = self._queue.get_nowait()
+            try:
+                await self._send(chat_id, text)
+            finally:
+                self._queue.task_done()
+
+    async def flush(self) -> None:
+        """Дождаться отправки всего, что уже в очереди."""
+        await self._queue.join()
+
+    async def close(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+def build_notifier(bot: Bot, priority: Priority = Priority.LOW) -> Notifier:
+    return Notifier(bot, priority=priority)
@@ -0,0 +1,45 @@
+# bot/services/order_keys.py
+from __future__ import annotations
+
+import os
+import time
+
+# Crockford base32: без I, L, O, U — нельзя перепутать при ручном вводе.
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {c: i for i, c in enumerate(_ALPHABET)}
+_DECODE.update({c.lower(): i for c, i in list(_DECODE.items())})
+_DECODE.update({"I": 1, "i": 1, "L": 1, "l": 1, "O": 0, "o": 0})
+
+ORDER_KEY_LEN = 26  # 48 бит времени (мс) + 80 бит случайности, как в ULID
+
+
+def _encode(value: int, length: int) -> str:
+    out = []
+    for _ in range(length):
+        value, rem = divmod(value, 32)
+        out.append(_ALPHABET[rem])
+    return "".join(reversed(out))
+
+
+def new_order_key(now_ms: int | None = None) -> str:
+    """
+    Уникальный ключ заказа (ULID в Crockford base32) — им же подписываем перевод.
+    Ключи монотонны по времени, поэтому хорошо ложатся в B-tree индекс.
+    """
+    ts = int(time.time() * 1000) if now_ms is None else now_ms
+    rnd = int.from_bytes(os.urandom(10), "big")
+    return _encode(ts & ((1 << 48) - 1), 10) + _encode(rnd, 16)
+
+
+def normalize_order_key(text: str) -> str | None:
+    """
+    Приводит комментарий перевода к каноническому ключу заказа (регистр, I/L/O, пробелы).
+    None — если это не похоже на наш ключ.
+    """
+    s = "".join(text.split())
+    if len(s) != ORDER_KEY_LEN:
+        return None
+    try:
+        return "".join(_ALPHABET[_DECODE[c]] for c in s)
+    except KeyError:
+        return None
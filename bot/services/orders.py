@@ -0,0 +1,57 @@
+# bot/services/orders.py
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Order, OrderStatus
+from .matching import OpenOrder, payment_index
+from .money import Quote, nano_to_decimal
+from .order_keys import new_order_key
+from .users import identity_cache, resolve_user_id
+from .write_behind import get_write_behind
+
+
+async def create_order(
+    tg_user_id: int,
+    username: Optional[str],
+    q: Quote,
+    *,
+    lang: Optional[str] = None,
+) -> Order:
+    """
+    Создать заказ в WAITING_PAYMENT с уникальным order_key и добавить его в индекс оплат
+    (если этот процесс его ведёт — см. PaymentIndex).
+    Запись идёт через общую очередь write-behind (групповой коммит); возвращаемся после
+    коммита — ссылки на оплату показываем только по сохранённому заказу.
+    """
+    order_key = new_order_key()
+
+    async def op(session: AsyncSession) -> tuple[int, Order]:
+        user_id = await resolve_user_id(session, tg_user_id, username, identity_cache, lang)
+        order = Order(
+            order_key=order_key,
+            user_id=user_id,
+            username=username,  # получатель по умолчанию — сам покупатель
+            quantity=q.quantity,
+            price_fragment_ton=nano_to_decimal(q.price_nano),
+            price_out_ton=nano_to_decimal(q.total_nano),
+            status=OrderStatus.WAITING_PAYMENT,
+        )
+        session.add(order)
+        await session.flush()
+        return user_id, order
+
+    user_id, order = await get_write_behind().write(op)
+    identity_cache.put(tg_user_id, user_id)
+
+    # В процессе без наблюдателя индекс не загружен: заказ подтянет sync_recent лидера.
+    if payment_index.loaded:
+        payment_index.add(OpenOrder(
+            order_id=order.id,
+            order_key=order.order_key,
+            amount_nano=q.total_nano,
+        ))
+    return order
+
@@ -0,0 +1,110 @@
+# bot/services/payment_check.py
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cache
+from typing import Callable, Optional
+
+from sqlalchemy import func, select
+
+from ..config import settings
+from ..models import Order, OrderStatus, Payment
+from ..storage import read_session
+from .matching import COUNTED_STATUSES, PaymentIndex, payment_index
+from .money import decimal_to_nano
+
+
+@dataclass(frozen=True, slots=True)
+class CheckResult:
+    """Что известно об оплате заказа на момент проверки."""
+    status: str            # OrderStatus
+    amount_nano: int
+    paid_nano: int
+
+    @property
+    def is_paid(self) -> bool:
+        return self.status in (OrderStatus.PAID, OrderStatus.GIFT_SENT)
+
+
+class PaymentChecker:
+    """
+    Ответ на «Проверить оплату» без лишней работы бэкенда.
+
+    1. Заказ уже закрыт наблюдателем в этом процессе — отвечаем из памяти (PaymentIndex).
+    2. Свежий результат в кеше (ttl секунд) — отдаём его.
+    3. Иначе один запрос в БД на заказ: параллельные проверки того же заказа
+       ждут тот же запрос, а не делают свои.
+    К провайдеру TON проверка не ходит — платежи приносит наблюдатель.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl: float = 3.0,
+        capacity: int = 10_000,
+        index: PaymentIndex = payment_index,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.capacity = capacity
+        self.index = index
+        self.clock = clock
+        self._cache: OrderedDict[str, tuple[float, Optional[CheckResult]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.lookups = 0
+
+    async def check(self, order_key: str) -> Optional[CheckResult]:
+        """Состояние оплаты заказа; None — такого заказа нет."""
+        if self.index.is_settled(order_key):
+            return CheckResult(OrderStatus.PAID, 0, 0)
+
+        hit = self._cache.get(order_key)
+        if hit is not None and hit[0] > self.clock():
+            return hit[1]
+
+        fut = self._inflight.get(order_key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._lookup(order_key))
+            self._inflight[order_key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(order_key, None))
+        return await asyncio.shield(fut)
+
+    async def _lookup(self, order_key: str) -> Optional[CheckResult]:
+        self.lookups += 1
+        paid = (
+            select(func.coalesce(func.sum(Payment.amount_ton), 0))
+            .where(
+                Payment.order_id == Order.id,
+                Payment.status.in_(COUNTED_STATUSES),
+            )
+            .scalar_subquery()
+        )
+        async with read_session() as session:
+            row = (await session.execute(
+                select(Order.status, Order.price_out_ton, paid).where(Order.order_key == order_key)
+            )).first()
+        result = None
+        if row is not None:
+            status, price, paid_ton = row
+            result = CheckResult(
+                status=status,
+                amount_nano=decimal_to_nano(price),
+                paid_nano=decimal_to_nano(paid_ton),
+            )
+        self._remember(order_key, result)
+        return result
+
+    def _remember(self, order_key: str, result: Optional[CheckResult]) -> None:
+        self._cache[order_key] = (self.clock() + self.ttl, result)
+        self._cache.move_to_end(order_key)
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+
+@cache
+def get_payment_checker() -> PaymentChecker:
+    """Единый экземпляр процесса; создаётся при первой проверке (импорт не читает настройки)."""
+    return PaymentChecker(ttl=settings.CHECK_CACHE_TTL_SEC)
@@ -0,0 +1,192 @@
+# bot/services/price_oracle.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+from functools import cache
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+from ..config import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+log = logging.getLogger(__name__)
+
+PriceSource = Callable[[], Awaitable[Decimal]]
+
+
+class PriceSourceError(RuntimeError):
+    """Источник цены не ответил или ответил чем-то, что не похоже на цену."""
+
+
+def parse_price(value) -> Decimal:
+    try:
+        price = Decimal(str(value))
+    except (InvalidOperation, ValueError) as e:
+        raise PriceSourceError(f"bad price value: {value!r}") from e
+    if not (0 < price < 1):  # обычно ~0.006 TON за звезду
+        raise PriceSourceError(f"implausible price: {price}")
+    return price
+
+
+class HttpPriceSource:
+    """
+    Цена из внешнего сервиса FRAGMENT_PRICE_HTTP_URL (формат ответа:
+    {"price_ton_per_star": <number>}). Клиент httpx переиспользуется между запросами.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        auth_header: Optional[str] = None,
+        *,
+        timeout: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        headers = {"accept": "application/json"}
+        if auth_header:
+            # "Name: value" или просто значение для Authorization
+            name, sep, value = auth_header.partition(":")
+            if sep:
+                headers[name.strip()] = value.strip()
+            else:
+                headers["authorization"] = auth_header.strip()
+        import httpx  # только для http-источника: при импорте бота httpx не грузим
+
+        self.url = url
+        self._client = httpx.AsyncClient(headers=headers, timeout=timeout, transport=transport)
+
+    async def __call__(self) -> Decimal:
+        import httpx
+
+        try:
+            rsp = await self._client.get(self.url)
+            rsp.raise_for_status()
+            data = rsp.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise PriceSourceError(f"{self.url}: {e!r}") from e
+        if not isinstance(data, dict) or "price_ton_per_star" not in data:
+            raise PriceSourceError(f"{self.url}: no price_ton_per_star in response")
+        return parse_price(data["price_ton_per_star"])
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class PriceOracle:
+    """
+    Кеш цены за звезду поверх медленного источника.
+
+    - свежая цена (моложе ttl) отдаётся из памяти;
+    - устаревшая отдаётся сразу, а обновление идёт в фоне (stale-while-revalidate);
+    - одновременные промахи схлопываются в один запрос к источнику (single-flight);
+    - при сбое источника держим последнюю удачную цену до max_stale, дальше — fallback (mock).
+
+    current() никогда не ждёт сеть — его и вызывают обработчики сообщений.
+    """
+
+    def __init__(
+        self,
+        source: Optional[PriceSource],
+        *,
+        fallback: Decimal,
+        ttl: float,
+        max_stale: float,
+        retry_after: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.source = source
+        self.fallback = fallback
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.retry_after = retry_after
+        self._clock = clock
+        self._price: Optional[Decimal] = None
+        self._fetched_at = 0.0
+        self._next_try = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+
+    @property
+    def age(self) -> Optional[float]:
+        return None if self._price is None else self._clock() - self._fetched_at
+
+    def _usable(self) -> Optional[Decimal]:
+        age = self.age
+        if age is None or age > self.max_stale:
+            return None
+        return self._price
+
+    async def _fetch(self) -> Decimal:
+        try:
+            price = await self.source()
+        except Exception as e:
+            self._next_try = self._clock() + self.retry_after
+            log.warning("price oracle: source failed: %s", e)
+            return self._usable() or self.fallback
+        self._price = price
+        self._fetched_at = self._clock()
+        return price
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.get_running_loop().create_task(self._fetch())
+        return self._inflight
+
+    def _maybe_revalidate(self) -> None:
+        if self.source is None:
+            return
+        age = self.age
+        if (age is None or age >= self.ttl) and self._clock() >= self._next_try:
+            self._start_refresh()
+
+    def current(self) -> Decimal:
+        """Цена без ожидания сети: кеш (пусть и устаревший) или fallback; при необходимости — фоновое обновление."""
+        self._maybe_revalidate()
+        return self._usable() or self.fallback
+
+    async def get(self) -> Decimal:
+        """Как current(), но при пустом кеше дожидается первого ответа источника (для прогрева)."""
+        if self.source is not None and self._price is None:
+            return await self.refresh()
+        return self.current()
+
+    async def refresh(self) -> Decimal:
+        """Принудительное обновление; параллельные вызовы ждут один и тот же запрос."""
+        if self.source is None:
+            return self.fallback
+        return await asyncio.shield(self._start_refresh())
+
+    async def aclose(self) -> None:
+        if self._inflight is not None and not self._inflight.done():
+            self._inflight.cancel()
+        close = getattr(self.source, "aclose", None)
+        if close is not None:
+            await close()
+
+
+def _build_source() -> Optional[PriceSource]:
+    mode = settings.FRAGMENT_PRICE_MODE
+    if mode == "http" or (mode == "auto" and settings.FRAGMENT_PRICE_HTTP_URL):
+        return HttpPriceSource(settings.FRAGMENT_PRICE_HTTP_URL, settings.FRAGMENT_PRICE_HTTP_AUTH_HEADER)
+    if mode == "auto":
+        from .fragment_price import FragmentPriceSource
+        return FragmentPriceSource(settings.FRAGMENT_BASE_URL)
+    return None
+
+
+def build_price_oracle(source: Optional[PriceSource] = None) -> PriceOracle:
+    return PriceOracle(
+        source if source is not None else _build_source(),
+        fallback=Decimal(str(settings.PRICE_MOCK_TON_PER_STAR)),
+        ttl=settings.PRICE_CACHE_TTL_SEC,
+        max_stale=settings.PRICE_MAX_STALE_SEC,
+    )
+
+
+@cache
+def get_price_oracle() -> PriceOracle:
+    """Единый оракул процесса; источник (и его HTTP-клиент) создаётся при первом запросе цены."""
+    return build_price_oracle()
@@ -1,17 +1,12 @@
-from decimal import Decimal, ROUND_HALF_UP
 from ..config import settings
+from .money import Quote, price_to_pico, quote as _quote
+from .price_oracle import get_price_oracle
 
-TON_DEC = Decimal("0.000000000")  # 9 знаков как у TON
 
-async def quote(quantity: int) -> tuple[Decimal, Decimal, Decimal]:
+def quote(quantity: int) -> Quote:
     """
-    Возвращает кортеж:
-    (цена_за_звезду, сумма_без_наценки, итоговая_с_наценкой).
-    В интерфейсе показываем ТОЛЬКО итоговую сумму — без фразы про наценку.
+    Расчёт заказа по текущей цене: цена за звезду, сумма без наценки и итог к оплате
+    (целые нанотоны, см. services/money). В интерфейсе показываем ТОЛЬКО итоговую сумму.
     """
-    # mock / fallback
-    price_per_star = Decimal(str(settings.PRICE_MOCK_TON_PER_STAR))
-
-    base = (price_per_star * Decimal(quantity)).quantize(TON_DEC, rounding=ROUND_HALF_UP)
-    total = (base * Decimal("1.05")).quantize(TON_DEC, rounding=ROUND_HALF_UP)  # внутренняя наценка 5%
-    return price_per_star, base, total
+    # Из кеша оракула — без ожидания сети (при сбое источника там будет mock-цена)
+    return _quote(quantity, price_to_pico(get_price_oracle().current()), settings.FEE_BPS)
@@ -0,0 +1,265 @@
+# bot/services/send_scheduler.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Callable, Iterator, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+from ..config import settings
+
+log = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+# Методы, которые Telegram считает исходящими сообщениями в чат
+_LIMITED_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+# Правки, которые можно схлопнуть: важна только последняя версия сообщения
+_COLLAPSIBLE = ("EditMessageText", "EditMessageReplyMarkup", "EditMessageCaption")
+
+
+class Priority(IntEnum):
+    HIGH = 0     # транзакционные: оплата получена, звёзды отправлены
+    NORMAL = 1   # ответы на действия пользователя
+    LOW = 2      # массовые информационные (истёкшие заказы и т.п.)
+
+
+_priority: ContextVar[Priority] = ContextVar("send_priority", default=Priority.NORMAL)
+
+
+@contextmanager
+def send_priority(priority: Priority) -> Iterator[None]:
+    """Все вызовы Bot API внутри блока идут с этим приоритетом."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Классическое ведро токенов: rate в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self) -> float:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def reserve(self) -> float:
+        """Занять токен (можно в долг); вернуть, сколько секунд ждать до его появления."""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def delay(self) -> float:
+        """Через сколько секунд появится токен (без списания)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """Ответ 429: до истечения retry_after токенов нет."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _EditSlot:
+    __slots__ = ("method", "future")
+
+    def __init__(self, method: TelegramMethod, future: asyncio.Future) -> None:
+        self.method = method
+        self.future = future
+
+
+def _fail(fut: asyncio.Future, e: BaseException) -> None:
+    if isinstance(e, asyncio.CancelledError):
+        fut.cancel()
+    else:
+        fut.set_exception(e)
+        fut.exception()  # помечаем как полученную: ждущих может и не быть
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих сообщений — middleware сессии Bot.
+
+    Каждый Send*/Edit*/Copy*/Forward* сначала ждёт токен своего чата (~1 msg/s на чат),
+    потом — общий токен бота (~30 msg/s) в очереди по приоритету: транзакционные
+    сообщения обгоняют массовые рассылки. На 429 чат замораживается на retry_after,
+    а запрос встаёт в очередь заново — без штормов повторов; retry_after дольше
+    интервала чата означает флуд-контроль на весь бот, и тогда замирает общее ведро.
+    Несколько правок одного сообщения, ждущих отправки, схлопываются в одну:
+    уходит последняя версия, все вызывающие получают её результат.
+    Прочие методы (answerCallbackQuery, getUpdates, ...) идут мимо.
+    """
+
+    def __init__(
+        self,
+        *,
+        global_rate: float = 30.0,
+        global_burst: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_chats: int = 10_000,
+    ) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats: dict[ChatId, TokenBucket] = {}
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self._edits: dict[tuple, _EditSlot] = {}
+        self.retries = 0
+        self.collapsed = 0
+
+    @property
+    def depth(self) -> int:
+        """Сколько отправок ждут общего токена."""
+        return len(self._waiters)
+
+    # ---------- buckets ----------
+    def _chat_bucket(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                # Полные вёдра ничего не помнят — их можно выбросить.
+                for k in [k for k, b in self._chats.items() if b.idle]:
+                    del self._chats[k]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _acquire_global(self, priority: Priority) -> None:
+        if not self._waiters and self.global_bucket.delay() == 0:
+            self.global_bucket.take()
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        await fut
+
+    async def _run_pump(self) -> None:
+        while self._waiters:
+            delay = self.global_bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():  # вызывающего отменили
+                continue
+            self.global_bucket.take()
+            fut.set_result(None)
+
+    def _retry_after(self, chat_id: ChatId, e: TelegramRetryAfter) -> None:
+        """429: замораживаем чат, а если ждать дольше его обычного интервала — и весь бот."""
+        self.retries += 1
+        log.warning("send scheduler: 429 in chat %s, retry after %ss", chat_id, e.retry_after)
+        self._chat_bucket(chat_id).block(e.retry_after)
+        if e.retry_after > 1 / self.chat_rate:
+            self.global_bucket.block(e.retry_after)
+
+    async def _acquire(self, chat_id: ChatId, priority: Priority) -> None:
+        delay = self._chat_bucket(chat_id).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._acquire_global(priority)
+
+    # ---------- middleware ----------
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Any:
+        name = type(method).__name__
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not name.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+        if name in _COLLAPSIBLE and getattr(method, "message_id", None) is not None:
+            return await self._send_edit(make_request, bot, method, chat_id)
+        return await self._send(make_request, bot, method, chat_id)
+
+    async def _send(self, make_request, bot: Bot, method: TelegramMethod, chat_id: ChatId) -> Any:
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self._retry_after(chat_id, e)
+
+    async def _send_edit(self, make_request, bot: Bot, method: TelegramMethod, chat_id: ChatId) -> Any:
+        key = (type(method).__name__, chat_id, method.message_id)
+        slot = self._edits.get(key)
+        if slot is not None:
+            # Правка этого сообщения уже ждёт очереди — подменяем её содержимое.
+            slot.method = method
+            self.collapsed += 1
+            return await asyncio.shield(slot.future)
+
+        slot = self._edits[key] = _EditSlot(method, asyncio.get_running_loop().create_future())
+        try:
+            await self._acquire(chat_id, _priority.get())
+            # Дальше новые правки пойдут уже следующим запросом.
+            self._edits.pop(key, None)
+            result = await self._send_acquired(make_request, bot, slot.method, chat_id)
+        except BaseException as e:
+            self._edits.pop(key, None)
+            _fail(slot.future, e)
+            raise
+        slot.future.set_result(result)
+        return result
+
+    async def _send_acquired(self, make_request, bot: Bot, method: TelegramMethod, chat_id: ChatId) -> Any:
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            self._retry_after(chat_id, e)
+        return await self._send(make_request, bot, method, chat_id)
+
+
+def install_send_scheduler(bot: Bot, shards: int = 1) -> SendScheduler:
+    """
+    shards — сколько процессов шлют от имени этого бота: общий лимит Telegram один
+    на бота, поэтому каждому достаётся своя доля SEND_GLOBAL_RATE.
+    """
+    global_rate = settings.SEND_GLOBAL_RATE / max(1, shards)
+    scheduler = SendScheduler(
+        global_rate=global_rate,
+        global_burst=max(1.0, global_rate),
+        chat_rate=settings.SEND_CHAT_RATE,
+        chat_burst=settings.SEND_CHAT_BURST,
+    )
+    bot.session.middleware(scheduler)
+    return scheduler
@@ -0,0 +1,315 @@
+# bot/services/ton_api.py
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Optional
+
+import httpx
+
+
+TONCENTER_BASE_URL = "https://toncenter.com"
+TONAPI_BASE_URL = "https://tonapi.io"
+
+
+class TonApiError(RuntimeError):
+    """Ошибка обращения к TON API (сеть, HTTP-статус, неожиданный ответ)."""
+
+
+@dataclass(frozen=True, slots=True)
+class IncomingTx:
+    """Входящий перевод на наш кошелёк в нормализованном виде (независимо от провайдера)."""
+    lt: int
+    tx_hash: str            # 64 hex-символа в нижнем регистре — см. normalize_tx_hash
+    amount_nano: int
+    comment: str
+    sender: Optional[str]
+    utime: int
+    raw: dict[str, Any] = field(default_factory=dict, compare=False, repr=False)
+
+
+@dataclass(frozen=True, slots=True)
+class TxPage:
+    """Страница истории кошелька: входящие переводы и lt последней просмотренной транзакции."""
+    txs: list[IncomingTx]
+    last_lt: int        # двигает курсор даже через исходящие/пустые транзакции
+    more: bool          # страница полная — дальше может быть ещё
+
+
+def normalize_tx_hash(value: Any) -> str:
+    """
+    Хеш транзакции в каноническом виде — hex 32 байт в нижнем регистре.
+    toncenter отдаёт base64 (обычный или url-safe), tonapi — hex: без приведения одна и та же
+    транзакция от разных провайдеров прошла бы проверку идемпотентности дважды.
+    """
+    text = str(value).strip()
+    if len(text) == 64:
+        try:
+            return bytes.fromhex(text).hex()
+        except ValueError:
+            pass
+    try:
+        raw = base64.b64decode(text.replace("-", "+").replace("_", "/") + "=" * (-len(text) % 4), validate=True)
+    except (binascii.Error, ValueError):
+        return text
+    return raw.hex() if len(raw) == 32 else text
+
+
+def _decode_comment(value: Any) -> str:
+    return value.strip() if isinstance(value, str) else ""
+
+
+async def iter_sse(lines: AsyncIterator[str]) -> AsyncIterator[dict[str, Any]]:
+    """Минимальный разбор text/event-stream: отдаёт JSON из поля data каждого события."""
+    data: list[str] = []
+    async for line in lines:
+        if line == "":
+            if data:
+                try:
+                    payload = json.loads("\n".join(data))
+                except ValueError:
+                    payload = None
+                data = []
+                if isinstance(payload, dict):
+                    yield payload
+            continue
+        if line.startswith(":"):
+            continue  # комментарий / keep-alive
+        name, _, value = line.partition(":")
+        if name == "data":
+            data.append(value[1:] if value.startswith(" ") else value)
+
+
+class TonProvider:
+    """
+    Базовый провайдер: умеет отдавать входящие транзакции кошелька строго после заданного lt,
+    отсортированные по возрастанию lt.
+    """
+
+    name = "base"
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        api_key: Optional[str] = None,
+        timeout: float = 10.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=self._auth_headers(api_key),
+            timeout=timeout,
+            transport=transport,
+        )
+
+    def _auth_headers(self, api_key: Optional[str]) -> dict[str, str]:
+        return {}
+
+    async def _get_json(self, path: str, params: dict[str, Any]) -> dict[str, Any]:
+        try:
+            rsp = await self._client.get(path, params=params)
+        except httpx.HTTPError as e:
+            raise TonApiError(f"{self.name}: {e!r}") from e
+        if rsp.status_code != 200:
+            raise TonApiError(f"{self.name}: {path} status {rsp.status_code}")
+        try:
+            return rsp.json()
+        except ValueError as e:
+            raise TonApiError(f"{self.name}: invalid json from {path}") from e
+
+    async def fetch_page(self, address: str, after_lt: int, limit: int = 100) -> TxPage:
+        raise NotImplementedError
+
+    async def fetch_incoming(self, address: str, after_lt: int, limit: int = 100) -> list[IncomingTx]:
+        return (await self.fetch_page(address, after_lt, limit)).txs
+
+    def _page(self, raw: list[dict[str, Any]], after_lt: int, limit: int) -> TxPage:
+        out = []
+        for tx in raw:
+            parsed = self._parse(tx)
+            if parsed is not None and parsed.lt > after_lt:
+                out.append(parsed)
+        last_lt = max((int(tx["lt"]) for tx in raw), default=after_lt)
+        return TxPage(out, max(last_lt, after_lt), len(raw) >= limit)
+
+    @staticmethod
+    def _parse(tx: dict[str, Any]) -> Optional[IncomingTx]:
+        raise NotImplementedError
+
+    async def latest_lt(self, address: str) -> int:
+        """lt самой свежей транзакции кошелька (0, если транзакций нет)."""
+        raise NotImplementedError
+
+    async def lt_at(self, address: str, utime: int) -> int:
+        """lt последней транзакции кошелька не позже момента utime (0 — если раньше транзакций не было)."""
+        raise NotImplementedError
+
+    def _stream_request(self, address: str) -> httpx.Request:
+        raise NotImplementedError
+
+    async def stream_events(self, address: str) -> AsyncIterator[dict[str, Any]]:
+        """
+        Подписка на новые транзакции кошелька (SSE). Генератор завершается при обрыве
+        соединения — переподключение и догрузка пропусков на стороне вызывающего.
+        """
+        request = self._stream_request(address)
+        try:
+            rsp = await self._client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            raise TonApiError(f"{self.name}: stream {e!r}") from e
+        try:
+            if rsp.status_code != 200:
+                raise TonApiError(f"{self.name}: stream status {rsp.status_code}")
+            async for event in iter_sse(rsp.aiter_lines()):
+                yield event
+        except httpx.HTTPError as e:
+            raise TonApiError(f"{self.name}: stream {e!r}") from e
+        finally:
+            await rsp.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class ToncenterProvider(TonProvider):
+    """toncenter.com, API v3 (/api/v3/transactions)."""
+
+    name = "toncenter"
+
+    def _auth_headers(self, api_key: Optional[str]) -> dict[str, str]:
+        return {"X-API-Key": api_key} if api_key else {}
+
+    @staticmethod
+    def _parse(tx: dict[str, Any]) -> Optional[IncomingTx]:
+        in_msg = tx.get("in_msg") or {}
+        source = in_msg.get("source")
+        value = int(in_msg.get("value") or 0)
+        if not source or value <= 0:
+            return None  # внешние сообщения и пустые переводы нас не интересуют
+        content = in_msg.get("message_content") or {}
+        decoded = content.get("decoded") or {}
+        comment = decoded.get("comment") if decoded.get("type") == "text_comment" else None
+        return IncomingTx(
+            lt=int(tx["lt"]),
+            tx_hash=normalize_tx_hash(tx["hash"]),
+            amount_nano=value,
+            comment=_decode_comment(comment),
+            sender=source,
+            utime=int(tx.get("now") or 0),
+            raw=tx,
+        )
+
+    async def fetch_page(self, address: str, after_lt: int, limit: int = 100) -> TxPage:
+        data = await self._get_json(
+            "/api/v3/transactions",
+            {"account": address, "start_lt": after_lt + 1, "limit": limit, "sort": "asc"},
+        )
+        return self._page(data.get("transactions") or [], after_lt, limit)
+
+    async def latest_lt(self, address: str) -> int:
+        data = await self._get_json(
+            "/api/v3/transactions", {"account": address, "limit": 1, "sort": "desc"}
+        )
+        txs = data.get("transactions") or []
+        return int(txs[0]["lt"]) if txs else 0
+
+    async def lt_at(self, address: str, utime: int) -> int:
+        data = await self._get_json(
+            "/api/v3/transactions",
+            {"account": address, "end_utime": utime, "limit": 1, "sort": "desc"},
+        )
+        txs = data.get("transactions") or []
+        return int(txs[0]["lt"]) if txs else 0
+
+    def _stream_request(self, address: str) -> httpx.Request:
+        return self._client.build_request(
+            "POST",
+            "/api/streaming/v2/sse",
+            json={"addresses": [address], "types": ["transactions"]},
+            headers={"Accept": "text/event-stream"},
+            timeout=httpx.Timeout(10.0, read=None),
+        )
+
+
+class TonapiProvider(TonProvider):
+    """tonapi.io, API v2 (/v2/blockchain/accounts/{id}/transactions)."""
+
+    name = "tonapi"
+
+    def _auth_headers(self, api_key: Optional[str]) -> dict[str, str]:
+        return {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    @staticmethod
+    def _parse(tx: dict[str, Any]) -> Optional[IncomingTx]:
+        in_msg = tx.get("in_msg") or {}
+        source = (in_msg.get("source") or {}).get("address")
+        value = int(in_msg.get("value") or 0)
+        if not source or value <= 0:
+            return None
+        comment = None
+        if in_msg.get("decoded_op_name") == "text_comment":
+            comment = (in_msg.get("decoded_body") or {}).get("text")
+        return IncomingTx(
+            lt=int(tx["lt"]),
+            tx_hash=normalize_tx_hash(tx["hash"]),
+            amount_nano=value,
+            comment=_decode_comment(comment),
+            sender=source,
+            utime=int(tx.get("utime") or 0),
+            raw=tx,
+        )
+
+    async def fetch_page(self, address: str, after_lt: int, limit: int = 100) -> TxPage:
+        data = await self._get_json(
+            f"/v2/blockchain/accounts/{address}/transactions",
+            {"after_lt": after_lt, "limit": limit, "sort_order": "asc"},
+        )
+        return self._page(data.get("transactions") or [], after_lt, limit)
+
+    async def latest_lt(self, address: str) -> int:
+        data = await self._get_json(
+            f"/v2/blockchain/accounts/{address}/transactions", {"limit": 1, "sort_order": "desc"}
+        )
+        txs = data.get("transactions") or []
+        return int(txs[0]["lt"]) if txs else 0
+
+    async def lt_at(self, address: str, utime: int, page_limit: int = 100) -> int:
+        # Фильтра по времени у tonapi нет — листаем историю назад страницами до нужного момента.
+        params: dict[str, Any] = {"limit": page_limit, "sort_order": "desc"}
+        while True:
+            data = await self._get_json(f"/v2/blockchain/accounts/{address}/transactions", params)
+            txs = data.get("transactions") or []
+            for tx in txs:
+                if int(tx.get("utime") or 0) <= utime:
+                    return int(tx["lt"])
+            if len(txs) < page_limit:
+                return 0
+            params["before_lt"] = int(txs[-1]["lt"])
+
+    def _stream_request(self, address: str) -> httpx.Request:
+        return self._client.build_request(
+            "GET",
+            "/v2/sse/accounts/transactions",
+            params={"accounts": address},
+            headers={"Accept": "text/event-stream"},
+            timeout=httpx.Timeout(10.0, read=None),
+        )
+
+
+async def iter_incoming(
+    provider: TonProvider, address: str, after_lt: int, page_limit: int = 100
+) -> AsyncIterator[TxPage]:
+    """
+    История кошелька после after_lt страницами по возрастанию lt — до текущей вершины.
+    В памяти одна страница, сколько бы ни было истории.
+    """
+    while True:
+        page = await provider.fetch_page(address, after_lt, page_limit)
+        if page.txs or page.last_lt > after_lt:
+            yield page
+        if not page.more or page.last_lt <= after_lt:
+            return
+        after_lt = page.last_lt
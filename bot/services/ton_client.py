@@ -0,0 +1,307 @@
+# bot/services/ton_client.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+from ..config import settings
+from ..metrics import TON_API_ERRORS, TON_API_FAILOVERS, TON_API_HEDGED, TON_API_SECONDS
+from .send_scheduler import TokenBucket
+from .ton_api import (
+    TONAPI_BASE_URL, TONCENTER_BASE_URL,
+    IncomingTx, TonApiError, TonapiProvider, ToncenterProvider, TonProvider, TxPage,
+)
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Лимиты провайдеров (запросов в секунду): без ключа / с ключом бесплатного тарифа.
+# Платный тариф — TON_API_RPS / TON_API_FALLBACK_RPS.
+_TIER_RPS = {
+    "toncenter": (1.0, 10.0),
+    "tonapi": (1.0, 10.0),
+}
+_PROVIDERS = {
+    "toncenter": (ToncenterProvider, TONCENTER_BASE_URL),
+    "tonapi": (TonapiProvider, TONAPI_BASE_URL),
+}
+
+
+class CircuitBreaker:
+    """
+    closed → (failures подряд) → open → (через reset_after) → half_open: пропускаем одну пробу;
+    успех закрывает цепь, ошибка снова открывает.
+    """
+
+    def __init__(self, failures: int = 5, reset_after: float = 30.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.threshold = failures
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "open" if self.clock() - self._opened_at < self.reset_after else "half_open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def begin(self) -> None:
+        if self.state == "half_open":
+            self._probing = True
+
+    def release(self) -> None:
+        """Запрос отменён (проиграл хедж) — ни успех, ни ошибка."""
+        self._probing = False
+
+    def success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            self._opened_at = self.clock()
+        self._probing = False
+
+
+class LatencyWindow:
+    """Скользящее окно последних задержек успешных запросов; p95 для порога хеджирования."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class Upstream:
+    """Провайдер + его ведро запросов, предохранитель и статистика задержек."""
+
+    def __init__(self, provider: TonProvider, *, rps: float, breaker: CircuitBreaker, clock: Callable[[], float]) -> None:
+        self.provider = provider
+        self.name = provider.name
+        self.bucket = TokenBucket(rps, max(1.0, rps), clock)
+        self.breaker = breaker
+        self.latency = LatencyWindow()
+
+
+class ResilientTonClient:
+    """
+    Клиент TON API поверх нескольких провайдеров (первый — основной) с тем же интерфейсом,
+    что у TonProvider, — PaymentWatcher и TransactionStream его не отличают.
+
+    - у каждого провайдера свой лимит запросов: ждём токен, а не ловим 429;
+    - предохранитель: после серии ошибок провайдер выключается на время и проверяется одной пробой;
+    - ошибка → сразу тот же запрос у следующего провайдера;
+    - хеджирование (опционально): основной отвечает дольше своего p95 — дублируем запрос
+      следующему провайдеру, если у того есть свободный токен, берём первый ответ.
+      Дублируется около 5% запросов, поэтому средняя нагрузка почти не растёт.
+    """
+
+    def __init__(
+        self,
+        upstreams: list[Upstream],
+        *,
+        hedge: bool = False,
+        hedge_min: float = 0.2,
+        hedge_default: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not upstreams:
+            raise ValueError("at least one upstream is required")
+        self.upstreams = upstreams
+        self.hedge = hedge and len(upstreams) > 1
+        self.hedge_min = hedge_min
+        self.hedge_default = hedge_default
+        self.clock = clock
+        self.name = "→".join(u.name for u in upstreams)
+        # счётчики для логов/метрик
+        self.hedged = 0
+        self.failovers = 0
+
+    # ---------- один запрос к одному провайдеру ----------
+    async def _attempt(self, up: Upstream, op: Callable[[TonProvider], Awaitable[T]]) -> T:
+        wait = up.bucket.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        up.breaker.begin()
+        started = self.clock()
+        try:
+            result = await op(up.provider)
+        except TonApiError:
+            up.breaker.failure()
+            TON_API_ERRORS.inc(up.name)
+            raise
+        except BaseException:
+            up.breaker.release()
+            raise
+        up.breaker.success()
+        elapsed = self.clock() - started
+        up.latency.add(elapsed)
+        TON_API_SECONDS.observe(elapsed, up.name)
+        return result
+
+    def _hedge_after(self, up: Upstream) -> float:
+        p95 = up.latency.p95()
+        return self.hedge_default if p95 is None else max(p95, self.hedge_min)
+
+    async def _call(self, op: Callable[[TonProvider], Awaitable[T]]) -> T:
+        rest = [u for u in self.upstreams if u.breaker.available()]
+        if not rest:
+            raise TonApiError(f"{self.name}: all providers unavailable (circuit open)")
+        pending: dict[asyncio.Task, Upstream] = {}
+
+        def launch() -> None:
+            up = rest.pop(0)
+            pending[asyncio.create_task(self._attempt(up, op))] = up
+
+        launch()
+        hedge = self.hedge
+        last_error: Optional[TonApiError] = None
+        try:
+            while pending:
+                timeout = None
+                if hedge and rest and len(pending) == 1:
+                    timeout = self._hedge_after(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge = False  # один хедж на запрос
+                    # Хедж не должен ждать лимита: это лишний запрос, а не обязательный.
+                    if rest[0].bucket.delay() == 0:
+                        self.hedged += 1
+                        TON_API_HEDGED.inc()
+                        launch()
+                    continue
+                for task in done:
+                    up = pending.pop(task)
+                    try:
+                        return task.result()
+                    except TonApiError as e:
+                        last_error = e
+                        log.warning("ton api: %s failed: %s", up.name, e)
+                if not pending and rest:
+                    self.failovers += 1
+                    TON_API_FAILOVERS.inc()
+                    launch()
+            assert last_error is not None
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    # ---------- интерфейс TonProvider ----------
+    async def fetch_page(self, address: str, after_lt: int, limit: int = 100) -> TxPage:
+        return await self._call(lambda p: p.fetch_page(address, after_lt, limit))
+
+    async def fetch_incoming(self, address: str, after_lt: int, limit: int = 100) -> list[IncomingTx]:
+        return await self._call(lambda p: p.fetch_incoming(address, after_lt, limit))
+
+    async def latest_lt(self, address: str) -> int:
+        return await self._call(lambda p: p.latest_lt(address))
+
+    async def lt_at(self, address: str, utime: int) -> int:
+        return await self._call(lambda p: p.lt_at(address, utime))
+
+    async def stream_events(self, address: str) -> AsyncIterator[dict[str, Any]]:
+        """SSE у первого доступного провайдера; не удалось подключиться — сразу пробуем следующий."""
+        last_error: Optional[TonApiError] = None
+        for up in self.upstreams:
+            if not up.breaker.available():
+                continue
+            wait = up.bucket.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            up.breaker.begin()
+            connected = False
+            try:
+                async for event in up.provider.stream_events(address):
+                    if not connected:
+                        connected = True
+                        up.breaker.success()
+                    yield event
+            except TonApiError as e:
+                if connected:
+                    raise  # поток уже шёл — переподключение решает вызывающий
+                up.breaker.failure()
+                last_error = e
+                log.warning("ton api: %s stream failed: %s", up.name, e)
+                continue
+            finally:
+                up.breaker.release()
+            return
+        raise last_error or TonApiError(f"{self.name}: all providers unavailable (circuit open)")
+
+    async def aclose(self) -> None:
+        for up in self.upstreams:
+            await up.provider.aclose()
+
+
+def _tier_rps(name: str, api_key: Optional[str], override: Optional[float]) -> float:
+    if override:
+        return override
+    free, keyed = _TIER_RPS[name]
+    return keyed if api_key else free
+
+
+def build_ton_client(
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+    clock: Callable[[], float] = time.monotonic,
+) -> Optional[ResilientTonClient]:
+    """
+    Основной провайдер — TON_API_PROVIDER, запасной — второй из toncenter/tonapi (если TON_API_FAILOVER).
+    Оба ходят через один пул keep-alive соединений.
+    """
+    if settings.TON_API_PROVIDER == "none":
+        return None
+    if transport is None:
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings.TON_API_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.TON_API_MAX_CONNECTIONS,
+                keepalive_expiry=settings.TON_API_KEEPALIVE_SEC,
+            ),
+        )
+    primary = settings.TON_API_PROVIDER
+    plan = [(primary, settings.TON_API_BASE_URL, settings.TON_API_KEY, settings.TON_API_RPS)]
+    if settings.TON_API_FAILOVER:
+        fallback = "tonapi" if primary == "toncenter" else "toncenter"
+        plan.append((fallback, None, settings.TON_API_FALLBACK_KEY, settings.TON_API_FALLBACK_RPS))
+
+    upstreams = []
+    for name, base_url, api_key, rps in plan:
+        cls, default_url = _PROVIDERS[name]
+        provider = cls(base_url or default_url, api_key=api_key, timeout=settings.TON_API_TIMEOUT_SEC, transport=transport)
+        upstreams.append(Upstream(
+            provider,
+            rps=_tier_rps(name, api_key, rps),
+            breaker=CircuitBreaker(settings.TON_API_BREAKER_FAILURES, settings.TON_API_BREAKER_RESET_SEC, clock),
+            clock=clock,
+        ))
+    return ResilientTonClient(
+        upstreams,
+        hedge=settings.TON_API_HEDGE,
+        hedge_min=settings.TON_API_HEDGE_MIN_MS / 1000,
+        clock=clock,
+    )
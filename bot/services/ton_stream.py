@@ -0,0 +1,96 @@
+# bot/services/ton_stream.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any
+
+from ..config import settings
+from .ton_api import TonApiError, TonProvider
+from .watcher import PaymentWatcher
+
+log = logging.getLogger(__name__)
+
+
+def _event_lt(event: dict[str, Any]) -> int:
+    """lt из события (tonapi: lt, toncenter: transactions[].lt); 0 — если не распознали."""
+    try:
+        if "lt" in event:
+            return int(event["lt"])
+        txs = event.get("transactions") or []
+        return max((int(t.get("lt") or 0) for t in txs), default=0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class TransactionStream:
+    """
+    Push-режим наблюдения за оплатами: держим SSE-подписку на транзакции кошелька
+    и на каждое событие запускаем тик PaymentWatcher.
+
+    Само событие служит только сигналом — транзакции забираются от сохранённого курсора,
+    поэтому пропуски при обрыве связи догружаются автоматически (gap-fill по lt).
+    Серия событий схлопывается в один тик; в простое запросов к провайдеру нет.
+    """
+
+    def __init__(
+        self,
+        provider: TonProvider,
+        watcher: PaymentWatcher,
+        *,
+        reconnect_min: float = 1.0,
+        reconnect_max: float = 30.0,
+    ) -> None:
+        self.provider = provider
+        self.watcher = watcher
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self._wake = asyncio.Event()
+        self._last_lt = 0
+        self._delay = reconnect_min
+
+    async def _settle_loop(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            try:
+                n = await self.watcher.tick()
+                if n:
+                    log.info("payment stream: settled %d payment(s)", n)
+            except TonApiError as e:
+                log.warning("payment stream: provider error: %s", e)
+            except Exception:
+                log.exception("payment stream: tick failed")
+
+    async def _listen(self) -> None:
+        async for event in self.provider.stream_events(self.watcher.address):
+            self._delay = self.reconnect_min  # соединение живое — сбрасываем backoff
+            lt = _event_lt(event)
+            if lt and lt <= self._last_lt:
+                continue  # дубль после переподключения
+            self._last_lt = max(self._last_lt, lt)
+            self._wake.set()
+
+    async def run(self) -> None:
+        settler = asyncio.create_task(self._settle_loop())
+        try:
+            while True:
+                # При каждом (пере)подключении догружаем всё, что пришло после курсора.
+                self._wake.set()
+                try:
+                    await self._listen()
+                except TonApiError as e:
+                    log.warning("payment stream: %s; reconnect in %.1fs", e, self._delay)
+                await asyncio.sleep(self._delay)
+                self._delay = min(self._delay * 2, self.reconnect_max)
+        finally:
+            settler.cancel()
+            await asyncio.gather(settler, return_exceptions=True)
+
+
+def build_stream(provider: TonProvider, watcher: PaymentWatcher) -> TransactionStream:
+    return TransactionStream(
+        provider,
+        watcher,
+        reconnect_max=settings.PAYMENT_STREAM_RECONNECT_MAX_SEC,
+    )
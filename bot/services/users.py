@@ -0,0 +1,63 @@
+# bot/services/users.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import User
+
+
+class UserIdentityCache:
+    """tg_user_id → users.id в памяти (LRU): повторные пользователи не требуют SELECT."""
+
+    def __init__(self, capacity: int = 100_000) -> None:
+        self.capacity = capacity
+        self._ids: OrderedDict[int, int] = OrderedDict()
+
+    def get(self, tg_user_id: int) -> Optional[int]:
+        user_id = self._ids.get(tg_user_id)
+        if user_id is not None:
+            self._ids.move_to_end(tg_user_id)
+        return user_id
+
+    def put(self, tg_user_id: int, user_id: int) -> None:
+        self._ids[tg_user_id] = user_id
+        self._ids.move_to_end(tg_user_id)
+        if len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+
+async def resolve_user_id(
+    session: AsyncSession,
+    tg_user_id: int,
+    username: Optional[str],
+    cache: UserIdentityCache,
+    language: Optional[str] = None,
+) -> int:
+    """id пользователя в БД: из кеша, иначе SELECT, иначе INSERT (в текущей транзакции)."""
+    user_id = cache.get(tg_user_id)
+    if user_id is not None:
+        return user_id
+    user = await session.scalar(select(User).where(User.tg_user_id == tg_user_id))
+    if user is None:
+        user = User(tg_user_id=tg_user_id, username=username)
+        if language:
+            user.language = language
+        session.add(user)
+        await session.flush()
+    else:
+        if username and user.username != username:
+            user.username = username
+        if language and user.language != language:
+            user.language = language
+    return user.id
+
+
+# Единый кеш процесса
+identity_cache = UserIdentityCache()
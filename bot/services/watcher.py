@@ -0,0 +1,237 @@
+# bot/services/watcher.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..i18n import t
+from ..metrics import PAYMENTS_UNSETTLED
+from ..models import (
+    Order, OrderStatus, Payment, PaymentArchive, PaymentStatus, SyncCursor, UnmatchedPayment, User,
+)
+from ..storage import session_scope
+from .archive import pack_raw
+from .expiry import NotifySink
+from .fulfillment import enqueue_paid
+from .matching import PaymentIndex, Settlement, payment_index, plan_closed
+from .money import nano_to_decimal
+from .ton_api import IncomingTx, TonApiError, TonProvider
+
+log = logging.getLogger(__name__)
+
+
+async def seen_tx_hashes(session: AsyncSession, hashes: list[str]) -> set[str]:
+    """
+    Уже записанные транзакции — за заказами (в том числе вынесенными в архив)
+    и среди неразобранных.
+    """
+    seen: set[str] = set()
+    if not hashes:
+        return seen
+    for model in (Payment, PaymentArchive, UnmatchedPayment):
+        seen.update((await session.scalars(select(model.tx_hash).where(model.tx_hash.in_(hashes)))).all())
+    return seen
+
+
+async def record_transfers(
+    session: AsyncSession,
+    settlements: list[Settlement],
+    unmatched: Iterable[IncomingTx] = (),
+) -> list[int]:
+    """
+    Записать решения по пачке переводов и перевести полностью оплаченные заказы в PAID
+    (вместе с постановкой в очередь доставки). Ни один перевод не теряется: лишние и
+    опоздавшие пишутся за заказом (EXCESS/TIMEOUT), неразобранные — в unmatched_payments.
+    Возвращает id заказов, ставших PAID.
+    """
+    if settlements:
+        await session.execute(insert(Payment), [
+            {
+                "order_id": st.order_id,
+                "status": st.status,
+                "amount_ton": nano_to_decimal(st.tx.amount_nano),
+                "comment": st.tx.comment,
+                "tx_hash": st.tx.tx_hash,
+                "raw": pack_raw(st.tx.raw),
+            }
+            for st in settlements
+        ])
+    for st in settlements:
+        if st.status in (PaymentStatus.EXCESS, PaymentStatus.TIMEOUT):
+            PAYMENTS_UNSETTLED.inc(st.status.value.lower())
+            log.warning(
+                "order %s: %s transfer of %d nanoton (tx %s) — needs refund",
+                st.order_key, st.status.value, st.tx.amount_nano, st.tx.tx_hash,
+            )
+        elif st.overpaid_nano:
+            log.warning("order %s overpaid by %d nanoton", st.order_key, st.overpaid_nano)
+
+    unmatched = list(unmatched)
+    if unmatched:
+        await session.execute(insert(UnmatchedPayment), [
+            {
+                "amount_ton": nano_to_decimal(tx.amount_nano),
+                "comment": tx.comment[:128],
+                "sender": tx.sender,
+                "tx_hash": tx.tx_hash,
+                "raw": pack_raw(tx.raw),
+            }
+            for tx in unmatched
+        ])
+        PAYMENTS_UNSETTLED.inc("unmatched", amount=len(unmatched))
+        for tx in unmatched:
+            log.warning(
+                "unmatched transfer of %d nanoton from %s, comment %r (tx %s)",
+                tx.amount_nano, tx.sender, tx.comment, tx.tx_hash,
+            )
+
+    paid_ids = [st.order_id for st in settlements if st.completes_order]
+    if not paid_ids:
+        return []
+    # EXPIRED тоже: опоздавший, но уложившийся в окончательный срок перевод оплачивает заказ.
+    paid = list((await session.scalars(
+        update(Order)
+        .where(Order.id.in_(paid_ids), Order.status.in_([OrderStatus.WAITING_PAYMENT, OrderStatus.EXPIRED]))
+        .values(status=OrderStatus.PAID)
+        .returning(Order.id)
+    )).all())
+    # Доставка звёзд — в той же транзакции, что и PAID: оплата не потеряется между шагами.
+    await enqueue_paid(session, paid)
+    return paid
+
+
+class PaymentWatcher:
+    """
+    Единый фоновый наблюдатель за входящими переводами на TON_WALLET_ADDRESS.
+
+    Каждый тик делает ОДИН проход по провайдеру начиная с сохранённого курсора (lt),
+    затем сопоставляет пачку транзакций с открытыми заказами через PaymentIndex (O(1) на транзакцию).
+    Стоимость тика не зависит от числа открытых заказов. То, что индекс не узнал (истёкший или
+    уже оплаченный заказ, чужой комментарий), разбирается по БД — см. plan_closed.
+    """
+
+    def __init__(
+        self,
+        provider: TonProvider,
+        address: str,
+        *,
+        interval: float,
+        page_limit: int = 100,
+        max_pages: int = 20,
+        payment_timeout: float = 900,
+        notifier: Optional[NotifySink] = None,
+        index: PaymentIndex = payment_index,
+    ) -> None:
+        self.provider = provider
+        self.index = index
+        self.notifier = notifier
+        self.payment_timeout = timedelta(seconds=payment_timeout)
+        self.address = address
+        self.interval = interval
+        self.page_limit = page_limit
+        self.max_pages = max_pages
+        self.cursor_name = f"wallet:{address}"
+
+    # ---------- cursor ----------
+    async def _load_cursor(self) -> tuple[int, bool]:
+        """(lt курсора, создан ли он только что). Сессия — только на чтение строки курсора."""
+        async with session_scope() as session:
+            cur = await session.get(SyncCursor, self.cursor_name)
+            if cur is not None:
+                return cur.lt, False
+        # Первый запуск: историю не пролистываем, начинаем с текущей вершины.
+        # Догонять старые платежи — задача отдельной сверки.
+        return await self.provider.latest_lt(self.address), True
+
+    async def _fetch_since(self, after_lt: int) -> tuple[list[IncomingTx], int]:
+        """Входящие после after_lt и lt последней просмотренной транзакции (любой, не только входящей)."""
+        txs: list[IncomingTx] = []
+        for _ in range(self.max_pages):
+            page = await self.provider.fetch_page(self.address, after_lt, self.page_limit)
+            txs.extend(page.txs)
+            if page.last_lt <= after_lt:
+                break
+            after_lt = page.last_lt
+            if not page.more:
+                break
+        return txs, after_lt
+
+    # ---------- matching ----------
+    async def _settle(self, session: AsyncSession, txs: list[IncomingTx]) -> tuple[list[Settlement], list]:
+        """Записать пачку; возвращает (решения, получатели уведомления об оплате)."""
+        # Идемпотентность: уже записанные tx_hash пропускаем (одним запросом на таблицу).
+        seen = await seen_tx_hashes(session, [t.tx_hash for t in txs])
+        txs = [t for t in txs if t.tx_hash not in seen]
+        if not txs:
+            return [], []
+
+        # Заказы могли создать другие процессы — подтягиваем свежие в индекс.
+        await self.index.sync_recent(session)
+        settlements = self.index.plan(txs)
+        matched = {st.tx.tx_hash for st in settlements}
+        rest, unmatched = await plan_closed(
+            session, [t for t in txs if t.tx_hash not in matched], payment_timeout=self.payment_timeout,
+        )
+        settlements += rest
+        paid = await record_transfers(session, settlements, unmatched)
+        if not paid or self.notifier is None:
+            return settlements, []
+        recipients = (await session.execute(
+            select(Order.order_key, Order.quantity, User.tg_user_id, User.language)
+            .join(User, User.id == Order.user_id)
+            .where(Order.id.in_(paid))
+        )).all()
+        return settlements, recipients
+
+    # ---------- loop ----------
+    async def tick(self) -> int:
+        """Один проход: забрать новые транзакции и записать платежи. Возвращает число записанных платежей."""
+        # Сеть (страницы провайдера, ожидание лимитов) — без открытой сессии: на SQLite
+        # писатель один, и держать его на время HTTP значит тормозить все остальные записи.
+        after_lt, fresh = await self._load_cursor()
+        txs, last_lt = await self._fetch_since(after_lt)
+        if last_lt == after_lt and not fresh:
+            return 0
+        async with session_scope() as session:
+            settlements, recipients = await self._settle(session, txs) if txs else ([], [])
+            # Курсор двигаем в той же транзакции, что и платежи — ничего не теряем и не дублируем.
+            cursor = await session.get(SyncCursor, self.cursor_name)
+            if cursor is None:
+                cursor = SyncCursor(name=self.cursor_name)
+                session.add(cursor)
+            cursor.lt = last_lt
+            if txs:
+                cursor.tx_hash = txs[-1].tx_hash
+        # Индекс в памяти и уведомления — только после успешного коммита.
+        self.index.apply(settlements)
+        for key, qty, tg_user_id, lang in recipients:
+            self.notifier.submit(tg_user_id, t(lang, "payment_received", key=key, qty=qty))
+        return len(settlements)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                n = await self.tick()
+                if n:
+                    log.info("payment watcher: settled %d payment(s)", n)
+            except TonApiError as e:
+                log.warning("payment watcher: provider error: %s", e)
+            except Exception:
+                log.exception("payment watcher: tick failed")
+            await asyncio.sleep(self.interval)
+
+
+def build_watcher(provider: TonProvider, notifier: Optional[NotifySink] = None) -> PaymentWatcher:
+    return PaymentWatcher(
+        provider,
+        settings.TON_WALLET_ADDRESS,
+        interval=settings.PAYMENT_POLL_INTERVAL_SEC,
+        payment_timeout=settings.PAYMENT_TIMEOUT_SEC,
+        notifier=notifier,
+    )
@@ -0,0 +1,119 @@
+# bot/services/write_behind.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from functools import cache
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..storage import session_scope
+
+log = logging.getLogger(__name__)
+
+WriteOp = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class WriteBehind:
+    """
+    Очередь записей в БД с групповым коммитом.
+
+    Операции (корутины от сессии) копятся max_delay секунд или до max_batch штук и выполняются
+    одной транзакцией — на SQLite это убирает очередь за write-lock на каждое сообщение.
+    submit() возвращает future: кому нужна гарантия записи (например, перед показом
+    ссылок на оплату), тот его ждёт; остальные просто идут дальше.
+    Если пачка упала, операции переигрываются по одной, чтобы ошибка одной не утянула соседей.
+    """
+
+    def __init__(self, *, max_batch: int = 200, max_delay: float = 0.005) -> None:
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue[tuple[WriteOp, asyncio.Future]] = asyncio.Queue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.commits = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, op: WriteOp) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Очередь привязывается к циклу событий; новый цикл (рестарт, тесты) — новая очередь.
+            self._loop, self._queue, self._task = loop, asyncio.Queue(), None
+        fut = loop.create_future()
+        self._queue.put_nowait((op, fut))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return fut
+
+    async def write(self, op: WriteOp) -> Any:
+        """submit() + ожидание коммита."""
+        return await self.submit(op)
+
+    async def _collect(self) -> list[tuple[WriteOp, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Всё, что уже лежит в очереди, забираем без ожидания.
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _commit(self, batch: list[tuple[WriteOp, asyncio.Future]]) -> None:
+        try:
+            results = []
+            async with session_scope() as session:
+                for op, _ in batch:
+                    results.append(await op(session))
+            self.commits += 1
+        except Exception as e:
+            if len(batch) == 1:
+                _, fut = batch[0]
+                if not fut.done():
+                    fut.set_exception(e)
+                return
+            log.warning("write-behind: batch of %d failed, replaying one by one", len(batch))
+            for item in batch:
+                await self._commit([item])
+            return
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+    async def _run(self) -> None:
+        while not self._queue.empty():
+            batch = await self._collect()
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def flush(self) -> None:
+        """Дождаться записи всего, что уже поставлено в очередь."""
+        if self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def close(self) -> None:
+        await self.flush()
+
+
+@cache
+def get_write_behind() -> WriteBehind:
+    """Единая очередь процесса; создаётся при первой записи (импорт не читает настройки)."""
+    return WriteBehind(
+        max_batch=settings.WRITE_BEHIND_MAX_BATCH,
+        max_delay=settings.WRITE_BEHIND_MAX_DELAY_MS / 1000,
+    )
@@ -0,0 +1,52 @@
+"""
+Замер холодного старта: `python -m bot --startup-profile` печатает время каждой фазы
+(импорты, настройки, БД, сборка бота) и время от запуска до первого апдейта.
+
+Модуль нарочно без зависимостей — его импортирует bot/__main__ раньше всего остального,
+и момент этого импорта считается началом отсчёта (сам запуск интерпретатора не входит).
+"""
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+
+class StartupProfile:
+    def __init__(self, clock: Callable[[], float] = time.perf_counter, origin: Optional[float] = None) -> None:
+        self.clock = clock
+        self.origin = clock() if origin is None else origin
+        self.enabled = False
+        self.phases: list[tuple[str, float]] = []
+        self.first_update: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.phases.append((name, self.clock() - started))
+
+    def elapsed(self) -> float:
+        return self.clock() - self.origin
+
+    def update_received(self) -> bool:
+        """Отметить первый апдейт; True только для самого первого."""
+        if not self.enabled or self.first_update is not None:
+            return False
+        self.first_update = self.elapsed()
+        return True
+
+    def report(self) -> str:
+        lines = ["⏱ Профиль старта:"]
+        lines.extend(f" - {name:<34} {sec * 1000:8.1f} ms" for name, sec in self.phases)
+        lines.append(f" = {'готов принимать апдейты':<34} {self.elapsed() * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+# Профиль процесса; включается флагом --startup-profile
+startup = StartupProfile()
@@ -1,26 +1,251 @@
-﻿from contextlib import asynccontextmanager
+﻿import hashlib
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Optional, Sequence
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import delete, event, insert, inspect, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from .config import settings
-from .models import Base
+from .metrics import DB_COMMITS, DB_ERRORS, DB_QUERY_SECONDS
+from .models import Base, SchemaVersion
 
-# Пример: sqlite+aiosqlite:///./stars.db
-engine = create_async_engine(settings.DATABASE_URL, echo=False, future=True)
-SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
-async def init_db() -> None:
-    """Создать таблицы при первом запуске."""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+# ---------- профили движков ----------
+def _profile(url: str) -> str:
+    if settings.DB_PROFILE != "auto":
+        return settings.DB_PROFILE
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        return "sqlite"
+    if backend == "postgresql":
+        return "postgres"
+    return "default"
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def _sqlite_pragmas(engine: AsyncEngine, *, read_only: bool) -> None:
+    """PRAGMA на каждое новое соединение: WAL, синхронизация, кеш, mmap, ожидание блокировки."""
+    pragmas = [
+        "PRAGMA journal_mode=WAL",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",  # отрицательное значение — в КиБ
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, _record) -> None:
+        cur = dbapi_connection.cursor()
+        for p in pragmas:
+            cur.execute(p)
+        cur.close()
+
+
+def _build_sqlite(url: str) -> tuple[AsyncEngine, AsyncEngine]:
+    if _is_sqlite_memory(url):
+        # In-memory БД живёт в одном соединении — отдельный читатель её не увидит.
+        engine = create_async_engine(url, echo=False)
+        return engine, engine
+    # Писатель один: SQLite всё равно сериализует запись, а так не ловим SQLITE_BUSY внутри процесса.
+    writer = create_async_engine(url, echo=False, pool_size=1, max_overflow=0)
+    _sqlite_pragmas(writer, read_only=False)
+    # Читатели в WAL не мешают писателю и друг другу.
+    reader = create_async_engine(url, echo=False, pool_size=settings.SQLITE_READERS, max_overflow=0)
+    _sqlite_pragmas(reader, read_only=True)
+    return writer, reader
+
+
+def _build_postgres(url: str) -> tuple[AsyncEngine, AsyncEngine]:
+    engine = create_async_engine(
+        url,
+        echo=False,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE_SEC,
+        pool_pre_ping=True,
+        connect_args={
+            # кеш подготовленных (server-side) выражений asyncpg на соединение
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            # кеш prepared statements на стороне диалекта SQLAlchemy
+            "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        },
+    )
+    return engine, engine
+
+
+def build_engines(url: str) -> tuple[AsyncEngine, AsyncEngine]:
+    """(движок для записи, движок для чтения) по профилю из настроек."""
+    profile = _profile(url)
+    if profile == "sqlite":
+        return _build_sqlite(url)
+    if profile == "postgres":
+        return _build_postgres(url)
+    engine = create_async_engine(url, echo=False)
+    return engine, engine
+
+
+# ---------- метрики запросов ----------
+_VERBS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK"})
+
+
+def _verb(statement: str) -> str:
+    head = statement.lstrip()[:10].split(None, 1)
+    verb = head[0].upper() if head else ""
+    return verb if verb in _VERBS else "OTHER"
+
+
+def _instrument(engine: AsyncEngine, role: str) -> None:
+    """Время каждого SQL-выражения в bot_db_query_seconds{engine, statement} и число коммитов."""
+    sync = engine.sync_engine
+
+    @event.listens_for(sync, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync, "after_cursor_execute")
+    def _done(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, role, _verb(statement))
+
+    @event.listens_for(sync, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("query_started") if ctx.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_ERRORS.inc(role)
+
+    @event.listens_for(sync, "commit")
+    def _commit(conn):
+        DB_COMMITS.inc(role)
+
+
+# ---------- ленивые движки ----------
+# Движки и фабрики сессий создаются при первом обращении, а не при импорте модуля:
+# импорт bot.storage не читает настройки и не трогает драйвер БД.
+_state: dict[str, Any] = {}
+
+
+def _engines() -> dict[str, Any]:
+    if not _state:
+        # Пример: sqlite+aiosqlite:///./stars.db
+        writer, reader = build_engines(settings.DATABASE_URL)
+        _instrument(writer, "writer")
+        if reader is not writer:
+            _instrument(reader, "reader")
+        _state.update(
+            engine=writer,
+            read_engine=reader,
+            SessionLocal=async_sessionmaker(writer, expire_on_commit=False, class_=AsyncSession),
+            ReadSessionLocal=async_sessionmaker(reader, expire_on_commit=False, class_=AsyncSession),
+        )
+    return _state
+
+
+def __getattr__(name: str) -> Any:
+    # engine / read_engine / SessionLocal / ReadSessionLocal — как раньше, но по требованию
+    if name in ("engine", "read_engine", "SessionLocal", "ReadSessionLocal"):
+        return _engines()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ---------- схема ----------
+def schema_fingerprint(metadata=Base.metadata) -> str:
+    """Хеш таблиц, колонок (тип, NULL, PK) и индексов — меняется при любой правке моделей."""
+    parts = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        parts.append(table.name)
+        parts.extend(f"{c.name}:{c.type}:{c.nullable}:{c.primary_key}" for c in table.columns)
+        parts.extend(sorted(
+            f"ix:{ix.name}:{','.join(c.name for c in ix.columns)}:{ix.unique}" for ix in table.indexes
+        ))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _stored_fingerprint(conn) -> Optional[str]:
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return None
+    return conn.execute(select(SchemaVersion.fingerprint).where(SchemaVersion.id == 1)).scalar()
+
+
+def _sync_schema(conn, fingerprint: str) -> bool:
+    if _stored_fingerprint(conn) == fingerprint:
+        return False
+    Base.metadata.create_all(conn)
+    conn.execute(delete(SchemaVersion))
+    conn.execute(insert(SchemaVersion).values(id=1, fingerprint=fingerprint, applied_at=datetime.utcnow()))
+    return True
+
+
+async def init_db() -> bool:
+    """
+    Создать недостающие таблицы. Если сохранённый отпечаток схемы совпадает с моделями,
+    create_all (по запросу на каждую таблицу) пропускается — рестарт стоит одного SELECT.
+    Возвращает True, если схема проверялась/создавалась.
+    """
+    async with _engines()["engine"].begin() as conn:
+        return await conn.run_sync(_sync_schema, schema_fingerprint())
+
+
+async def dispose_engines() -> None:
+    """Закрыть пулы; сами движки остаются и переподключатся при следующем запросе."""
+    if not _state:
+        return
+    await _state["engine"].dispose()
+    if _state["read_engine"] is not _state["engine"]:
+        await _state["read_engine"].dispose()
 
 @asynccontextmanager
 async def session_scope():
     """Единый контекст работы с БД (begin/commit/rollback)."""
-    async with SessionLocal() as session:
+    async with _engines()["SessionLocal"]() as session:
         try:
             yield session
             await session.commit()
         except Exception:
             await session.rollback()
             raise
+
+@asynccontextmanager
+async def read_session():
+    """Сессия только для чтения (на SQLite — отдельный пул читателей, не ждёт писателя)."""
+    async with _engines()["ReadSessionLocal"]() as session:
+        yield session
+
+
+async def upsert(
+    session: AsyncSession,
+    model: type[Base],
+    rows: Sequence[dict[str, Any]],
+    index_elements: Sequence[str],
+    update_columns: Sequence[str],
+) -> None:
+    """
+    Пакетный INSERT ... ON CONFLICT DO UPDATE (SQLite/PostgreSQL) одним запросом;
+    для прочих диалектов — merge по строке.
+    """
+    if not rows:
+        return
+    dialect = session.bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        for row in rows:
+            await session.merge(model(**row))
+        return
+    stmt = insert(model).values(list(rows))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(index_elements),
+        set_={c: stmt.excluded[c] for c in update_columns},
+    )
+    await session.execute(stmt)
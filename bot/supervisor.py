@@ -0,0 +1,236 @@
+# bot/supervisor.py
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import multiprocessing as mp
+import queue as queue_mod
+from typing import Any, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiogram.types import BotCommand
+from aiohttp import web
+
+from .config import settings
+from .main import (
+    build_bot,
+    build_dispatcher,
+    prepare_runtime,
+    print_diagnostics,
+    run_background_jobs,
+    start_metrics,
+)
+from .metrics import QUEUE_DEPTH
+from .services.leader import LeaderLease
+from .services.price_oracle import get_price_oracle
+from .services.write_behind import get_write_behind
+from .storage import dispose_engines, init_db
+from .webhook import UpdateProcessor, build_app, update_chat_key
+
+log = logging.getLogger(__name__)
+
+LEADER_LEASE_NAME = "background-jobs"
+
+
+class ShardRouter:
+    """Раскладывает сырые апдейты по очередям воркеров по хешу chat_id."""
+
+    def __init__(self, queues: list[mp.Queue]) -> None:
+        self.queues = queues
+
+    def _queue(self, raw: dict[str, Any]) -> mp.Queue:
+        return self.queues[update_chat_key(raw) % len(self.queues)]
+
+    def submit(self, raw: dict[str, Any]) -> bool:
+        """Неблокирующая постановка (вебхук): False — шард переполнен."""
+        try:
+            self._queue(raw).put_nowait(raw)
+        except queue_mod.Full:
+            return False
+        return True
+
+    async def put(self, raw: dict[str, Any]) -> None:
+        """Блокирующая постановка (polling): при переполнении тормозим чтение getUpdates."""
+        q = self._queue(raw)
+        while True:
+            try:
+                q.put_nowait(raw)
+                return
+            except queue_mod.Full:
+                await asyncio.sleep(0.01)
+
+
+# ---------- worker process ----------
+async def _worker_main(index: int, shards: int, updates: mp.Queue) -> None:
+    # Индекс оплат загрузит наблюдатель, если этот воркер станет лидером.
+    await prepare_runtime(index=False)
+    # Воркеры шлют параллельно, а лимит Telegram общий на бота — делим его поровну.
+    bot = build_bot(shards)
+    dp = build_dispatcher()
+    processor = UpdateProcessor(
+        dp, bot, workers=settings.UPDATE_WORKERS, queue_size=settings.UPDATE_QUEUE_SIZE
+    )
+    processor.start()
+    QUEUE_DEPTH.track(lambda: processor.depth, "updates")
+    metrics_runner = await start_metrics(index)
+
+    # Наблюдатель оплат и прочие синглтон-задачи — только в процессе-лидере.
+    lease = LeaderLease(LEADER_LEASE_NAME, ttl=settings.LEADER_LEASE_TTL_SEC)
+    jobs = functools.partial(run_background_jobs, bot)
+    leader_task = asyncio.create_task(lease.run_while_leader(jobs))
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, updates.get)
+            if raw is None:
+                break
+            while not processor.submit(raw):
+                await asyncio.sleep(0.005)
+    finally:
+        leader_task.cancel()
+        await asyncio.gather(leader_task, return_exceptions=True)
+        await processor.stop()
+        await dp.storage.close()
+        await get_write_behind().close()
+        await bot.session.close()
+        await get_price_oracle().aclose()
+        await dispose_engines()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        log.info("worker %d stopped", index)
+
+
+def _worker_entry(index: int, shards: int, updates: mp.Queue) -> None:
+    try:
+        asyncio.run(_worker_main(index, shards, updates))
+    except KeyboardInterrupt:
+        pass
+
+
+# ---------- ingress ----------
+async def _poll_ingress(bot: Bot, router: ShardRouter, allowed_updates: list[str]) -> None:
+    """
+    long polling без разбора апдейтов в модели: сырые JSON сразу уходят в шарды,
+    так что процесс-приёмник не упирается в CPU.
+    """
+    await bot.delete_webhook(drop_pending_updates=True)
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    offset: Optional[int] = None
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as http:
+        while True:
+            payload = {"timeout": 30, "allowed_updates": allowed_updates}
+            if offset is not None:
+                payload["offset"] = offset
+            try:
+                async with http.post(url, json=payload) as rsp:
+                    data = await rsp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                log.warning("getUpdates failed: %r", e)
+                await asyncio.sleep(1)
+                continue
+            if not data.get("ok"):
+                retry = (data.get("parameters") or {}).get("retry_after", 1)
+                log.warning("getUpdates error: %s", data.get("description"))
+                await asyncio.sleep(retry)
+                continue
+            for raw in data["result"]:
+                offset = raw["update_id"] + 1
+                await router.put(raw)
+
+
+async def _webhook_ingress(bot: Bot, router: ShardRouter, allowed_updates: list[str]) -> None:
+    app = build_app(router, path=settings.WEBHOOK_PATH, secret=settings.WEBHOOK_SECRET)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+    await bot.set_webhook(
+        url=settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH,
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=allowed_updates,
+        max_connections=100,
+        drop_pending_updates=True,
+    )
+    print(f"🚀 Вебхук слушает {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+# ---------- supervisor ----------
+class Supervisor:
+    """
+    Процесс-приёмник апдейтов + N процессов-воркеров со своим Dispatcher.
+    Апдейты одного чата всегда идут в один воркер, поэтому порядок и FSM (OrderFlow)
+    не разъезжаются. Упавший воркер перезапускается на той же очереди.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self._ctx = mp.get_context("spawn")
+        per_worker = max(1, settings.UPDATE_QUEUE_SIZE // workers)
+        self.queues = [self._ctx.Queue(maxsize=per_worker) for _ in range(workers)]
+        self.procs: list[Optional[mp.Process]] = [None] * workers
+
+    def _spawn(self, i: int) -> None:
+        p = self._ctx.Process(target=_worker_entry, args=(i, self.workers, self.queues[i]), name=f"bot-worker-{i}")
+        p.start()
+        self.procs[i] = p
+
+    async def _watch_workers(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            for i, p in enumerate(self.procs):
+                if p is not None and not p.is_alive():
+                    log.warning("worker %d exited with %s, restarting", i, p.exitcode)
+                    self._spawn(i)
+
+    async def _shutdown(self, timeout: float = 15.0) -> None:
+        for q in self.queues:
+            try:
+                q.put(None, timeout=1)
+            except queue_mod.Full:
+                pass
+        loop = asyncio.get_running_loop()
+        for p in self.procs:
+            if p is None:
+                continue
+            await loop.run_in_executor(None, p.join, timeout)
+            if p.is_alive():
+                p.terminate()
+
+    async def run(self) -> None:
+        print_diagnostics()
+        print("⏳ Инициализирую БД…")
+        await init_db()  # один раз здесь, а не гонкой в каждом воркере
+        await dispose_engines()  # соединения родителя воркерам не нужны
+        print(f"✅ DB init OK. Запускаю {self.workers} воркер(ов)…")
+
+        for i in range(self.workers):
+            self._spawn(i)
+        monitor = asyncio.create_task(self._watch_workers())
+
+        bot = build_bot()
+        dp = build_dispatcher()
+        allowed = dp.resolve_used_update_types()
+        await dp.storage.close()
+        await bot.set_my_commands([BotCommand(command="start", description="Начать")])
+        router = ShardRouter(self.queues)
+        try:
+            if settings.BOT_MODE == "webhook":
+                await _webhook_ingress(bot, router, allowed)
+            else:
+                print("🚀 Запускаю бота… Нажмите Ctrl+C для остановки.")
+                await _poll_ingress(bot, router, allowed)
+        finally:
+            monitor.cancel()
+            await asyncio.gather(monitor, return_exceptions=True)
+            await self._shutdown()
+            await bot.session.close()
+
+
+def run_supervisor(workers: int) -> None:
+    asyncio.run(Supervisor(workers).run())
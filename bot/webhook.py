@@ -0,0 +1,139 @@
+# bot/webhook.py
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from .config import settings
+from .metrics import QUEUE_DEPTH
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_chat_key(raw: dict[str, Any]) -> int:
+    """
+    Ключ шардирования апдейта: id чата (или пользователя), без разбора в pydantic-модель.
+    Апдейты одного чата всегда попадают в один и тот же шард — порядок и FSM сохраняются.
+    """
+    for name, event in raw.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+        user = event.get("from") or event.get("user")
+        if user and "id" in user:
+            return int(user["id"])
+    return int(raw.get("update_id") or 0)
+
+
+class UpdateProcessor:
+    """
+    Ограниченная очередь апдейтов с пулом воркеров.
+
+    Апдейты раскладываются по шардам по update_chat_key: у каждого воркера своя очередь,
+    поэтому сообщения одного чата обрабатываются строго по порядку, а разные чаты — параллельно.
+    Переполненный шард не блокирует приём: submit() возвращает False, и вызывающий
+    отказывает в приёме (Telegram повторит доставку позже).
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, *, workers: int, queue_size: int) -> None:
+        self.dp = dp
+        self.bot = bot
+        per_shard = max(1, queue_size // workers)
+        self._queues: list[asyncio.Queue[dict[str, Any]]] = [
+            asyncio.Queue(maxsize=per_shard) for _ in range(workers)
+        ]
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def submit(self, raw: dict[str, Any]) -> bool:
+        q = self._queues[update_chat_key(raw) % len(self._queues)]
+        try:
+            q.put_nowait(raw)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _worker(self, q: asyncio.Queue[dict[str, Any]]) -> None:
+        while True:
+            raw = await q.get()
+            try:
+                await self.dp.feed_raw_update(self.bot, raw)
+            except Exception:
+                log.exception("update %s failed", raw.get("update_id"))
+            finally:
+                q.task_done()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Дообработать принятое (не дольше drain_timeout) и остановить воркеров."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning("webhook: %d update(s) dropped on shutdown", self.depth)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def build_app(processor, *, path: str, secret: Optional[str]) -> web.Application:
+    """HTTP-приёмник апдейтов; processor — любой объект с submit(raw) -> bool."""
+
+    async def handle(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            raw = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(raw, dict) or not processor.submit(raw):
+            # Очередь полна — сбрасываем нагрузку; Telegram повторит доставку.
+            return web.Response(status=503 if isinstance(raw, dict) else 400)
+        # Подтверждаем сразу, обработка идёт в воркерах.
+        return web.Response(status=200)
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Поднять встроенный HTTP-сервер, зарегистрировать вебхук и работать до отмены."""
+    processor = UpdateProcessor(
+        dp, bot, workers=settings.UPDATE_WORKERS, queue_size=settings.UPDATE_QUEUE_SIZE
+    )
+    QUEUE_DEPTH.track(lambda: processor.depth, "updates")
+    app = build_app(processor, path=settings.WEBHOOK_PATH, secret=settings.WEBHOOK_SECRET)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+
+    processor.start()
+    await site.start()
+    await bot.set_webhook(
+        url=settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH,
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=100,
+        drop_pending_updates=True,
+    )
+    print(f"🚀 Вебхук слушает {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await processor.stop()
@@ -0,0 +1,158 @@
+"""
+Локальный сервер Bot API для нагрузочного теста. Бот ходит сюда через TELEGRAM_API_URL:
+getUpdates отдаёт апдейты, которые «отправили» виртуальные пользователи, а ответы бота
+(sendMessage, answerCallbackQuery, ...) будят того, кто их ждёт.
+
+Лимитов Telegram здесь нет — меряем сам бот (его SendScheduler лимиты по-прежнему соблюдает).
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import itertools
+import json
+import time
+from typing import Any, Optional
+
+from aiohttp import web
+
+# Методы, которые считаются ответом пользователю (остальные — служебные: getMe, setMyCommands, ...).
+REPLY_METHODS = frozenset({
+    "sendMessage", "editMessageText", "editMessageReplyMarkup", "answerCallbackQuery",
+})
+
+
+class Reply:
+    __slots__ = ("method", "params", "at")
+
+    def __init__(self, method: str, params: dict[str, Any], at: float) -> None:
+        self.method = method
+        self.params = params
+        self.at = at
+
+    @property
+    def text(self) -> str:
+        return self.params.get("text") or ""
+
+    def markup(self) -> dict[str, Any]:
+        raw = self.params.get("reply_markup")
+        return json.loads(raw) if isinstance(raw, str) else (raw or {})
+
+
+class FakeTelegram:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, *, poll_timeout_cap: float = 1.0) -> None:
+        self.host = host
+        self.port = port
+        self.poll_timeout_cap = poll_timeout_cap
+        self.base_url = ""
+        # Апдейты, ещё не подтверждённые offset'ом; update_id растёт монотонно.
+        self._pending: collections.deque[dict[str, Any]] = collections.deque()
+        self._has_updates = asyncio.Event()
+        self._update_id = itertools.count(1)
+        self._message_id = itertools.count(1)
+        self._callback_chat: dict[str, int] = {}
+        self._inbox: dict[int, asyncio.Queue[Reply]] = collections.defaultdict(asyncio.Queue)
+        self._runner: Optional[web.AppRunner] = None
+        self.polled = asyncio.Event()  # бот сделал первый getUpdates — готов
+        # счётчики
+        self.delivered = 0
+        self.calls: collections.Counter[str] = collections.Counter()
+
+    # ---------- сторона пользователей ----------
+    def _push(self, update: dict[str, Any]) -> None:
+        update["update_id"] = next(self._update_id)
+        self._pending.append(update)
+        self._has_updates.set()
+
+    @staticmethod
+    def _user(user_id: int, lang: str) -> dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"load{user_id}", "language_code": lang}
+
+    def send_text(self, user_id: int, text: str, lang: str = "ru") -> None:
+        self._push({"message": {
+            "message_id": next(self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id, lang),
+            "text": text,
+            **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]}
+               if text.startswith("/") else {}),
+        }})
+
+    def press(self, user_id: int, data: str, lang: str = "ru") -> None:
+        cb_id = f"{user_id}:{next(self._message_id)}"
+        self._callback_chat[cb_id] = user_id
+        self._push({"callback_query": {
+            "id": cb_id,
+            "from": self._user(user_id, lang),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1, "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"}, "text": "…",
+            },
+        }})
+
+    async def reply(self, user_id: int, timeout: float) -> Reply:
+        """Следующий ответ бота этому пользователю (в порядке отправки)."""
+        return await asyncio.wait_for(self._inbox[user_id].get(), timeout)
+
+    # ---------- сторона бота ----------
+    async def _get_updates(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = min(float(params.get("timeout") or 0), self.poll_timeout_cap)
+        while self._pending and self._pending[0]["update_id"] < offset:
+            self._pending.popleft()
+        if not self._pending and timeout > 0:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = list(itertools.islice(self._pending, limit))
+        self.delivered = max(self.delivered, batch[-1]["update_id"]) if batch else self.delivered
+        return batch
+
+    def _result(self, method: str, params: dict[str, Any]) -> Any:
+        if method in ("sendMessage", "editMessageText"):
+            return {
+                "message_id": int(params.get("message_id") or next(self._message_id)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Load", "username": "load_test_bot"}
+        return True
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        # aiogram шлёт form-data, «сырой» приёмник супервизора — JSON; Telegram понимает оба.
+        params = await request.json() if request.content_type == "application/json" else dict(await request.post())
+        self.calls[method] += 1
+        if method == "getUpdates":
+            self.polled.set()
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if method in REPLY_METHODS:
+            chat_id = params.get("chat_id")
+            user_id = int(chat_id) if chat_id else self._callback_chat.pop(params.get("callback_query_id", ""), None)
+            if user_id is not None:
+                self._inbox[user_id].put_nowait(Reply(method, params, time.perf_counter()))
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    # ---------- жизненный цикл ----------
+    async def start(self) -> str:
+        app = web.Application(client_max_size=4 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{self.host}:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
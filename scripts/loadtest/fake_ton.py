@@ -0,0 +1,120 @@
+"""
+Заглушка toncenter (API v3) и tonapi (API v2) для нагрузочного теста: хранит входящие
+переводы кошелька и отдаёт их страницами так же, как настоящие провайдеры.
+Бот направляется сюда через TON_API_BASE_URL (режим наблюдателя — poll).
+"""
+from __future__ import annotations
+
+import base64
+import bisect
+import hashlib
+import itertools
+import time
+from typing import Any, Optional
+
+from aiohttp import web
+
+
+class FakeTon:
+    def __init__(self, address: str, host: str = "127.0.0.1", port: int = 0, start_lt: int = 1_000) -> None:
+        self.address = address
+        self.host = host
+        self.port = port
+        self.base_url = ""
+        # lt растут монотонно, поэтому список всегда отсортирован — выборка через bisect.
+        self._lts: list[int] = []
+        self._txs: list[dict[str, Any]] = []
+        self._lt = itertools.count(start_lt + 1)
+        self._runner: Optional[web.AppRunner] = None
+        self.requests = 0
+
+    def pay(self, amount_nano: int, comment: str, sender: str = "EQLoadTestSender") -> dict[str, Any]:
+        """Входящий перевод на кошелёк бота."""
+        lt = next(self._lt)
+        tx = {"lt": lt, "hash": hashlib.sha256(f"load{lt}".encode()).hexdigest(), "utime": int(time.time()), "amount": amount_nano,
+              "comment": comment, "sender": sender}
+        self._lts.append(lt)
+        self._txs.append(tx)
+        return tx
+
+    # ---------- выборка ----------
+    def _asc(self, after_lt: int, limit: int) -> list[dict[str, Any]]:
+        i = bisect.bisect_right(self._lts, after_lt)
+        return self._txs[i:i + limit]
+
+    def _desc(self, limit: int, before_lt: Optional[int] = None, end_utime: Optional[int] = None) -> list[dict[str, Any]]:
+        j = len(self._txs) if before_lt is None else bisect.bisect_left(self._lts, before_lt)
+        out = []
+        for tx in reversed(self._txs[:j]):
+            if end_utime is not None and tx["utime"] > end_utime:
+                continue
+            out.append(tx)
+            if len(out) >= limit:
+                break
+        return out
+
+    # ---------- форматы провайдеров (хеш у toncenter — base64, у tonapi — hex) ----------
+    @staticmethod
+    def _toncenter(tx: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "hash": base64.b64encode(bytes.fromhex(tx["hash"])).decode(),
+            "lt": str(tx["lt"]),
+            "now": tx["utime"],
+            "in_msg": {
+                "source": tx["sender"],
+                "value": str(tx["amount"]),
+                "message_content": {"decoded": {"type": "text_comment", "comment": tx["comment"]}},
+            },
+        }
+
+    @staticmethod
+    def _tonapi(tx: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "hash": tx["hash"],
+            "lt": tx["lt"],
+            "utime": tx["utime"],
+            "in_msg": {
+                "source": {"address": tx["sender"]},
+                "value": tx["amount"],
+                "decoded_op_name": "text_comment",
+                "decoded_body": {"text": tx["comment"]},
+            },
+        }
+
+    async def _toncenter_transactions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        q = request.query
+        limit = int(q.get("limit", 100))
+        if q.get("sort") == "desc":
+            end = int(q["end_utime"]) if "end_utime" in q else None
+            txs = self._desc(limit, end_utime=end)
+        else:
+            txs = self._asc(int(q.get("start_lt", 1)) - 1, limit)
+        return web.json_response({"transactions": [self._toncenter(t) for t in txs]})
+
+    async def _tonapi_transactions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        q = request.query
+        limit = int(q.get("limit", 100))
+        if q.get("sort_order") == "desc":
+            txs = self._desc(limit, before_lt=int(q["before_lt"]) if "before_lt" in q else None)
+        else:
+            txs = self._asc(int(q.get("after_lt", 0)), limit)
+        return web.json_response({"transactions": [self._tonapi(t) for t in txs]})
+
+    # ---------- жизненный цикл ----------
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/api/v3/transactions", self._toncenter_transactions)
+        app.router.add_get("/v2/blockchain/accounts/{address}/transactions", self._tonapi_transactions)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{self.host}:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
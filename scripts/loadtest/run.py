@@ -0,0 +1,421 @@
+"""
+Нагрузочный тест бота целиком: настоящий процесс `python -m bot` против локальных
+заглушек Bot API и toncenter. Виртуальные пользователи проходят путь покупки:
+
+    /start → количество звёзд (take_qty) → перевод TON с комментарием → «Проверить оплату» (check:)
+
+    python scripts/loadtest/run.py --users 2000 --concurrency 500
+    python scripts/loadtest/run.py --users 5000 --workers 4 --json report.json
+    python scripts/loadtest/run.py --env DATABASE_URL=postgresql+asyncpg://... --env FSM_STORAGE=memory
+
+Отчёт: апдейтов в секунду, задержка ответа по шагам (p50/p95/p99, со стороны пользователя),
+время обработчиков p50/p95/p99 (гистограмма bot_handler_seconds из /metrics бота),
+коммитов БД в секунду, память процессов бота. --json пишет те же числа для сравнения
+между прогонами (регрессии).
+
+Бот запускается во временном каталоге, так что .env разработчика не подмешивается;
+нужные настройки задаются через --env KEY=VALUE.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import signal
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+import aiohttp
+
+from fake_telegram import FakeTelegram, Reply
+from fake_ton import FakeTon
+
+ROOT = Path(__file__).resolve().parents[2]
+WALLET = "EQLoadTestWallet000000000000000000000000000000000"
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+# ---------- статистика ----------
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def histogram_quantile(buckets: dict[float, float], q: float) -> float:
+    """Как histogram_quantile в Prometheus: линейная интерполяция внутри корзины."""
+    bounds = sorted(buckets)
+    if not bounds or buckets[bounds[-1]] == 0:
+        return math.nan
+    rank = q * buckets[bounds[-1]]
+    prev_bound, prev_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == math.inf:
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return bounds[-1]
+
+
+def parse_metrics(text: str) -> list[tuple[str, dict[str, str], float]]:
+    out = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        m = _SAMPLE.match(line)
+        if m:
+            out.append((m.group(1), dict(_LABEL.findall(m.group(2) or "")), float(m.group(3))))
+    return out
+
+
+@dataclass
+class Snapshot:
+    at: float
+    handler_buckets: dict[float, float] = field(default_factory=lambda: defaultdict(float))
+    commits: float = 0.0
+    rss: float = 0.0
+
+    @classmethod
+    def from_texts(cls, texts: list[str]) -> "Snapshot":
+        snap = cls(time.perf_counter())
+        for text in texts:
+            for name, labels, value in parse_metrics(text):
+                if name == "bot_handler_seconds_bucket":
+                    le = labels["le"]
+                    snap.handler_buckets[math.inf if le == "+Inf" else float(le)] += value
+                elif name == "bot_db_commits_total":
+                    snap.commits += value
+                elif name == "process_resident_memory_bytes":
+                    snap.rss += value
+        return snap
+
+
+class MetricsProbe:
+    """Опрос /metrics всех процессов бота раз в interval: первый/последний снимок и пик памяти."""
+
+    def __init__(self, urls: list[str], interval: float = 1.0) -> None:
+        self.urls = urls
+        self.interval = interval
+        self.first: Optional[Snapshot] = None
+        self.last: Optional[Snapshot] = None
+        self.peak_rss = 0.0
+
+    async def scrape(self, http: aiohttp.ClientSession) -> Snapshot:
+        texts = []
+        for url in self.urls:
+            async with http.get(url) as rsp:
+                texts.append(await rsp.text())
+        snap = Snapshot.from_texts(texts)
+        self.first = self.first or snap
+        self.last = snap
+        self.peak_rss = max(self.peak_rss, snap.rss)
+        return snap
+
+    async def run(self, http: aiohttp.ClientSession) -> None:
+        while True:
+            try:
+                await self.scrape(http)
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(self.interval)
+
+
+# ---------- виртуальный пользователь ----------
+@dataclass
+class Results:
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    completed: int = 0
+    failed: int = 0
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    notifications: int = 0
+
+
+class User:
+    def __init__(self, uid: int, tg: FakeTelegram, ton: FakeTon, args: argparse.Namespace,
+                 results: Results, rng: random.Random, paid_texts: frozenset[str]) -> None:
+        self.uid = uid
+        self.tg = tg
+        self.ton = ton
+        self.args = args
+        self.results = results
+        self.rng = rng
+        self.paid_texts = paid_texts
+        self.lang = rng.choice(("ru", "en"))
+
+    async def _expect(self, step: str, methods: tuple[str, ...], started: float) -> Reply:
+        deadline = started + self.args.reply_timeout
+        while True:
+            reply = await self.tg.reply(self.uid, max(0.001, deadline - time.perf_counter()))
+            if reply.method in methods:
+                self.results.latencies[step].append(reply.at - started)
+                return reply
+            self.results.notifications += 1  # например, «оплата получена» от наблюдателя
+
+    async def run(self) -> None:
+        started = time.perf_counter()
+        self.tg.send_text(self.uid, "/start", self.lang)
+        await self._expect("start", ("sendMessage",), started)
+
+        qty = self.rng.randint(self.args.qty_min, self.args.qty_max)
+        started = time.perf_counter()
+        self.tg.send_text(self.uid, str(qty), self.lang)
+        reply = await self._expect("take_qty", ("sendMessage",), started)
+        memo = amount = None
+        for row in reply.markup().get("inline_keyboard", []):
+            for button in row:
+                if (button.get("callback_data") or "").startswith("check:"):
+                    memo = button["callback_data"].split(":", 1)[1]
+                if (button.get("url") or "").startswith("ton://"):
+                    amount = int(parse_qs(urlparse(button["url"]).query)["amount"][0])
+        if memo is None or amount is None:
+            raise RuntimeError(f"no payment keyboard in reply: {reply.text[:60]!r}")
+
+        paid_at = time.perf_counter()
+        self.ton.pay(amount, memo)
+        while True:
+            started = time.perf_counter()
+            self.tg.press(self.uid, f"check:{memo}", self.lang)
+            reply = await self._expect("check", ("answerCallbackQuery",), started)
+            if reply.text in self.paid_texts:
+                self.results.latencies["payment_confirmed"].append(reply.at - paid_at)
+                return
+            if time.perf_counter() - paid_at > self.args.pay_timeout:
+                raise TimeoutError("payment not confirmed")
+            await asyncio.sleep(self.args.check_interval)
+
+
+async def run_users(args: argparse.Namespace, tg: FakeTelegram, ton: FakeTon, results: Results) -> None:
+    from bot.i18n import LANGS, t
+
+    paid_texts = frozenset(t(lang, "check_paid") for lang in LANGS)
+    rng = random.Random(args.seed)
+    gate = asyncio.Semaphore(args.concurrency)
+    spacing = args.ramp / args.users if args.ramp else 0.0
+
+    async def one(i: int) -> None:
+        if spacing:
+            await asyncio.sleep(i * spacing)
+        async with gate:
+            user = User(10_000_000 + i, tg, ton, args, results, random.Random(rng.random()), paid_texts)
+            try:
+                await user.run()
+                results.completed += 1
+            except (asyncio.TimeoutError, TimeoutError, RuntimeError) as e:
+                results.failed += 1
+                results.errors[type(e).__name__ + (f": {e}" if str(e) else "")] += 1
+
+    await asyncio.gather(*(one(i) for i in range(args.users)))
+
+
+# ---------- процесс бота ----------
+def bot_env(args: argparse.Namespace, tg_url: str, ton_url: str, workdir: str) -> dict[str, str]:
+    env = {
+        "BOT_TOKEN": "123456:LOADTEST",
+        "BOT_MODE": "polling",
+        "TELEGRAM_API_URL": tg_url,
+        "TON_WALLET_ADDRESS": WALLET,
+        "TON_API_PROVIDER": "toncenter",
+        "TON_API_BASE_URL": ton_url,
+        "TON_API_FAILOVER": "false",
+        "TON_API_RPS": "1000",
+        "PAYMENT_WATCH_MODE": "poll",
+        "PAYMENT_POLL_INTERVAL_SEC": "1",
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/loadtest.db",
+        "FRAGMENT_PRICE_MODE": "mock",
+        "FULFILLMENT_ENABLED": "false",
+        "ARCHIVE_ENABLED": "false",
+        "METRICS_ENABLED": "true",
+        "METRICS_HOST": "127.0.0.1",
+        "METRICS_PORT": str(args.metrics_port),
+        # У заглушки нет лимитов Telegram; поднимаем общий лимит, чтобы мерить бота, а не его.
+        "SEND_GLOBAL_RATE": "100000",
+    }
+    for item in args.env:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--env ожидает KEY=VALUE, получено {item!r}")
+        env[key] = value
+    return env
+
+
+async def start_bot(args: argparse.Namespace, env: dict[str, str], workdir: str):
+    log_path = Path(workdir) / "bot.log"
+    log_file = open(log_path, "wb")
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bot", "--workers", str(args.workers),
+        cwd=workdir,
+        env={**os.environ, **env, "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))},
+        stdout=log_file, stderr=asyncio.subprocess.STDOUT,
+    )
+    return proc, log_path
+
+
+async def wait_ready(proc, tg: FakeTelegram, urls: list[str], timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as http:
+        pending = list(urls)
+        while pending or not tg.polled.is_set():
+            if proc.returncode is not None:
+                raise RuntimeError(f"bot exited with code {proc.returncode}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError("bot did not become ready in time")
+            for url in list(pending):
+                try:
+                    async with http.get(url) as rsp:
+                        if rsp.status == 200:
+                            pending.remove(url)
+                except aiohttp.ClientError:
+                    pass
+            await asyncio.sleep(0.2)
+
+
+async def stop_bot(proc) -> None:
+    if proc.returncode is None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(proc.wait(), 20)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+
+# ---------- отчёт ----------
+def build_report(args, results: Results, tg: FakeTelegram, probe: MetricsProbe, t0: float, t1: float,
+                 updates0: int) -> dict:
+    duration = t1 - t0
+    report = {
+        "users": args.users,
+        "workers": args.workers,
+        "completed": results.completed,
+        "failed": results.failed,
+        "errors": dict(results.errors),
+        "duration_sec": round(duration, 3),
+        "updates": tg.delivered - updates0,
+        "updates_per_sec": round((tg.delivered - updates0) / duration, 1) if duration else 0.0,
+        "flows_per_sec": round(results.completed / duration, 2) if duration else 0.0,
+        "bot_notifications": results.notifications,
+        "latency_ms": {
+            step: {f"p{int(q * 100)}": round(percentile(vals, q) * 1000, 1) for q in (0.5, 0.95, 0.99)}
+            for step, vals in results.latencies.items()
+        },
+    }
+    if probe.first is not None and probe.last is not None:
+        first, last = probe.first, probe.last
+        span = last.at - first.at
+        buckets = {le: last.handler_buckets[le] - first.handler_buckets.get(le, 0.0) for le in last.handler_buckets}
+        report["handler_ms"] = {
+            f"p{int(q * 100)}": round(histogram_quantile(buckets, q) * 1000, 2) for q in (0.5, 0.95, 0.99)
+        }
+        report["db_commits"] = int(last.commits - first.commits)
+        report["db_commits_per_sec"] = round((last.commits - first.commits) / span, 1) if span > 0 else 0.0
+        report["rss_mb"] = round(last.rss / 2**20, 1)
+        report["peak_rss_mb"] = round(probe.peak_rss / 2**20, 1)
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"\n📊 Пользователей: {report['users']} (воркеров бота: {report['workers']}), "
+          f"завершили {report['completed']}, с ошибкой {report['failed']}")
+    for error, n in report["errors"].items():
+        print(f"   ! {error}: {n}")
+    print(f" - длительность:          {report['duration_sec']} с")
+    print(f" - апдейтов/с:            {report['updates_per_sec']} ({report['updates']} всего)")
+    print(f" - покупок/с:             {report['flows_per_sec']}")
+    for step, p in report["latency_ms"].items():
+        print(f" - ответ {step:<17} p50 {p['p50']:>8} ms  p95 {p['p95']:>8} ms  p99 {p['p99']:>8} ms")
+    if "handler_ms" in report:
+        h = report["handler_ms"]
+        print(f" - обработчики           p50 {h['p50']:>8} ms  p95 {h['p95']:>8} ms  p99 {h['p99']:>8} ms")
+        print(f" - коммитов БД/с:         {report['db_commits_per_sec']} ({report['db_commits']} всего)")
+        print(f" - память бота:           {report['rss_mb']} MiB (пик {report['peak_rss_mb']} MiB)")
+
+
+# ---------- main ----------
+async def main_async(args: argparse.Namespace) -> int:
+    tg = FakeTelegram()
+    ton = FakeTon(WALLET)
+    await tg.start()
+    await ton.start()
+    workdir = tempfile.mkdtemp(prefix="stars-loadtest-")
+    env = bot_env(args, tg.base_url, ton.base_url, workdir)
+    # Тексты ответов (i18n) читаются с теми же настройками, что у бота.
+    os.environ.update(env)
+    sys.path.insert(0, str(ROOT))
+
+    ports = range(args.workers) if args.workers > 1 else [0]
+    urls = [f"http://127.0.0.1:{args.metrics_port + i}/metrics" for i in ports]
+    print(f"⏳ Запускаю бота ({args.workers} воркер(ов)), лог: {workdir}/bot.log")
+    proc, log_path = await start_bot(args, env, workdir)
+    results = Results()
+    probe = MetricsProbe(urls)
+    try:
+        started = time.perf_counter()
+        await wait_ready(proc, tg, urls, args.startup_timeout)
+        print(f"✅ Бот готов за {time.perf_counter() - started:.1f} с. Пользователей: {args.users}, "
+              f"одновременно: {args.concurrency}")
+        async with aiohttp.ClientSession() as http:
+            await probe.scrape(http)
+            probing = asyncio.create_task(probe.run(http))
+            updates0 = tg.delivered
+            t0 = time.perf_counter()
+            await run_users(args, tg, ton, results)
+            t1 = time.perf_counter()
+            probing.cancel()
+            await asyncio.gather(probing, return_exceptions=True)
+            await probe.scrape(http)
+    except RuntimeError as e:
+        print(f"❌ {e}; хвост лога бота:\n" + log_path.read_text(errors="replace")[-3000:])
+        return 2
+    finally:
+        await stop_bot(proc)
+        await tg.stop()
+        await ton.stop()
+
+    report = build_report(args, results, tg, probe, t0, t1, updates0)
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if results.failed == 0 else 1
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="scripts/loadtest/run.py", description="Нагрузочный тест бота")
+    parser.add_argument("--users", type=int, default=1000, help="виртуальных пользователей всего")
+    parser.add_argument("--concurrency", type=int, default=200, help="пользователей одновременно")
+    parser.add_argument("--ramp", type=float, default=0.0, help="растянуть старт пользователей на N секунд")
+    parser.add_argument("--workers", type=int, default=1, help="процессов бота (python -m bot --workers)")
+    parser.add_argument("--qty-min", type=int, default=50)
+    parser.add_argument("--qty-max", type=int, default=5000)
+    parser.add_argument("--check-interval", type=float, default=2.5,
+                        help="пауза между нажатиями «Проверить оплату» (больше CHECK_THROTTLE_SEC)")
+    parser.add_argument("--reply-timeout", type=float, default=30.0, help="сколько ждать ответа бота на шаг")
+    parser.add_argument("--pay-timeout", type=float, default=60.0, help="сколько ждать подтверждения оплаты")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--metrics-port", type=int, default=9150, help="METRICS_PORT бота (воркеры — +номер)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="настройка бота поверх значений теста (можно несколько раз)")
+    parser.add_argument("--json", help="записать отчёт в JSON-файл")
+    args = parser.parse_args(argv)
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
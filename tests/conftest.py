@@ -0,0 +1,28 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# Настройки читаются при первом обращении к bot.config.settings — задаём окружение заранее.
+_DB_DIR = tempfile.mkdtemp(prefix="stars-tests-")
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("TON_WALLET_ADDRESS", "EQTestWalletAddress")
+os.environ.setdefault("TON_API_PROVIDER", "none")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_DB_DIR}/test.db")
+
+
+@pytest.fixture
+def db():
+    """Чистая схема БД на каждый тест."""
+    from bot.models import Base
+    from bot.storage import dispose_engines, engine
+
+    async def _reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(_reset())
+    yield
+    asyncio.run(dispose_engines())
@@ -0,0 +1,200 @@
+"""Сетевые заглушки для тестов: всё крутится в памяти через httpx.MockTransport."""
+from __future__ import annotations
+
+import base64
+import hashlib
+import itertools
+import json
+import time
+
+import httpx
+
+
+class FakeTonApi:
+    """
+    Подмена toncenter (v3) и tonapi (v2): хранит входящие переводы кошелька
+    и отдаёт их в формате соответствующего провайдера (хеш у toncenter — base64, у tonapi — hex).
+    """
+
+    def __init__(self, address: str, start_lt: int = 1_000) -> None:
+        self.address = address
+        self.txs: list[dict] = []
+        self.calls = 0
+        self.stream_connects = 0
+        # Каждое SSE-подключение отдаёт очередную пачку событий и обрывается.
+        self.stream_batches: list[list[dict]] = []
+        self._lt = itertools.count(start_lt + 1)
+
+    def add_tx(self, amount_nano: int, comment: str = "", sender: str = "EQSender") -> dict:
+        tx = {"lt": next(self._lt), "amount": amount_nano, "comment": comment, "sender": sender}
+        tx["hash"] = hashlib.sha256(f"tx{tx['lt']}".encode()).hexdigest()  # канонический вид
+        self.txs.append(tx)
+        return tx
+
+    # ---------- форматы провайдеров ----------
+    @staticmethod
+    def _toncenter(tx: dict) -> dict:
+        return {
+            "hash": base64.b64encode(bytes.fromhex(tx["hash"])).decode(),
+            "lt": str(tx["lt"]),
+            "now": FakeTonApi.utime(tx),
+            "in_msg": {
+                "source": tx["sender"],
+                "value": str(tx["amount"]),
+                "message_content": {"decoded": {"type": "text_comment", "comment": tx["comment"]}},
+            },
+        }
+
+    @staticmethod
+    def _tonapi(tx: dict) -> dict:
+        return {
+            "hash": tx["hash"],
+            "lt": tx["lt"],
+            "utime": FakeTonApi.utime(tx),
+            "in_msg": {
+                "source": {"address": tx["sender"]},
+                "value": tx["amount"],
+                "decoded_op_name": "text_comment",
+                "decoded_body": {"text": tx["comment"]},
+            },
+        }
+
+    @staticmethod
+    def utime(tx: dict) -> int:
+        return 1_700_000_000 + tx["lt"]
+
+    def _select(self, after_lt: int, limit: int, desc: bool, before_lt: int | None = None) -> list[dict]:
+        txs = sorted(self.txs, key=lambda t: t["lt"], reverse=desc)
+        if not desc:
+            txs = [t for t in txs if t["lt"] > after_lt]
+        if before_lt is not None:
+            txs = [t for t in txs if t["lt"] < before_lt]
+        return txs[:limit]
+
+    def push_event(self, tx: dict) -> None:
+        """Событие о транзакции в текущую пачку SSE."""
+        if not self.stream_batches:
+            self.stream_batches.append([])
+        self.stream_batches[-1].append({"account_id": self.address, "lt": tx["lt"], "tx_hash": tx["hash"]})
+
+    def _sse(self) -> httpx.Response:
+        self.stream_connects += 1
+        if not self.stream_batches:
+            return httpx.Response(503)
+        body = ": keep-alive\n\n" + "".join(
+            f"event: message\ndata: {json.dumps(e)}\n\n" for e in self.stream_batches.pop(0)
+        )
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body.encode())
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path in ("/v2/sse/accounts/transactions", "/api/streaming/v2/sse"):
+            return self._sse()
+        self.calls += 1
+        q = request.url.params
+        limit = int(q.get("limit", 100))
+        if request.url.path == "/api/v3/transactions":
+            after = int(q.get("start_lt", 1)) - 1
+            txs = self._select(after, limit, q.get("sort") == "desc")
+            if "end_utime" in q:
+                txs = [t for t in self._select(0, len(self.txs), True) if self.utime(t) <= int(q["end_utime"])][:limit]
+            return httpx.Response(200, json={"transactions": [self._toncenter(t) for t in txs]})
+        if request.url.path == f"/v2/blockchain/accounts/{self.address}/transactions":
+            after = int(q.get("after_lt", 0))
+            before = int(q["before_lt"]) if "before_lt" in q else None
+            txs = self._select(after, limit, q.get("sort_order") == "desc", before)
+            return httpx.Response(200, json={"transactions": [self._tonapi(t) for t in txs]})
+        return httpx.Response(404)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handler)
+
+
+class FakeBotApi:
+    """
+    Локальный сервер Bot API на aiohttp: принимает вызовы методов, записывает их
+    и отвечает правдоподобными заглушками. Bot направляется сюда через TelegramAPIServer.
+
+    global_limit / chat_limit — сколько сообщений в любое скользящее окно в 1 с принимать
+    (как Telegram: на бота и на чат); сверх этого — 429 с retry_after, как у настоящего API.
+    force_429 — сколько следующих сообщений отклонить безусловно.
+    """
+
+    def __init__(self, *, global_limit: int | None = None, chat_limit: int | None = None) -> None:
+        self.calls: list[tuple[str, dict]] = []
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.force_429 = 0
+        self.rejected = 0
+        self._sent_at: list[tuple[float, str]] = []
+        self._message_id = itertools.count(1)
+        self._runner = None
+        self.base_url = ""
+
+    def _flooded(self, chat_id: str) -> bool:
+        if self.force_429 > 0:
+            self.force_429 -= 1
+            return True
+        now = time.monotonic()
+        self._sent_at = [(t, c) for t, c in self._sent_at if now - t < 1.0]
+        if self.global_limit is not None and len(self._sent_at) >= self.global_limit:
+            return True
+        if self.chat_limit is not None and sum(c == chat_id for _, c in self._sent_at) >= self.chat_limit:
+            return True
+        self._sent_at.append((now, chat_id))
+        return False
+
+    def _result(self, method: str, params: dict):
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            return {
+                "message_id": int(params.get("message_id") or next(self._message_id)),
+                "date": 1_700_000_000,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        return True
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        if method.startswith(("send", "edit")) and self._flooded(str(params.get("chat_id"))):
+            self.rejected += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+        self.calls.append((method, params))
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def start(self) -> str:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def bot(self, token: str = "123456:TEST"):
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+        return Bot(token=token, session=session)
+
+    def sent(self, method: str = "sendMessage") -> list[dict]:
+        return [params for m, params in self.calls if m == method]
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from bot.models import (
+    FulfillmentJob, JobStatus, Order, OrderArchive, OrderStatus, Payment, PaymentArchive, PaymentStatus, User,
+)
+from bot.services.archive import Archiver, pack_raw, unpack_raw
+from bot.services.order_keys import new_order_key
+from bot.storage import session_scope
+
+RAW = {"hash": "h1", "lt": "1001", "in_msg": {"source": "EQSender", "value": "1000000000"}}
+
+
+async def _seed(now: datetime) -> dict[str, str]:
+    old, recent = now - timedelta(days=40), now - timedelta(days=1)
+    plan = {
+        "sent": (OrderStatus.GIFT_SENT, old),
+        "expired": (OrderStatus.EXPIRED, old),
+        "canceled": (OrderStatus.CANCELED, old),
+        "waiting": (OrderStatus.WAITING_PAYMENT, old),   # не завершён — остаётся
+        "fresh": (OrderStatus.GIFT_SENT, recent),         # ещё не старый — остаётся
+    }
+    keys = {name: new_order_key() for name in plan}
+    async with session_scope() as s:
+        user = User(tg_user_id=1)
+        s.add(user)
+        await s.flush()
+        for name, (status, created_at) in plan.items():
+            order = Order(order_key=keys[name], user_id=user.id, quantity=100, price_out_ton=Decimal("1"),
+                          status=status, created_at=created_at, updated_at=created_at)
+            s.add(order)
+            await s.flush()
+            s.add(Payment(order_id=order.id, status=PaymentStatus.CONFIRMED, amount_ton=Decimal("1"),
+                          comment=keys[name], tx_hash=f"tx-{name}", raw=pack_raw(RAW), created_at=created_at))
+            if name == "sent":
+                s.add(FulfillmentJob(order_id=order.id, status=JobStatus.DONE, fragment_ref="ref-1"))
+    return keys
+
+
+def test_archiver_moves_old_terminal_orders_in_batches(db):
+    async def scenario():
+        now = datetime.utcnow()
+        keys = await _seed(now)
+        archiver = Archiver(retention_days=30, batch_size=2)
+        assert await archiver.run_once(now) == 3
+        assert await archiver.run_once(now) == 0
+
+        async with session_scope() as s:
+            hot = set((await s.scalars(select(Order.order_key))).all())
+            hot_payments = set((await s.scalars(select(Payment.tx_hash))).all())
+            archived = {o.order_key: o for o in (await s.scalars(select(OrderArchive))).all()}
+            payments = {p.tx_hash: p for p in (await s.scalars(select(PaymentArchive))).all()}
+            jobs = (await s.scalars(select(FulfillmentJob))).all()
+
+        assert hot == {keys["waiting"], keys["fresh"]}
+        assert hot_payments == {"tx-waiting", "tx-fresh"}
+        assert set(archived) == {keys["sent"], keys["expired"], keys["canceled"]}
+        assert archived[keys["sent"]].fragment_ref == "ref-1"
+        assert archived[keys["sent"]].status == OrderStatus.GIFT_SENT
+        assert set(payments) == {"tx-sent", "tx-expired", "tx-canceled"}
+        assert payments["tx-sent"].order_id == archived[keys["sent"]].id
+        assert unpack_raw(payments["tx-sent"].raw) == RAW
+        assert jobs == []
+
+    asyncio.run(scenario())
+
+
+def test_raw_payload_roundtrip_and_legacy_text():
+    blob = pack_raw(RAW)
+    assert isinstance(blob, bytes)
+    assert unpack_raw(blob) == RAW
+    # Строки, записанные до сжатия, читаются как есть.
+    assert unpack_raw('{"hash": "h1"}') == {"hash": "h1"}
+    assert unpack_raw(b'{"hash": "h1"}') == {"hash": "h1"}
+    assert pack_raw({}) is None and unpack_raw(None) is None
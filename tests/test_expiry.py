@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from bot.models import Order, OrderStatus, Payment, PaymentStatus, User
+from bot.services.expiry import ExpiryScheduler
+from bot.services.matching import PaymentIndex
+from bot.services.notify import Notifier
+from bot.services.order_keys import new_order_key
+from bot.services.send_scheduler import SendScheduler
+from bot.storage import session_scope
+
+from fakes import FakeBotApi
+
+
+class _Sink:
+    def __init__(self) -> None:
+        self.sent: list[tuple[int, str]] = []
+
+    def submit(self, chat_id: int, text: str) -> bool:
+        self.sent.append((chat_id, text))
+        return True
+
+
+async def _order(session, user, created_at, status=OrderStatus.WAITING_PAYMENT) -> Order:
+    order = Order(
+        order_key=new_order_key(), user_id=user.id, quantity=100,
+        price_out_ton=Decimal("1"), status=status, created_at=created_at,
+    )
+    session.add(order)
+    await session.flush()
+    return order
+
+
+def test_expiry_bulk_transitions(db):
+    t0 = datetime.utcnow() - timedelta(seconds=1000)
+    sink = _Sink()
+    index = PaymentIndex()
+    sched = ExpiryScheduler(order_ttl=600, payment_timeout=900, notifier=sink, index=index)
+
+    async def scenario():
+        async with session_scope() as s:
+            user = User(tg_user_id=42)
+            s.add(user)
+            await s.flush()
+            stale = [await _order(s, user, t0) for _ in range(3)]
+            partial = await _order(s, user, t0 + timedelta(seconds=200))
+            s.add(Payment(order_id=partial.id, status=PaymentStatus.PARTIAL,
+                          amount_ton=Decimal("0.5"), comment=partial.order_key, tx_hash="h1"))
+            fresh = await _order(s, user, datetime.utcnow())
+            await _order(s, user, t0, status=OrderStatus.PAID)
+        async with session_scope() as s:
+            await index.rebuild(s)
+
+        # Стартовая загрузка видит только открытые заказы.
+        assert await sched.tick(now=t0) == 0
+        assert len(sched) == 5
+
+        now = datetime.utcnow()
+        assert await sched.tick(now=now) == 3
+        assert len(sink.sent) == 3 and sink.sent[0][0] == 42
+        assert all(o.order_key not in index for o in stale)
+        # Частичная оплата получила отсрочку до PAYMENT_TIMEOUT_SEC от создания.
+        assert sched.next_deadline() == partial.created_at + timedelta(seconds=900)
+        assert partial.order_key in index
+
+        assert await sched.tick(now=now + timedelta(seconds=500)) == 1
+        async with session_scope() as s:
+            statuses = {o.id: o.status for o in (await s.scalars(select(Order))).all()}
+            pay = await s.scalar(select(Payment.status))
+        assert statuses[partial.id] == OrderStatus.EXPIRED
+        assert statuses[fresh.id] == OrderStatus.WAITING_PAYMENT
+        assert pay == PaymentStatus.TIMEOUT
+        assert len(sched) == 1  # остался только свежий заказ
+
+    asyncio.run(scenario())
+
+
+def test_notifier_sends_through_scheduler():
+    api = FakeBotApi(global_limit=10)
+
+    async def scenario():
+        await api.start()
+        bot = api.bot()
+        bot.session.middleware(SendScheduler(global_rate=8, global_burst=1))
+        notifier = Notifier(bot)
+        for i in range(12):
+            notifier.submit(1000 + i, "hi")
+        await notifier.flush()
+        await bot.session.close()
+        await api.stop()
+        return notifier.sent
+
+    assert asyncio.run(scenario()) == 12
+    assert api.rejected == 0
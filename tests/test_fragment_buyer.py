@@ -0,0 +1,99 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("playwright")
+
+from bot.services.fragment_buyer import BrowserPool, FragmentBuyer, PlaywrightDeliverer, _Slot  # noqa: E402
+from bot.services.fulfillment import GiftRequest, PermanentFulfillmentError  # noqa: E402
+
+STAND_IN = Path(__file__).parent / "fixtures" / "fragment_buy_flow.html"
+
+
+async def _serve():
+    from aiohttp import web
+
+    async def page(_request):
+        return web.Response(text=STAND_IN.read_text(encoding="utf-8"), content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", page)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_buy_flow_against_stand_in():
+    async def scenario():
+        runner, base = await _serve()
+        pool = BrowserPool(size=1, base_url=base, cookies=[], recycle_after=2)
+        try:
+            await pool.start()
+        except Exception as e:  # браузер не установлен (playwright install chromium)
+            await runner.cleanup()
+            pytest.skip(f"chromium unavailable: {e}")
+        deliverer = PlaywrightDeliverer(pool, FragmentBuyer(base, step_timeout=5))
+        submitted = []
+
+        async def on_submit():
+            submitted.append(1)
+
+        try:
+            req = GiftRequest(1, "K1", "alice", 100)
+            ref = await deliverer.deliver(req, submitted=False, on_submit=on_submit)
+            assert ref == "ref-1" and submitted == [1]
+            # Повтор после «купить» находит покупку в истории и не покупает второй раз.
+            assert await deliverer.deliver(req, submitted=True, on_submit=on_submit) == "ref-1"
+            assert submitted == [1]
+            with pytest.raises(PermanentFulfillmentError):
+                await deliverer.deliver(GiftRequest(2, "K2", "nobody", 50), submitted=False, on_submit=on_submit)
+            assert pool.created >= 2  # контекст пересоздан после recycle_after заданий
+        finally:
+            await deliverer.aclose()
+            await runner.cleanup()
+
+    asyncio.run(scenario())
+
+
+class _FakeContext:
+    def __init__(self) -> None:
+        self.closed = False
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def test_timed_out_job_returns_slot_at_once_and_recycles_lazily():
+    async def scenario():
+        pool = BrowserPool(size=1, base_url="http://fragment", cookies=[])
+
+        async def new_slot():
+            await asyncio.sleep(0.5)  # медленный прогрев новой страницы
+            pool.created += 1
+            return _Slot(_FakeContext(), object())
+
+        pool._new_slot = new_slot
+        first = _Slot(_FakeContext(), object())
+        pool._idle.put_nowait(first)
+
+        async def job():
+            async with pool.page():
+                await asyncio.Event().wait()
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(job(), 0.05)
+        # Отмена не ждёт пересоздания контекста, слот сразу снова в пуле.
+        assert loop.time() - started < 0.3
+        assert pool._idle.qsize() == 1 and first.stale and not first.context.closed
+
+        async with pool.page() as page:
+            assert page is not first.page
+        assert first.context.closed and pool.created == 1
+
+    asyncio.run(scenario())
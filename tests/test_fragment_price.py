@@ -0,0 +1,79 @@
+import asyncio
+import json
+from decimal import Decimal
+from pathlib import Path
+
+import httpx
+
+from bot.services.fragment_price import FragmentPriceSource, find_price_path
+
+FIXTURES = Path(__file__).parent / "fixtures"
+HTML = (FIXTURES / "fragment_stars_buy.html").read_text(encoding="utf-8")
+DATA = json.loads((FIXTURES / "fragment_stars_buy.json").read_text(encoding="utf-8"))
+
+
+class FakeFragment:
+    """Локальная подмена fragment.com на записанных HTML/JSON."""
+
+    def __init__(self) -> None:
+        self.build_id = "bld-A1b2C3"
+        self.etag = '"v1"'
+        self.data = DATA
+        self.hits: list[str] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.hits.append(path)
+        if path == "/stars/buy":
+            return httpx.Response(200, text=HTML.replace("bld-A1b2C3", self.build_id))
+        if path == f"/_next/data/{self.build_id}/stars/buy.json":
+            if request.headers.get("if-none-match") == self.etag:
+                return httpx.Response(304)
+            return httpx.Response(200, json=self.data, headers={"etag": self.etag})
+        return httpx.Response(404)
+
+
+def test_find_price_path_walks_nested_json():
+    assert find_price_path(DATA) == ("pageProps", "stars", "rate", "starPriceTon")
+
+
+def test_build_id_cached_conditional_requests_and_rescrape_on_404():
+    fake = FakeFragment()
+
+    async def scenario():
+        src = FragmentPriceSource("http://fragment.local", transport=httpx.MockTransport(fake.handler))
+        assert await src() == Decimal("0.006451")
+        assert fake.hits == ["/stars/buy", "/_next/data/bld-A1b2C3/stars/buy.json"]
+
+        # Данные не менялись: один маленький условный запрос, ответ 304.
+        fake.hits.clear()
+        assert await src() == Decimal("0.006451")
+        assert fake.hits == ["/_next/data/bld-A1b2C3/stars/buy.json"]
+
+        # Новый деплой Fragment: старый data-роут отдаёт 404 → перечитываем HTML.
+        fake.build_id, fake.etag = "bld-Z9", '"v2"'
+        fake.data = json.loads(json.dumps(DATA).replace("0.006451", "0.0071"))
+        fake.hits.clear()
+        assert await src() == Decimal("0.0071")
+        assert fake.hits == [
+            "/_next/data/bld-A1b2C3/stars/buy.json",
+            "/stars/buy",
+            "/_next/data/bld-Z9/stars/buy.json",
+        ]
+        assert src.price_path == ("pageProps", "stars", "rate", "starPriceTon")
+        await src.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_inline_next_data_fallback_without_build_id():
+    html = HTML.replace(',"buildId":"bld-A1b2C3"', "")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text=html) if request.url.path == "/stars/buy" else httpx.Response(404)
+
+    async def scenario():
+        src = FragmentPriceSource("http://fragment.local", transport=httpx.MockTransport(handler))
+        assert await src() == Decimal("0.006451")
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import func, select
+
+from bot.fsm_storage import DBStorage
+from bot.models import FsmData, FsmState
+from bot.states import OrderFlow
+from bot.storage import session_scope
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+async def _count(model) -> int:
+    async with session_scope() as s:
+        return await s.scalar(select(func.count()).select_from(model))
+
+
+def test_state_and_data_survive_restart(db):
+    async def scenario():
+        st = DBStorage(flush_interval=0.01)
+        await st.set_state(KEY, OrderFlow.waiting_for_quantity)
+        await st.update_data(KEY, {"qty": 100})
+        await st.update_data(KEY, {"memo": "ABC"})
+        await st.close()
+
+        # Новый процесс: пустой кеш, всё читается из БД.
+        st2 = DBStorage()
+        assert await st2.get_state(KEY) == OrderFlow.waiting_for_quantity.state
+        assert await st2.get_data(KEY) == {"qty": 100, "memo": "ABC"}
+        await st2.close()
+
+    asyncio.run(scenario())
+
+
+def test_data_writes_are_coalesced_and_reads_hit_cache(db):
+    async def scenario():
+        st = DBStorage(flush_interval=60)  # фоновый сброс не успеет — сбросим вручную
+        for i in range(100):
+            await st.update_data(KEY, {"n": i})
+        assert await _count(FsmData) == 0
+        assert await st.flush() == 1
+        async with session_scope() as s:
+            assert (await s.get(FsmData, "1:10:10:::default")).data == '{"n": 99}'
+
+        # Состояние не менялось — лишних записей нет.
+        await st.set_state(KEY, None)
+        assert await _count(FsmState) == 0
+        await st.close()
+
+    asyncio.run(scenario())
+
+
+def test_lru_eviction_keeps_unflushed_data(db):
+    async def scenario():
+        st = DBStorage(cache_size=2, flush_interval=60)
+        keys = [StorageKey(bot_id=1, chat_id=c, user_id=c) for c in range(5)]
+        for i, k in enumerate(keys):
+            await st.set_data(k, {"i": i})
+        assert len(st._cache) == 2
+        assert await st.get_data(keys[0]) == {"i": 0}
+        await st.close()
+
+    asyncio.run(scenario())
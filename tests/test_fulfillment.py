@@ -0,0 +1,146 @@
+import asyncio
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from bot.models import FulfillmentJob, JobStatus, Order, OrderStatus, User
+from bot.services.fulfillment import (
+    FulfillmentError, FulfillmentQueue, GiftRequest, PermanentFulfillmentError, enqueue_paid,
+)
+from bot.services.order_keys import new_order_key
+from bot.storage import session_scope
+
+
+class FakeDeliverer:
+    """Сценарий на каждый заказ: список исходов попыток ("ok", "fail", "fail_after_submit", "hang", "bad")."""
+
+    def __init__(self, plan: dict[str, list[str]]) -> None:
+        self.plan = plan
+        self.calls: list[tuple[str, bool]] = []
+        self.delivered: dict[str, str] = {}
+        self.running = 0
+        self.max_running = 0
+
+    async def deliver(self, req: GiftRequest, *, submitted: bool, on_submit) -> str:
+        self.calls.append((req.order_key, submitted))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            if submitted and req.order_key in self.delivered:
+                return self.delivered[req.order_key]  # нашли в истории — второй раз не покупаем
+            outcome = self.plan[req.order_key].pop(0)
+            await asyncio.sleep(0.01)
+            if outcome == "hang":
+                await asyncio.sleep(10)
+            if outcome == "fail":
+                raise FulfillmentError("page broke")
+            if outcome == "bad":
+                raise PermanentFulfillmentError("user not found")
+            await on_submit()
+            self.delivered[req.order_key] = f"ref-{req.order_key}"
+            if outcome == "fail_after_submit":
+                raise FulfillmentError("connection lost after confirm")
+            return self.delivered[req.order_key]
+        finally:
+            self.running -= 1
+
+
+async def _paid_orders(n: int) -> list[str]:
+    keys = [new_order_key() for _ in range(n)]
+    async with session_scope() as s:
+        user = User(tg_user_id=5, username="buyer")
+        s.add(user)
+        await s.flush()
+        orders = [
+            Order(order_key=k, user_id=user.id, quantity=100, price_out_ton=Decimal("1"), status=OrderStatus.PAID)
+            for k in keys
+        ]
+        s.add_all(orders)
+        await s.flush()
+        await enqueue_paid(s, [o.id for o in orders])
+        await enqueue_paid(s, [orders[0].id])  # повторная постановка — без дубля
+    return keys
+
+
+async def _state() -> dict[str, tuple[str, str, int]]:
+    async with session_scope() as s:
+        rows = await s.execute(
+            select(Order.order_key, Order.status, FulfillmentJob.status, FulfillmentJob.attempts)
+            .join(FulfillmentJob, FulfillmentJob.order_id == Order.id)
+        )
+        return {k: (o, j, a) for k, o, j, a in rows}
+
+
+async def _run_until_idle(queue: FulfillmentQueue, rounds: int = 20) -> None:
+    for _ in range(rounds):
+        await queue.run_once()
+        await queue.drain()
+
+
+def test_queue_delivers_retries_and_stays_idempotent(db):
+    async def scenario():
+        keys = await _paid_orders(5)
+        plan = {
+            keys[0]: ["ok"],
+            keys[1]: ["fail", "ok"],
+            keys[2]: ["fail_after_submit"],  # повтор найдёт покупку, а не купит снова
+            keys[3]: ["bad"],
+            keys[4]: ["hang", "ok"],
+        }
+        deliverer = FakeDeliverer(plan)
+        queue = FulfillmentQueue(deliverer, concurrency=2, job_timeout=0.2, max_attempts=3, retry_base=0)
+        await _run_until_idle(queue)
+        state = await _state()
+
+        assert len(state) == 5
+        for k in (keys[0], keys[1], keys[2], keys[4]):
+            assert state[k][:2] == (OrderStatus.GIFT_SENT, JobStatus.DONE)
+        assert state[keys[1]][2] == 1
+        assert state[keys[3]] == (OrderStatus.ERROR, JobStatus.FAILED, 1)
+        assert (keys[2], True) in deliverer.calls
+        assert len(deliverer.delivered) == 4
+        assert deliverer.max_running <= 2
+
+    asyncio.run(scenario())
+
+
+class HistoryDeliverer:
+    """Как Fragment: история покупок по (получатель, количество), ref выдаются по порядку."""
+
+    def __init__(self, plan: dict[str, list[str]]) -> None:
+        self.plan = plan
+        self.history: list[tuple[str, int, str]] = []
+        self.lookups: list[tuple[str, frozenset[str]]] = []
+
+    async def deliver(self, req: GiftRequest, *, submitted: bool, on_submit) -> str:
+        if submitted:
+            self.lookups.append((req.order_key, req.taken_refs))
+            for recipient, qty, ref in reversed(self.history):
+                if (recipient, qty) == (req.recipient, req.quantity) and ref not in req.taken_refs:
+                    return ref
+        await on_submit()
+        if self.plan[req.order_key].pop(0) == "crash_before_confirm":
+            raise FulfillmentError("browser died before confirm")
+        ref = f"ref-{len(self.history) + 1}"
+        self.history.append((req.recipient, req.quantity, ref))
+        return ref
+
+
+def test_retry_does_not_take_previous_order_ref_of_same_buyer(db):
+    async def scenario():
+        first, second = await _paid_orders(2)  # тот же покупатель, то же количество
+        deliverer = HistoryDeliverer({first: ["ok"], second: ["crash_before_confirm", "ok"]})
+        queue = FulfillmentQueue(deliverer, concurrency=1, job_timeout=1, max_attempts=3, retry_base=0)
+        await _run_until_idle(queue)
+
+        async with session_scope() as s:
+            refs = dict((await s.execute(
+                select(Order.order_key, FulfillmentJob.fragment_ref)
+                .join(FulfillmentJob, FulfillmentJob.order_id == Order.id)
+            )).all())
+        # Повтор второго заказа не принял покупку первого за свою и купил сам.
+        assert deliverer.lookups == [(second, frozenset({"ref-1"}))]
+        assert refs == {first: "ref-1", second: "ref-2"}
+        assert len(deliverer.history) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+from bot.i18n import _CATALOG, pick_lang, t
+from bot.keyboards import confirm_kb, main_menu, payment_keyboard
+
+
+def test_catalog_languages_have_same_keys():
+    assert set(_CATALOG["ru"]) == set(_CATALOG["en"])
+
+
+def test_templates_compiled_with_constants():
+    assert "50" in t("ru", "start") and "1000000" in t("en", "start")
+    text = t("en", "pay", qty=100, total="0.67")
+    assert "<b>100</b>" in text and "<b>0.67</b>" in text and "EQTestWalletAddress" in text
+    assert pick_lang("en-US") == "en"
+    assert pick_lang("de") == pick_lang(None) == "ru"
+
+
+def test_keyboards_are_shared_and_cached():
+    assert main_menu("en") is main_menu("en")
+    assert confirm_kb() is confirm_kb("ru")
+    kb = payment_keyboard("en", 1_500_000_000, "KEY")
+    # Клавиатура заказа собирается заново, общие кнопки — одни и те же объекты.
+    assert payment_keyboard("en", 1_500_000_000, "KEY2").inline_keyboard[0][0] is kb.inline_keyboard[0][0]
+    assert payment_keyboard("ru", 1_500_000_000, "KEY").inline_keyboard[0][0] is not kb.inline_keyboard[0][0]
+    assert kb.inline_keyboard[1][0].url.endswith("amount=1500000000&text=KEY")
+    assert kb.inline_keyboard[2][0].callback_data == "check:KEY"
@@ -0,0 +1,87 @@
+import asyncio
+import math
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts" / "loadtest"))
+
+from fake_telegram import FakeTelegram  # noqa: E402
+from fake_ton import FakeTon  # noqa: E402
+from run import Snapshot, histogram_quantile, percentile  # noqa: E402
+
+from bot.services.ton_api import TonapiProvider, ToncenterProvider  # noqa: E402
+
+WALLET = "EQLoadWallet"
+
+
+def test_quantiles():
+    assert percentile([3, 1, 2, 4], 0.5) == 2
+    assert percentile([1.0] * 99 + [10.0], 0.99) == 1.0
+    assert math.isnan(percentile([], 0.5))
+    # 10 наблюдений ≤0.1, ещё 10 — в (0.1, 1]: медиана на границе, p95 — интерполяция в корзине
+    buckets = {0.1: 10, 1.0: 20, math.inf: 20}
+    assert histogram_quantile(buckets, 0.5) == 0.1
+    assert abs(histogram_quantile(buckets, 0.95) - 0.91) < 1e-9
+
+
+def test_snapshot_sums_processes():
+    text = (
+        'bot_handler_seconds_bucket{handler="take_qty",le="0.1"} 2\n'
+        'bot_handler_seconds_bucket{handler="take_qty",le="+Inf"} 3\n'
+        'bot_db_commits_total{engine="writer"} 7\n'
+        "process_resident_memory_bytes 100\n"
+    )
+    snap = Snapshot.from_texts([text, text])
+    assert snap.handler_buckets == {0.1: 4, math.inf: 6}
+    assert snap.commits == 14 and snap.rss == 200
+
+
+def test_fake_ton_pages_like_real_providers():
+    async def scenario():
+        ton = FakeTon(WALLET)
+        base = await ton.start()
+        try:
+            for i in range(5):
+                ton.pay(1_000_000_000 + i, f"K{i}")
+            for cls in (ToncenterProvider, TonapiProvider):
+                provider = cls(base)
+                try:
+                    page = await provider.fetch_page(WALLET, 0, limit=3)
+                    assert [t.comment for t in page.txs] == ["K0", "K1", "K2"] and page.more
+                    page = await provider.fetch_page(WALLET, page.last_lt, limit=3)
+                    assert [t.amount_nano for t in page.txs] == [1_000_000_003, 1_000_000_004]
+                    assert await provider.latest_lt(WALLET) == page.last_lt
+                finally:
+                    await provider.aclose()
+        finally:
+            await ton.stop()
+
+    asyncio.run(scenario())
+
+
+def test_fake_telegram_round_trip():
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    async def scenario():
+        tg = FakeTelegram()
+        base = await tg.start()
+        bot = Bot("123456:TEST", session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+        try:
+            tg.send_text(7, "/start")
+            tg.press(7, "check:ABC")
+            updates = await bot.get_updates(timeout=1)
+            assert updates[0].message.text == "/start" and updates[1].callback_query.data == "check:ABC"
+            assert await bot.get_updates(offset=updates[-1].update_id + 1, timeout=0) == []
+
+            await bot.send_message(7, "hi")
+            await bot.answer_callback_query(updates[1].callback_query.id, text="ok")
+            first, second = await tg.reply(7, 1), await tg.reply(7, 1)
+            assert (first.method, first.text) == ("sendMessage", "hi")
+            assert (second.method, second.text) == ("answerCallbackQuery", "ok")
+        finally:
+            await bot.session.close()
+            await tg.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,53 @@
+from bot.models import PaymentStatus
+from bot.services.matching import OpenOrder, PaymentIndex
+from bot.services.order_keys import ORDER_KEY_LEN, new_order_key, normalize_order_key
+from bot.services.ton_api import IncomingTx
+
+
+def _tx(lt: int, amount: int, comment: str = "") -> IncomingTx:
+    return IncomingTx(lt=lt, tx_hash=f"h{lt}", amount_nano=amount, comment=comment, sender="EQs", utime=0)
+
+
+def test_order_keys_are_unique_and_normalizable():
+    keys = {new_order_key() for _ in range(10_000)}
+    assert len(keys) == 10_000
+    key = next(iter(keys))
+    assert len(key) == ORDER_KEY_LEN
+    assert normalize_order_key(f" {key.lower()} ") == key
+    assert normalize_order_key("Stars x100") is None
+
+
+def test_plan_partial_then_overpay_and_apply():
+    idx = PaymentIndex()
+    key = new_order_key()
+    idx.add(OpenOrder(order_id=1, order_key=key, amount_nano=1_000))
+
+    plan = idx.plan([_tx(1, 400, key), _tx(2, 700, key.lower()), _tx(3, 50, key)])
+    assert [s.status for s in plan] == [PaymentStatus.PARTIAL, PaymentStatus.CONFIRMED, PaymentStatus.EXCESS]
+    assert plan[1].overpaid_nano == 100
+    # Третий перевод пришёл уже закрытому заказу — целиком к возврату.
+    assert plan[2].overpaid_nano == 50 and not plan[2].completes_order
+    assert key in idx  # plan() индекс не меняет
+
+    idx.apply(plan)
+    assert key not in idx
+
+
+def test_partial_is_remembered_between_batches():
+    idx = PaymentIndex()
+    key = new_order_key()
+    idx.add(OpenOrder(order_id=1, order_key=key, amount_nano=1_000))
+    idx.apply(idx.plan([_tx(1, 600, key)]))
+    assert idx.get(key).paid_nano == 600
+    assert idx.plan([_tx(2, 400, key)])[0].completes_order
+
+
+def test_commentless_transfer_matches_only_unique_amount():
+    idx = PaymentIndex()
+    idx.add(OpenOrder(order_id=1, order_key=new_order_key(), amount_nano=1_000))
+    idx.add(OpenOrder(order_id=2, order_key=new_order_key(), amount_nano=2_000))
+    idx.add(OpenOrder(order_id=3, order_key=new_order_key(), amount_nano=2_000))
+
+    assert [s.order_id for s in idx.plan([_tx(1, 1_000)])] == [1]
+    assert idx.plan([_tx(2, 2_000)]) == []
+    assert idx.plan([_tx(3, 1_000, "some other memo")]) == []
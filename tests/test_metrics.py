@@ -0,0 +1,136 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import aiohttp
+from sqlalchemy import select, text
+
+from bot.metrics import (
+    BOT_API_ERRORS, BOT_API_SECONDS, DB_COMMITS, DB_QUERY_SECONDS, HANDLER_ERRORS, HANDLER_SECONDS,
+    PROCESS_RSS, QUEUE_DEPTH, Counter, Histogram, Registry, SamplingProfiler, profiler, start_metrics_server,
+)
+from bot.middlewares import BotApiMetricsMiddleware, HandlerMetricsMiddleware
+from bot.models import Order
+from bot.storage import session_scope
+
+from fakes import FakeBotApi
+
+
+def test_exposition_format():
+    reg = Registry()
+    h = reg.register(Histogram("demo_seconds", "Demo", ["handler"], buckets=(0.1, 1)))
+    c = reg.register(Counter("demo_total", "Demo", ["kind"]))
+    h.observe(0.05, "a")
+    h.observe(0.5, "a")
+    h.observe(5, "a")
+    c.inc('say "hi"\n')
+    out = reg.render()
+    assert 'demo_seconds_bucket{handler="a",le="0.1"} 1' in out
+    assert 'demo_seconds_bucket{handler="a",le="1"} 2' in out
+    assert 'demo_seconds_bucket{handler="a",le="+Inf"} 3' in out
+    assert 'demo_seconds_count{handler="a"} 3' in out
+    assert 'demo_total{kind="say \\"hi\\"\\n"} 1' in out
+    assert "# TYPE demo_seconds histogram" in out
+
+
+def test_handler_middleware_times_and_counts_errors():
+    async def cmd_demo(event, data):
+        return "ok"
+
+    async def cmd_broken(event, data):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        mw = HandlerMetricsMiddleware()
+        before = HANDLER_SECONDS.count("cmd_demo")
+        assert await mw(cmd_demo, object(), {"handler": SimpleNamespace(callback=cmd_demo)}) == "ok"
+        assert HANDLER_SECONDS.count("cmd_demo") == before + 1
+        try:
+            await mw(cmd_broken, object(), {"handler": SimpleNamespace(callback=cmd_broken)})
+        except RuntimeError:
+            pass
+        assert HANDLER_ERRORS.value("cmd_broken") == 1
+
+    asyncio.run(scenario())
+
+
+def test_db_queries_are_timed(db):
+    async def scenario():
+        before = DB_QUERY_SECONDS.count("writer", "SELECT")
+        async with session_scope() as s:
+            await s.scalars(select(Order.id))
+            try:
+                await s.execute(text("SELECT * FROM no_such_table"))
+            except Exception:
+                pass
+        assert DB_QUERY_SECONDS.count("writer", "SELECT") == before + 1
+
+    asyncio.run(scenario())
+
+
+def test_commits_and_memory_are_exported(db):
+    async def scenario():
+        before = DB_COMMITS.value("writer")
+        async with session_scope() as s:
+            await s.scalars(select(Order.id))
+        assert DB_COMMITS.value("writer") == before + 1
+
+    asyncio.run(scenario())
+    assert PROCESS_RSS.value() > 10 * 2**20
+
+
+def test_bot_api_calls_and_endpoint_with_profiler():
+    api = FakeBotApi()
+
+    async def scenario():
+        await api.start()
+        bot = api.bot()
+        bot.session.middleware(BotApiMetricsMiddleware())
+        before = BOT_API_SECONDS.count("SendMessage")
+        await bot.send_message(1, "hi")
+        api.force_429 = 1
+        try:
+            await bot.send_message(1, "flood")
+        except Exception:
+            pass
+        assert BOT_API_SECONDS.count("SendMessage") == before + 2
+        assert BOT_API_ERRORS.value("SendMessage", "TelegramRetryAfter") >= 1
+
+        QUEUE_DEPTH.track(lambda: 7, "demo")
+        runner = await start_metrics_server("127.0.0.1", 0, profiling=True)
+        port = runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession() as http:
+                async with http.get(f"http://127.0.0.1:{port}/metrics") as rsp:
+                    body = await rsp.text()
+                assert 'bot_queue_depth{queue="demo"} 7' in body
+                assert 'bot_api_request_seconds_count{method="SendMessage"}' in body
+                async with http.get(f"http://127.0.0.1:{port}/debug/profile?seconds=0.2&interval_ms=1") as rsp:
+                    assert rsp.status == 200
+                # Нулевой интервал превратил бы поток профайлера в busy-loop — отказываем сразу.
+                for bad in ("interval_ms=0", "interval_ms=0.5", "interval_ms=abc", "seconds=nan",
+                            "seconds=-1", "seconds=0", "seconds=600"):
+                    async with http.get(f"http://127.0.0.1:{port}/debug/profile?{bad}") as rsp:
+                        assert rsp.status == 400, bad
+                assert not profiler.running
+        finally:
+            QUEUE_DEPTH.untrack("demo")
+            await runner.cleanup()
+            await bot.session.close()
+            await api.stop()
+
+    asyncio.run(scenario())
+
+
+def test_sampling_profiler_sees_hot_function():
+    def hot_loop(seconds: float) -> None:
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    prof = SamplingProfiler(interval=0.001)
+    prof.start()
+    hot_loop(0.2)
+    out = prof.stop()
+    assert prof.samples > 0
+    assert "hot_loop" in out
@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+import pytest
+
+from bot.keyboards import build_ton_uri
+from bot.services.matching import PaymentIndex
+from bot.services.money import (
+    decimal_to_nano, format_ton, nano_to_decimal, parse_ton, price_to_pico, quote, to_nano,
+)
+
+
+@pytest.mark.parametrize("text, nano", [
+    ("1.5", 1_500_000_000), ("1,5", 1_500_000_000), ("2", 2_000_000_000),
+    (".25", 250_000_000), ("0.0000000019", 1), ("-0.1", -100_000_000),
+])
+def test_parse_ton(text, nano):
+    assert parse_ton(text) == nano
+
+
+@pytest.mark.parametrize("text", ["", ".", "1.2.3", "abc", "1e9"])
+def test_parse_ton_rejects_garbage(text):
+    with pytest.raises(ValueError):
+        parse_ton(text)
+
+
+def test_format_roundtrip():
+    for nano in (0, 1, 6_451_000, 1_500_000_000, 10**18 + 7):
+        assert parse_ton(format_ton(nano)) == nano
+        assert decimal_to_nano(nano_to_decimal(nano)) == nano
+    assert format_ton(1_500_000_000) == "1.5"
+    assert to_nano(Decimal("0.006451")) == to_nano(0.006451) == 6_451_000
+
+
+@pytest.mark.parametrize("value, nano", [
+    (1e-05, 10_000), (1.5e-09, 1), (1e16, 10**25), (Decimal("1E-5"), 10_000),
+])
+def test_to_nano_accepts_exponent_notation(value, nano):
+    assert to_nano(value) == nano
+
+
+def test_quote_rounds_once_down():
+    price = price_to_pico(Decimal("0.0064513"))
+    assert price == 6_451_300_000
+    q = quote(777, price, 500)
+    # 777 × 0.0064513 × 1.05 = 5.2632931053 → вниз до нанотона
+    assert q.total_nano == 5_263_293_105
+    assert q.base_nano == 5_012_660_100
+    assert quote(777, price, 500) is q  # мемоизировано
+
+
+def test_link_amount_matches_index_amount():
+    q = quote(1_000_000, price_to_pico(Decimal("0.006451")), 500)
+    link = build_ton_uri("EQAddr", q.total_nano, "KEY")
+    assert f"amount={q.total_nano}&" in link
+    # Значение из колонки Numeric(20, 9) даёт ту же сумму, что ждёт матчинг.
+    row = (1, "KEY", nano_to_decimal(q.total_nano), None)
+    assert PaymentIndex._row_to_open(row).amount_nano == q.total_nano
@@ -0,0 +1,99 @@
+import asyncio
+from decimal import Decimal
+from types import SimpleNamespace
+
+from bot.i18n import t
+from bot.middlewares import CallbackThrottleMiddleware
+from bot.models import OrderStatus, Payment, PaymentStatus
+from bot.services.matching import PaymentIndex, Settlement
+from bot.services.payment_check import PaymentChecker
+from bot.services.ton_api import IncomingTx
+from bot.storage import session_scope
+
+from test_watcher import _make_orders
+
+
+def test_concurrent_checks_share_one_lookup(db):
+    index = PaymentIndex()
+    checker = PaymentChecker(ttl=60, index=index)
+
+    async def scenario():
+        key = (await _make_orders(1, index))[0]
+        async with session_scope() as s:
+            order_id = index.get(key).order_id
+            s.add(Payment(order_id=order_id, status=PaymentStatus.PARTIAL,
+                          amount_ton=Decimal("0.5"), comment=key, tx_hash="h1"))
+
+        results = await asyncio.gather(*(checker.check(key) for _ in range(20)))
+        assert checker.lookups == 1
+        assert results[0].status == OrderStatus.WAITING_PAYMENT
+        assert results[0].paid_nano == 500_000_000 and results[0].amount_nano == 1_500_000_000
+        # Повтор в пределах ttl — из кеша
+        await checker.check(key)
+        assert checker.lookups == 1
+        assert await checker.check("01ARZ3NDEKTSV4RRFFQ69G5FAV") is None
+
+        # Наблюдатель закрыл заказ в этом процессе — ответ из памяти, без SQL.
+        tx = IncomingTx(lt=1, tx_hash="h2", amount_nano=1_000_000_000, comment=key, sender="s", utime=0)
+        index.apply([Settlement(tx=tx, order_id=order_id, order_key=key,
+                                status=PaymentStatus.CONFIRMED, paid_nano=1_500_000_000)])
+        lookups = checker.lookups
+        assert (await checker.check(key)).is_paid
+        assert checker.lookups == lookups
+
+    asyncio.run(scenario())
+
+
+def test_throttle_answers_repeated_presses_from_cache():
+    now = [100.0]
+    mw = CallbackThrottleMiddleware(2.0, clock=lambda: now[0])
+    handled, answered = [], []
+
+    async def handler(event, data):
+        handled.append(event.data)
+        return "ответ"
+
+    async def answer(text):
+        answered.append(text)
+
+    cb = SimpleNamespace(from_user=SimpleNamespace(id=7, language_code="ru"), data="check:K", answer=answer)
+
+    async def scenario():
+        await mw(handler, cb, {})
+        now[0] += 0.5
+        await mw(handler, cb, {})
+        await mw(handler, cb, {})
+        now[0] += 2.0
+        await mw(handler, cb, {})
+
+    asyncio.run(scenario())
+    assert len(handled) == 2
+    assert answered == ["ответ", "ответ"]
+
+
+def test_throttle_busy_text_follows_user_language():
+    mw = CallbackThrottleMiddleware(2.0, clock=lambda: 100.0)
+    answered = []
+    release = asyncio.Event()
+
+    async def handler(event, data):
+        await release.wait()
+        return "done"
+
+    async def answer(text):
+        answered.append(text)
+
+    def press(lang):
+        return SimpleNamespace(from_user=SimpleNamespace(id=7, language_code=lang), data="check:K", answer=answer)
+
+    async def scenario():
+        first = asyncio.create_task(mw(handler, press("en"), {}))
+        await asyncio.sleep(0)
+        # Первый ответ ещё не готов — повторные нажатия получают «проверяю» на своём языке.
+        await mw(handler, press("en"), {})
+        await mw(handler, press("ru"), {})
+        release.set()
+        await first
+
+    asyncio.run(scenario())
+    assert answered == [t("en", "check_busy"), t("ru", "check_busy")]
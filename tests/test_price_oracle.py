@@ -0,0 +1,89 @@
+import asyncio
+from decimal import Decimal
+
+import httpx
+
+from bot.services.price_oracle import HttpPriceSource, PriceOracle, PriceSourceError
+
+FALLBACK = Decimal("0.006451")
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SlowSource:
+    def __init__(self, *prices) -> None:
+        self.prices = list(prices)
+        self.calls = 0
+
+    async def __call__(self) -> Decimal:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        price = self.prices.pop(0)
+        if isinstance(price, Exception):
+            raise price
+        return price
+
+
+def test_burst_of_misses_is_one_upstream_fetch():
+    src = SlowSource(Decimal("0.007"))
+    oracle = PriceOracle(src, fallback=FALLBACK, ttl=60, max_stale=3600)
+
+    async def scenario():
+        # 1000 сообщений подряд: никто не ждёт сеть, запрос к источнику один.
+        prices = [oracle.current() for _ in range(1000)]
+        assert set(prices) == {FALLBACK}
+        results = await asyncio.gather(*(oracle.refresh() for _ in range(50)))
+        assert set(results) == {Decimal("0.007")}
+        assert oracle.current() == Decimal("0.007")
+        assert src.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_stale_while_revalidate_and_fallback():
+    clock = Clock()
+    src = SlowSource(Decimal("0.007"), Decimal("0.008"), PriceSourceError("down"))
+    oracle = PriceOracle(src, fallback=FALLBACK, ttl=60, max_stale=600, retry_after=5, clock=clock)
+
+    async def scenario():
+        assert await oracle.get() == Decimal("0.007")
+
+        clock.now += 61
+        assert oracle.current() == Decimal("0.007")  # старая цена сразу, обновление в фоне
+        await asyncio.sleep(0.05)
+        assert oracle.current() == Decimal("0.008")
+
+        clock.now += 61
+        assert oracle.current() == Decimal("0.008")
+        await asyncio.sleep(0.05)  # источник упал — держим последнюю удачную цену
+        assert oracle.current() == Decimal("0.008")
+        assert src.calls == 3
+        oracle.current()
+        assert src.calls == 3  # повтор не раньше retry_after
+
+        clock.now += 600
+        assert oracle.current() == FALLBACK
+
+    asyncio.run(scenario())
+
+
+def test_http_source_parses_and_sends_auth():
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["auth"] = request.headers.get("x-token")
+        return httpx.Response(200, json={"price_ton_per_star": 0.0065})
+
+    async def scenario():
+        src = HttpPriceSource("http://price/api", "X-Token: s3cret", transport=httpx.MockTransport(handler))
+        assert await src() == Decimal("0.0065")
+        await src.aclose()
+
+    asyncio.run(scenario())
+    assert seen["auth"] == "s3cret"
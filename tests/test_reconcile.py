@@ -0,0 +1,133 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from bot.models import (
+    FulfillmentJob, Order, OrderStatus, Payment, PaymentArchive, PaymentStatus, SyncCursor, UnmatchedPayment, User,
+)
+from bot.reconcile import Reconciler, parse_since
+from bot.services.archive import Archiver
+from bot.services.order_keys import new_order_key
+from bot.services.ton_api import TonapiProvider, ToncenterProvider
+from bot.storage import session_scope
+
+from fakes import FakeTonApi
+from test_watcher import ADDR, _orders_by_status
+
+
+def _ts(utime: int) -> datetime:
+    return datetime.fromtimestamp(utime, timezone.utc).replace(tzinfo=None)
+
+
+async def _order(key: str, status: str, created_at: datetime, price: str = "1") -> None:
+    async with session_scope() as s:
+        user = User(tg_user_id=abs(hash(key)) % 10**9)
+        s.add(user)
+        await s.flush()
+        s.add(Order(order_key=key, user_id=user.id, quantity=100, price_out_ton=Decimal(price),
+                    status=status, created_at=created_at))
+
+
+async def _count(model) -> int:
+    async with session_scope() as s:
+        return await s.scalar(select(func.count()).select_from(model))
+
+
+@pytest.mark.parametrize("provider_cls", [ToncenterProvider, TonapiProvider])
+def test_reconcile_backfills_in_batches_and_is_idempotent(db, provider_cls):
+    fake = FakeTonApi(ADDR)
+    for _ in range(5):
+        fake.add_tx(1_000_000_000, new_order_key())  # до --since: не трогаем
+    since_tx = fake.txs[-1]
+    t0 = fake.utime(since_tx)
+
+    async def scenario():
+        waiting, expired_in_time, expired_late, partial = (new_order_key() for _ in range(4))
+        await _order(waiting, OrderStatus.WAITING_PAYMENT, _ts(t0))
+        await _order(expired_in_time, OrderStatus.EXPIRED, _ts(t0))
+        await _order(expired_late, OrderStatus.EXPIRED, _ts(t0 - 5000))
+        await _order(partial, OrderStatus.WAITING_PAYMENT, _ts(t0), price="2")
+
+        fake.add_tx(1_000_000_000, waiting.lower())
+        fake.add_tx(0, "")                                 # исходящая/пустая — только двигает курсор
+        fake.add_tx(1_000_000_000, expired_in_time)
+        fake.add_tx(1_000_000_000, expired_late)          # пришла после окончательного срока
+        for _ in range(7):
+            fake.add_tx(500_000_000, "not an order")
+        fake.add_tx(1_000_000_000, partial)
+        fake.add_tx(700_000_000, "")
+
+        provider = provider_cls("http://fake", transport=fake.transport())
+        rec = Reconciler(provider, ADDR, payment_timeout=900, batch_size=4, page_limit=3)
+        after_lt = await rec.start_lt(_ts(t0))
+        assert after_lt == since_tx["lt"]
+
+        stats = await rec.run(after_lt)
+        assert stats.recorded == 4 and stats.paid == 2
+        assert stats.batches >= 3  # история шла пачками, а не целиком
+        statuses = await _orders_by_status()
+        assert statuses[waiting] == statuses[expired_in_time] == OrderStatus.PAID
+        assert statuses[expired_late] == OrderStatus.EXPIRED
+        assert statuses[partial] == OrderStatus.WAITING_PAYMENT
+        assert await _count(FulfillmentJob) == 2
+        # Опоздавший перевод записан за заказом к возврату, чужие — в неразобранные.
+        async with session_scope() as s:
+            late_status = await s.scalar(
+                select(Payment.status).join(Order).where(Order.order_key == expired_late)
+            )
+        assert late_status == PaymentStatus.TIMEOUT
+        assert await _count(UnmatchedPayment) == 8
+
+        # Курсор сохранён: продолжение без --since ничего не дублирует.
+        async with session_scope() as s:
+            cursor = await s.get(SyncCursor, rec.cursor_name)
+        assert cursor.lt == fake.txs[-1]["lt"]
+        assert await rec.start_lt(None) == cursor.lt
+        assert (await rec.run(cursor.lt)).recorded == 0
+        # Даже полный повтор с начала не создаёт дублей.
+        assert (await rec.run(after_lt)).recorded == 0
+        assert await _count(Payment) == 4
+        assert await _count(UnmatchedPayment) == 8
+
+    asyncio.run(scenario())
+
+
+def test_reconcile_after_archive_does_not_record_again(db):
+    fake = FakeTonApi(ADDR)
+    fake.add_tx(1_000_000_000, new_order_key())
+    t0 = fake.utime(fake.txs[-1])
+
+    async def scenario():
+        key = new_order_key()
+        await _order(key, OrderStatus.WAITING_PAYMENT, _ts(t0))
+        fake.add_tx(1_000_000_000, key)
+
+        provider = ToncenterProvider("http://fake", transport=fake.transport())
+        rec = Reconciler(provider, ADDR, payment_timeout=900)
+        after_lt = await rec.start_lt(_ts(t0))
+        assert (await rec.run(after_lt)).paid == 1
+
+        # Заказ доставлен и ушёл в архив вместе с платежом.
+        async with session_scope() as s:
+            order = await s.scalar(select(Order).where(Order.order_key == key))
+            order.status = OrderStatus.GIFT_SENT
+        moved = await Archiver(retention_days=0).run_once(datetime.utcnow() + timedelta(days=1))
+        assert moved == 1 and await _count(Payment) == 0
+
+        # Повторная сверка за тот же период: перевод уже записан (в архиве) — не дублируем.
+        assert (await rec.run(after_lt)).recorded == 0
+        assert await _count(PaymentArchive) == 1
+        assert await _count(UnmatchedPayment) == 0
+
+    asyncio.run(scenario())
+
+
+def test_parse_since():
+    now = datetime(2024, 5, 2, 12, 0)
+    assert parse_since("6h", now) == now - timedelta(hours=6)
+    assert parse_since("2d", now) == now - timedelta(days=2)
+    assert parse_since("2024-05-01T10:00") == datetime(2024, 5, 1, 10, 0)
+    assert parse_since("2024-05-01T13:00+03:00") == datetime(2024, 5, 1, 10, 0)
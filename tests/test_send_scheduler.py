@@ -0,0 +1,127 @@
+import asyncio
+
+from bot.config import settings
+from bot.services.send_scheduler import Priority, SendScheduler, install_send_scheduler, send_priority
+
+from fakes import FakeBotApi
+
+
+def _run_with_bot(api: FakeBotApi, scheduler: SendScheduler, body):
+    async def scenario():
+        await api.start()
+        bot = api.bot()
+        bot.session.middleware(scheduler)
+        try:
+            return await body(bot)
+        finally:
+            await bot.session.close()
+            await api.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_bursts_stay_within_limits():
+    api = FakeBotApi(global_limit=20, chat_limit=10)
+    scheduler = SendScheduler(global_rate=16, global_burst=1, chat_rate=8, chat_burst=1)
+
+    async def body(bot):
+        await asyncio.gather(*(
+            bot.send_message(chat, f"m{i}") for chat in range(1, 5) for i in range(5)
+        ))
+
+    _run_with_bot(api, scheduler, body)
+    assert api.rejected == 0
+    assert len(api.sent()) == 20
+
+
+def test_retry_after_is_honoured():
+    api = FakeBotApi()
+    api.force_429 = 1
+    scheduler = SendScheduler()
+
+    async def body(bot):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await bot.send_message(1, "hello")
+        return loop.time() - started
+
+    elapsed = _run_with_bot(api, scheduler, body)
+    assert api.rejected == 1 and scheduler.retries == 1
+    assert len(api.sent()) == 1
+    assert elapsed >= 0.9
+
+
+def test_high_priority_overtakes_low():
+    api = FakeBotApi()
+    scheduler = SendScheduler(global_rate=20, global_burst=1)
+
+    async def low(bot, chat):
+        with send_priority(Priority.LOW):
+            await bot.send_message(chat, "low")
+
+    async def high(bot):
+        await asyncio.sleep(0)
+        with send_priority(Priority.HIGH):
+            await bot.send_message(99, "high")
+
+    async def body(bot):
+        await bot.send_message(0, "first")  # выбирает единственный токен
+        await asyncio.gather(*(low(bot, c) for c in range(1, 6)), high(bot))
+
+    _run_with_bot(api, scheduler, body)
+    texts = [p["text"] for p in api.sent()]
+    assert texts[0] == "first"
+    assert texts.index("high") == 1
+
+
+def test_pending_edits_collapse():
+    api = FakeBotApi()
+    scheduler = SendScheduler(chat_rate=5, chat_burst=1)
+
+    async def body(bot):
+        msg = await bot.send_message(1, "v0")
+        return await asyncio.gather(*(
+            bot.edit_message_text(text=f"v{i}", chat_id=1, message_id=msg.message_id)
+            for i in range(1, 4)
+        ))
+
+    results = _run_with_bot(api, scheduler, body)
+    edits = api.sent("editMessageText")
+    assert [e["text"] for e in edits] == ["v3"]
+    assert scheduler.collapsed == 2
+    assert all(r.text == "v3" for r in results)
+
+
+def test_workers_share_global_rate():
+    async def scenario():
+        bot = FakeBotApi().bot()
+        try:
+            return install_send_scheduler(bot, shards=4)
+        finally:
+            await bot.session.close()
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.global_bucket.rate == settings.SEND_GLOBAL_RATE / 4
+    assert scheduler.global_bucket.capacity == max(1.0, settings.SEND_GLOBAL_RATE / 4)
+
+
+def test_long_retry_after_pauses_all_chats():
+    api = FakeBotApi()
+    api.force_429 = 1
+    # retry_after (1 с) дольше интервала чата (0.2 с) — это флуд-контроль на весь бот.
+    scheduler = SendScheduler(chat_rate=5, chat_burst=1)
+
+    async def body(bot):
+        loop = asyncio.get_running_loop()
+        first = asyncio.create_task(bot.send_message(1, "flooded"))
+        while scheduler.retries == 0:  # 429 получен и разобран
+            await asyncio.sleep(0.01)
+        started = loop.time()
+        await bot.send_message(2, "other chat")
+        elapsed = loop.time() - started
+        await first
+        return elapsed
+
+    elapsed = _run_with_bot(api, scheduler, body)
+    assert scheduler.retries == 1
+    assert elapsed >= 0.8
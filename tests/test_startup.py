@@ -0,0 +1,36 @@
+from bot.config import Settings, _LazySettings
+from bot.startup import StartupProfile
+
+
+def test_settings_are_read_on_first_access(monkeypatch):
+    monkeypatch.delenv("BOT_TOKEN", raising=False)
+    lazy = _LazySettings()  # без BOT_TOKEN Settings() упал бы — но его ещё никто не просил
+    assert "not loaded" in repr(lazy)
+
+    monkeypatch.setenv("BOT_TOKEN", "42:LAZY")
+    assert lazy.BOT_TOKEN == "42:LAZY"
+    assert isinstance(lazy._load(), Settings) and lazy._load() is lazy._load()
+
+    monkeypatch.setattr(lazy, "FEE_BPS", 123)
+    assert lazy.FEE_BPS == 123
+
+
+def test_startup_profile_phases_and_first_update():
+    now = [0.0]
+    profile = StartupProfile(clock=lambda: now[0])
+
+    with profile.phase("init_db"):
+        now[0] += 1.0
+    assert profile.phases == []  # выключен — ничего не пишем
+    assert not profile.update_received()
+
+    profile.enabled = True
+    with profile.phase("init_db"):
+        now[0] += 0.25
+    assert profile.phases == [("init_db", 0.25)]
+    assert "init_db" in profile.report() and "250.0 ms" in profile.report()
+
+    now[0] += 0.5
+    assert profile.update_received()
+    assert profile.first_update == 1.75
+    assert not profile.update_received()
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from bot.config import settings
+from bot.storage import build_engines, init_db, read_engine, read_session, schema_fingerprint, session_scope
+
+
+def test_sqlite_profile_pragmas(db):
+    async def scenario():
+        async with session_scope() as session:
+            mode = (await session.execute(text("PRAGMA journal_mode"))).scalar()
+            sync = (await session.execute(text("PRAGMA synchronous"))).scalar()
+            busy = (await session.execute(text("PRAGMA busy_timeout"))).scalar()
+        assert mode == "wal"
+        assert sync == 1  # NORMAL
+        assert busy == settings.SQLITE_BUSY_TIMEOUT_MS
+
+        async with read_session() as session:
+            assert (await session.execute(text("PRAGMA query_only"))).scalar() == 1
+            with pytest.raises(OperationalError):
+                await session.execute(text("CREATE TABLE nope (x INTEGER)"))
+
+    asyncio.run(scenario())
+
+
+def test_memory_sqlite_shares_engine():
+    writer, reader = build_engines("sqlite+aiosqlite:///:memory:")
+    assert writer is reader
+    assert read_engine.url.database.endswith("test.db")
+
+
+def test_init_db_skips_when_schema_version_matches(db, monkeypatch):
+    async def scenario():
+        assert await init_db() is True  # чистая схема без отпечатка — проверяем
+        assert await init_db() is False  # отпечаток совпал — create_all не нужен
+
+        monkeypatch.setattr("bot.storage.schema_fingerprint", lambda: "changed-models")
+        assert await init_db() is True
+        assert await init_db() is False
+
+    asyncio.run(scenario())
+    assert len(schema_fingerprint()) == 64
@@ -0,0 +1,98 @@
+import asyncio
+import multiprocessing as mp
+
+from bot.main import supervise
+from bot.services.leader import LeaderLease
+from bot.supervisor import ShardRouter
+
+
+def _msg(update_id: int, chat_id: int) -> dict:
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": "1"}}
+
+
+def test_router_keeps_chat_on_one_shard_and_reports_full():
+    ctx = mp.get_context("spawn")
+    queues = [ctx.Queue(maxsize=100) for _ in range(4)]
+    router = ShardRouter(queues)
+    for i in range(40):
+        assert router.submit(_msg(i, 1000 + i % 8))
+
+    seen: dict[int, set[int]] = {}
+    for shard, q in enumerate(queues):
+        while True:
+            try:
+                raw = q.get(timeout=0.5)
+            except Exception:
+                break
+            seen.setdefault(raw["message"]["chat"]["id"], set()).add(shard)
+    assert len(seen) == 8
+    assert all(len(shards) == 1 for shards in seen.values())
+
+    tiny = ShardRouter([ctx.Queue(maxsize=1)])
+    assert tiny.submit(_msg(1, 1))
+    assert not tiny.submit(_msg(2, 1))
+
+
+def test_only_one_process_holds_the_lease(db):
+    async def scenario():
+        a = LeaderLease("jobs", ttl=0.3, holder="a")
+        b = LeaderLease("jobs", ttl=0.3, holder="b")
+        assert await a.try_acquire()
+        assert not await b.try_acquire()
+        assert await a.try_acquire()  # продление
+
+        await asyncio.sleep(0.35)  # лидер перестал продлевать
+        assert await b.try_acquire()
+        assert not await a.try_acquire()
+
+        await b.release()
+        assert await a.try_acquire()
+
+    asyncio.run(scenario())
+
+
+def test_run_while_leader_starts_job_once(db):
+    started = []
+
+    async def job():
+        started.append(1)
+        await asyncio.Event().wait()
+
+    async def scenario():
+        leases = [LeaderLease("jobs", ttl=0.15, holder=h) for h in "abc"]
+        tasks = [asyncio.create_task(l.run_while_leader(job)) for l in leases]
+        await asyncio.sleep(0.4)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert started == [1]
+
+
+def test_failed_job_is_restarted_without_stopping_siblings():
+    runs = []
+    ticks = []
+
+    async def flaky():
+        runs.append(1)
+        if len(runs) < 3:
+            raise RuntimeError("chromium did not start")
+
+    async def steady():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        jobs = asyncio.gather(
+            supervise("flaky", flaky, delay_min=0.01, delay_max=0.05),
+            supervise("steady", steady),
+        )
+        await asyncio.sleep(0.2)
+        jobs.cancel()
+        await asyncio.gather(jobs, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert len(runs) == 3  # два падения, потом штатное завершение
+    assert len(ticks) > 10
@@ -0,0 +1,148 @@
+import asyncio
+import base64
+
+import httpx
+
+from bot.services.ton_api import TonApiError, TonapiProvider, ToncenterProvider, normalize_tx_hash
+from bot.services.ton_client import CircuitBreaker, ResilientTonClient, Upstream, build_ton_client
+
+from fakes import FakeTonApi
+from test_watcher import ADDR
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeProvider:
+    def __init__(self, name: str, *, delay: float = 0.0, fail: bool = False) -> None:
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def latest_lt(self, address: str) -> int:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise TonApiError(f"{self.name}: status 502")
+        return 1 if self.name == "primary" else 2
+
+    async def aclose(self) -> None:
+        pass
+
+
+def _client(*providers, clock, hedge=False) -> ResilientTonClient:
+    ups = [Upstream(p, rps=1000, breaker=CircuitBreaker(3, 30, clock), clock=clock) for p in providers]
+    return ResilientTonClient(ups, hedge=hedge, hedge_min=0.05, hedge_default=0.05)
+
+
+def test_failover_and_circuit_breaker():
+    async def scenario():
+        clock = Clock()
+        primary, backup = FakeProvider("primary", fail=True), FakeProvider("backup")
+        client = _client(primary, backup, clock=clock)
+
+        for _ in range(5):
+            assert await client.latest_lt(ADDR) == 2
+        # После 3 ошибок подряд основной выключен — запросы сразу идут в запасной.
+        assert primary.calls == 3 and client.failovers == 3
+        assert client.upstreams[0].breaker.state == "open"
+
+        # Через reset_after — одна проба; провайдер ожил, цепь замкнулась.
+        clock.now += 31
+        primary.fail = False
+        assert await client.latest_lt(ADDR) == 1
+        assert client.upstreams[0].breaker.state == "closed"
+
+        backup.fail = True
+        primary.fail = True
+        try:
+            await client.latest_lt(ADDR)
+        except TonApiError:
+            pass
+        else:
+            raise AssertionError("expected TonApiError")
+
+    asyncio.run(scenario())
+
+
+def test_hedge_fires_when_primary_exceeds_p95():
+    async def scenario():
+        clock = Clock()
+        primary, backup = FakeProvider("primary", delay=0.001), FakeProvider("backup", delay=0.001)
+        client = _client(primary, backup, clock=clock, hedge=True)
+        for _ in range(20):
+            await client.latest_lt(ADDR)
+        assert client.hedged == 0 and backup.calls == 0
+
+        primary.delay = 5  # провайдер «залип»
+        started = asyncio.get_running_loop().time()
+        assert await client.latest_lt(ADDR) == 2
+        assert asyncio.get_running_loop().time() - started < 1
+        assert client.hedged == 1 and primary.cancelled == 1
+
+    asyncio.run(scenario())
+
+
+def test_build_client_fails_over_between_real_providers(monkeypatch):
+    from bot.config import settings
+
+    fake = FakeTonApi(ADDR)
+    fake.add_tx(1_000_000_000, "K1")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "toncenter.com":
+            return httpx.Response(503)
+        return fake.handler(request)
+
+    monkeypatch.setattr(settings, "TON_API_PROVIDER", "toncenter")
+    monkeypatch.setattr(settings, "TON_API_FAILOVER", True)
+
+    async def scenario():
+        client = build_ton_client(transport=httpx.MockTransport(handler))
+        try:
+            assert client.name == "toncenter→tonapi"
+            txs = await client.fetch_incoming(ADDR, 0)
+            assert [t.comment for t in txs] == ["K1"]
+            assert client.failovers == 1
+        finally:
+            await client.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_providers_agree_on_tx_hash():
+    fake = FakeTonApi(ADDR)
+    tx = fake.add_tx(1_000_000_000, "K1")
+
+    async def scenario():
+        hashes = []
+        for cls in (ToncenterProvider, TonapiProvider):
+            provider = cls("http://fake", transport=fake.transport())
+            try:
+                hashes.append((await provider.fetch_incoming(ADDR, 0))[0].tx_hash)
+            finally:
+                await provider.aclose()
+        return hashes
+
+    # toncenter отдаёт base64, tonapi — hex; после разбора это один и тот же хеш.
+    assert asyncio.run(scenario()) == [tx["hash"], tx["hash"]]
+
+
+def test_normalize_tx_hash_formats():
+    raw = bytes(range(32))
+    canonical = raw.hex()
+    assert normalize_tx_hash(canonical.upper()) == canonical
+    assert normalize_tx_hash(base64.b64encode(raw).decode()) == canonical
+    assert normalize_tx_hash(base64.urlsafe_b64encode(raw).decode().rstrip("=")) == canonical
+    assert normalize_tx_hash("not-a-hash") == "not-a-hash"
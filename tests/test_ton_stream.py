@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from bot.models import Payment
+from bot.services.matching import PaymentIndex
+from bot.services.ton_api import TonapiProvider, ToncenterProvider
+from bot.services.ton_stream import TransactionStream
+from bot.services.watcher import PaymentWatcher
+from bot.storage import session_scope
+
+from fakes import FakeTonApi
+from test_watcher import ADDR, _make_orders
+
+
+async def _payments() -> int:
+    async with session_scope() as s:
+        return await s.scalar(select(func.count()).select_from(Payment))
+
+
+@pytest.mark.parametrize("provider_cls", [ToncenterProvider, TonapiProvider])
+def test_stream_settles_and_gap_fills_after_reconnect(db, provider_cls):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        keys = await _make_orders(3, index)
+        provider = provider_cls("http://fake", transport=fake.transport())
+        watcher = PaymentWatcher(provider, ADDR, interval=0, index=index)
+        await watcher.tick()  # курсор на вершине
+
+        # 1-е подключение: событие о K0; затем обрыв.
+        fake.push_event(fake.add_tx(1_500_000_000, keys[0]))
+        # K1 пришёл, пока потока не было — событие потеряно.
+        fake.add_tx(1_500_000_000, keys[1])
+        # 2-е подключение: событие о K2.
+        fake.stream_batches.append([])
+        fake.push_event(fake.add_tx(1_500_000_000, keys[2]))
+
+        stream = TransactionStream(provider, watcher, reconnect_min=0.01, reconnect_max=0.02)
+        task = asyncio.create_task(stream.run())
+        for _ in range(200):
+            if await _payments() == 3:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert await _payments() == 3
+        assert fake.stream_connects >= 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,311 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select, update
+
+from bot.models import Order, OrderStatus, Payment, PaymentStatus, SyncCursor, UnmatchedPayment, User
+from bot.services.matching import PaymentIndex
+from bot.services.order_keys import new_order_key
+from bot.services.ton_api import TonapiProvider, ToncenterProvider
+from bot.services.watcher import PaymentWatcher
+from bot.storage import session_scope
+
+from fakes import FakeTonApi
+
+ADDR = "EQTestWalletAddress"
+
+
+async def _make_orders(n: int, index: PaymentIndex, price: str = "1.5") -> list[str]:
+    keys = [new_order_key() for _ in range(n)]
+    async with session_scope() as s:
+        user = User(tg_user_id=1)
+        s.add(user)
+        await s.flush()
+        for key in keys:
+            s.add(Order(
+                order_key=key, user_id=user.id, quantity=100,
+                price_out_ton=Decimal(price), status=OrderStatus.WAITING_PAYMENT,
+            ))
+    async with session_scope() as s:
+        await index.rebuild(s)
+    return keys
+
+
+async def _orders_by_status() -> dict[str, str]:
+    async with session_scope() as s:
+        return {o.order_key: o.status for o in (await s.scalars(select(Order))).all()}
+
+
+def _watcher(fake: FakeTonApi, index: PaymentIndex, provider_cls=ToncenterProvider) -> PaymentWatcher:
+    return PaymentWatcher(provider_cls("http://fake", transport=fake.transport()), ADDR, interval=0, index=index)
+
+
+@pytest.mark.parametrize("provider_cls", [ToncenterProvider, TonapiProvider])
+def test_watcher_settles_batch_with_one_cursor(db, provider_cls):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        keys = await _make_orders(300, index)
+        fake.add_tx(1_500_000_000, keys[0])  # до первого запуска — не должен учитываться
+        watcher = _watcher(fake, index, provider_cls)
+        assert await watcher.tick() == 0
+
+        fake.add_tx(1_500_000_000, keys[1])
+        fake.add_tx(1_000_000_000, keys[2])
+        fake.add_tx(700_000_000, "unknown")
+        calls_before = fake.calls
+        assert await watcher.tick() == 2
+        # Один запрос к провайдеру на тик, сколько бы заказов ни было открыто.
+        assert fake.calls - calls_before == 1
+
+        fake.add_tx(500_000_000, keys[2])
+        assert await watcher.tick() == 1
+
+        statuses = await _orders_by_status()
+        assert statuses[keys[0]] == OrderStatus.WAITING_PAYMENT
+        assert statuses[keys[1]] == OrderStatus.PAID
+        assert statuses[keys[2]] == OrderStatus.PAID
+        assert len(index) == 298
+
+        async with session_scope() as s:
+            pays = (await s.scalars(select(Payment).order_by(Payment.id))).all()
+            assert [p.status for p in pays] == [
+                PaymentStatus.CONFIRMED, PaymentStatus.PARTIAL, PaymentStatus.CONFIRMED,
+            ]
+            cursor = await s.get(SyncCursor, f"wallet:{ADDR}")
+            assert cursor.lt == fake.txs[-1]["lt"]
+
+    asyncio.run(scenario())
+
+
+async def _payment_statuses() -> list[str]:
+    async with session_scope() as s:
+        return list((await s.scalars(select(Payment.status).order_by(Payment.id))).all())
+
+
+def test_second_transfer_in_same_batch_is_recorded_as_excess(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        keys = await _make_orders(1, index)
+        watcher = _watcher(fake, index)
+        await watcher.tick()
+        fake.add_tx(1_500_000_000, keys[0])
+        fake.add_tx(1_500_000_000, keys[0])  # покупатель отправил дважды
+
+        assert await watcher.tick() == 2
+        assert await _payment_statuses() == [PaymentStatus.CONFIRMED, PaymentStatus.EXCESS]
+        assert (await _orders_by_status())[keys[0]] == OrderStatus.PAID
+
+    asyncio.run(scenario())
+
+
+def test_transfer_to_already_paid_order_is_recorded_as_excess(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        keys = await _make_orders(1, index)
+        watcher = _watcher(fake, index)
+        await watcher.tick()
+        fake.add_tx(1_500_000_000, keys[0])
+        await watcher.tick()
+        fake.add_tx(1_500_000_000, keys[0])  # в следующем тике: заказа в индексе уже нет
+
+        assert await watcher.tick() == 1
+        assert await _payment_statuses() == [PaymentStatus.CONFIRMED, PaymentStatus.EXCESS]
+
+    asyncio.run(scenario())
+
+
+def test_expired_order_accepts_transfer_until_payment_timeout(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        in_time, late = await _make_orders(2, index)
+        watcher = _watcher(fake, index)
+        await watcher.tick()
+        tx_in_time = fake.add_tx(1_500_000_000, in_time)
+        fake.add_tx(1_500_000_000, late)
+        # Оба заказа истекли (как это делает expiry): из индекса убраны, статус EXPIRED.
+        paid_at = datetime.fromtimestamp(FakeTonApi.utime(tx_in_time), timezone.utc).replace(tzinfo=None)
+        async with session_scope() as s:
+            await s.execute(update(Order).values(status=OrderStatus.EXPIRED))
+            await s.execute(update(Order).where(Order.order_key == in_time)
+                            .values(created_at=paid_at - timedelta(seconds=600)))
+            await s.execute(update(Order).where(Order.order_key == late)
+                            .values(created_at=paid_at - timedelta(seconds=5000)))
+        index.clear()
+
+        assert await watcher.tick() == 2
+        statuses = await _orders_by_status()
+        assert statuses[in_time] == OrderStatus.PAID
+        assert statuses[late] == OrderStatus.EXPIRED
+        assert await _payment_statuses() == [PaymentStatus.CONFIRMED, PaymentStatus.TIMEOUT]
+
+    asyncio.run(scenario())
+
+
+def test_refundable_payments_do_not_count_towards_order_total(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        waiting, expired = await _make_orders(2, index)
+        watcher = _watcher(fake, index)
+        await watcher.tick()
+        # Уже записанные деньги к возврату (1 TON из 1.5) в счёт оплаты не идут.
+        async with session_scope() as s:
+            ids = dict((await s.execute(select(Order.order_key, Order.id))).all())
+            for key, status in ((waiting, PaymentStatus.EXCESS), (expired, PaymentStatus.TIMEOUT)):
+                s.add(Payment(order_id=ids[key], status=status, amount_ton=Decimal("1"),
+                              comment=key, tx_hash=f"refund-{key}"))
+            await s.execute(update(Order).where(Order.order_key == expired).values(status=OrderStatus.EXPIRED))
+        async with session_scope() as s:
+            await index.rebuild(s)
+        assert index.get(waiting).paid_nano == 0
+
+        fake.add_tx(1_000_000_000, waiting)
+        fake.add_tx(1_000_000_000, expired)  # через plan_closed: заказ истёк, но в срок
+        assert await watcher.tick() == 2
+        statuses = await _orders_by_status()
+        assert statuses[waiting] == OrderStatus.WAITING_PAYMENT
+        assert statuses[expired] == OrderStatus.EXPIRED
+        assert (await _payment_statuses())[-2:] == [PaymentStatus.PARTIAL, PaymentStatus.PARTIAL]
+
+    asyncio.run(scenario())
+
+
+def test_unknown_transfers_are_kept_as_unmatched(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        await _make_orders(1, index)
+        watcher = _watcher(fake, index)
+        await watcher.tick()
+        fake.add_tx(700_000_000, "unknown")
+        fake.add_tx(800_000_000, new_order_key())  # похоже на ключ, но такого заказа нет
+        fake.add_tx(900_000_000)                    # без комментария и без подходящей суммы
+
+        assert await watcher.tick() == 0
+        assert await watcher.tick() == 0  # повторно не пишется
+        async with session_scope() as s:
+            rows = (await s.scalars(select(UnmatchedPayment).order_by(UnmatchedPayment.id))).all()
+        assert [r.amount_ton for r in rows] == [Decimal("0.7"), Decimal("0.8"), Decimal("0.9")]
+        assert rows[0].comment == "unknown" and rows[0].sender == "EQSender"
+        assert await _payment_statuses() == []
+
+    asyncio.run(scenario())
+
+
+def test_buyer_is_notified_once_when_order_becomes_paid(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    class Sink:
+        def __init__(self) -> None:
+            self.sent: list[tuple[int, str]] = []
+
+        def submit(self, chat_id: int, text: str) -> bool:
+            self.sent.append((chat_id, text))
+            return True
+
+    async def scenario():
+        keys = await _make_orders(1, index)
+        sink = Sink()
+        watcher = PaymentWatcher(
+            ToncenterProvider("http://fake", transport=fake.transport()), ADDR,
+            interval=0, index=index, notifier=sink,
+        )
+        await watcher.tick()
+        fake.add_tx(500_000_000, keys[0])
+        await watcher.tick()
+        assert sink.sent == []  # частичная оплата — ещё не повод
+
+        fake.add_tx(1_000_000_000, keys[0])
+        fake.add_tx(1_000_000_000, keys[0])  # лишний перевод второго сообщения не вызывает
+        await watcher.tick()
+        assert len(sink.sent) == 1
+        chat_id, text = sink.sent[0]
+        assert chat_id == 1 and keys[0] in text and "100" in text
+
+    asyncio.run(scenario())
+
+
+def test_watcher_is_idempotent_when_cursor_lags(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        keys = await _make_orders(2, index)
+        watcher = _watcher(fake, index)
+        await watcher.tick()
+        fake.add_tx(100_000_000, keys[0])
+        await watcher.tick()
+
+        # Откатываем курсор, как после сбоя до сохранения — повторная обработка не дублирует платёж.
+        async with session_scope() as s:
+            (await s.get(SyncCursor, f"wallet:{ADDR}")).lt = 1_000
+        await watcher.tick()
+
+        async with session_scope() as s:
+            assert await s.scalar(select(func.count()).select_from(Payment)) == 1
+
+    asyncio.run(scenario())
+
+
+def test_cursor_moves_past_pages_without_incoming_transfers(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    async def scenario():
+        keys = await _make_orders(1, index)
+        watcher = PaymentWatcher(
+            ToncenterProvider("http://fake", transport=fake.transport()), ADDR,
+            interval=0, index=index, page_limit=10, max_pages=1,
+        )
+        await watcher.tick()
+        for _ in range(10):
+            fake.add_tx(0)  # пустые/исходящие — входящих переводов на странице нет
+        fake.add_tx(1_500_000_000, keys[0])
+
+        assert await watcher.tick() == 0  # целая страница без входящих...
+        async with session_scope() as s:
+            assert (await s.get(SyncCursor, f"wallet:{ADDR}")).lt == fake.txs[9]["lt"]
+        assert await watcher.tick() == 1  # ...но курсор сдвинулся, и платёж за ней найден
+        assert (await _orders_by_status())[keys[0]] == OrderStatus.PAID
+
+    asyncio.run(scenario())
+
+
+def test_tick_does_not_hold_writer_during_fetch(db):
+    fake = FakeTonApi(ADDR)
+    index = PaymentIndex()
+
+    class SlowProvider(ToncenterProvider):
+        async def fetch_page(self, address, after_lt, limit=100):
+            await self.gate.wait()
+            return await super().fetch_page(address, after_lt, limit)
+
+    async def scenario():
+        await _make_orders(1, index)
+        provider = SlowProvider("http://fake", transport=fake.transport())
+        provider.gate = asyncio.Event()
+        watcher = PaymentWatcher(provider, ADDR, interval=0, index=index)
+        tick = asyncio.create_task(watcher.tick())
+        await asyncio.sleep(0.05)  # тик ждёт «сеть»
+
+        # Запись другого компонента проходит, пока провайдер не ответил.
+        async with asyncio.timeout(1):
+            async with session_scope() as s:
+                s.add(User(tg_user_id=2))
+        provider.gate.set()
+        await tick
+
+    asyncio.run(scenario())
@@ -0,0 +1,89 @@
+import asyncio
+import random
+
+from aiogram import Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.webhook import SECRET_HEADER, UpdateProcessor, build_app, update_chat_key
+
+from fakes import FakeBotApi
+
+SECRET = "s3cret"
+
+
+def _update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1_700_000_000,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "U"},
+            "text": text,
+        },
+    }
+
+
+def test_chat_key_for_callback_and_message():
+    assert update_chat_key(_update(1, 42, "hi")) == 42
+    cb = {"update_id": 2, "callback_query": {"id": "1", "from": {"id": 7}, "message": {"chat": {"id": 99}}}}
+    assert update_chat_key(cb) == 99
+
+
+def test_webhook_acks_fast_keeps_per_chat_order_and_sheds_load():
+    api = FakeBotApi()
+    router = Router()
+    active = {"now": 0, "max": 0}
+
+    @router.message()
+    async def echo(msg: Message):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(random.random() / 200)
+        active["now"] -= 1
+        await msg.answer(msg.text)
+
+    async def scenario():
+        await api.start()
+        bot = api.bot()
+        dp = Dispatcher()
+        dp.include_router(router)
+        processor = UpdateProcessor(dp, bot, workers=8, queue_size=800)
+        client = TestClient(TestServer(build_app(processor, path="/hook", secret=SECRET)))
+        await client.start_server()
+
+        rsp = await client.post("/hook", json=_update(0, 1, "x"), headers={SECRET_HEADER: "wrong"})
+        assert rsp.status == 401
+
+        processor.start()
+        chats, per_chat = 20, 10
+        updates = [_update(i * chats + c, 1000 + c, str(i)) for i in range(per_chat) for c in range(chats)]
+        for upd in updates:
+            rsp = await client.post("/hook", json=upd, headers={SECRET_HEADER: SECRET})
+            assert rsp.status == 200
+        await processor.stop()
+
+        sent = api.sent()
+        assert len(sent) == chats * per_chat
+        for c in range(chats):
+            texts = [p["text"] for p in sent if int(p["chat_id"]) == 1000 + c]
+            assert texts == [str(i) for i in range(per_chat)]
+        assert active["max"] > 1  # разные чаты шли параллельно
+
+        # Воркеры не запущены, очередь мала — лишнее отклоняется 503.
+        tiny = UpdateProcessor(dp, bot, workers=1, queue_size=2)
+        client2 = TestClient(TestServer(build_app(tiny, path="/hook", secret=SECRET)))
+        await client2.start_server()
+        codes = [
+            (await client2.post("/hook", json=_update(i, 5, "x"), headers={SECRET_HEADER: SECRET})).status
+            for i in range(3)
+        ]
+        assert codes == [200, 200, 503]
+
+        await client.close()
+        await client2.close()
+        await bot.session.close()
+        await api.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from bot.models import Order, User
+from bot.services.matching import payment_index
+from bot.services.money import price_to_pico, quote
+from bot.services.orders import create_order
+from bot.services.users import identity_cache
+from bot.services.write_behind import WriteBehind, get_write_behind
+from bot.storage import read_session, session_scope
+
+
+def test_concurrent_orders_share_commits(db):
+    identity_cache.clear()
+
+    q = quote(50, price_to_pico(Decimal("0.0065")), 500)
+
+    async def scenario():
+        async with read_session() as s:
+            await payment_index.rebuild(s)
+        commits_before = get_write_behind().commits
+        orders = await asyncio.gather(*(
+            create_order(100 + i % 10, None, q)
+            for i in range(200)
+        ))
+        assert len({o.order_key for o in orders}) == 200
+        assert all(o.order_key in payment_index for o in orders)
+        # 200 заказов уложились в несколько групповых коммитов, а не в 200.
+        assert get_write_behind().commits - commits_before <= 5
+        assert identity_cache.get(105) is not None
+
+        async with session_scope() as s:
+            assert await s.scalar(select(func.count()).select_from(User)) == 10
+            assert await s.scalar(select(func.count()).select_from(Order)) == 200
+        await get_write_behind().close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_op_does_not_poison_batch(db):
+    wb = WriteBehind(max_batch=10, max_delay=0.01)
+
+    async def good(session):
+        session.add(User(tg_user_id=1))
+        return "ok"
+
+    async def bad(session):
+        raise ValueError("boom")
+
+    async def scenario():
+        f1, f2 = wb.submit(good), wb.submit(bad)
+        assert await f1 == "ok"
+        with pytest.raises(ValueError):
+            await f2
+        async with session_scope() as s:
+            assert await s.scalar(select(func.count()).select_from(User)) == 1
+
+    asyncio.run(scenario())
+
+
+def test_order_is_not_indexed_where_index_is_not_loaded(db):
+    q = quote(50, price_to_pico(Decimal("0.0065")), 500)
+    payment_index.unload()
+
+    async def scenario():
+        order = await create_order(7, None, q)
+        assert order.order_key not in payment_index
+        assert len(payment_index) == 0
+        await get_write_behind().close()
+
+    asyncio.run(scenario())